@@ -67,9 +67,43 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Транзакция сразу берет блокировку записи: параллельные изменения корзины
+            # ждут своей очереди (timeout) вместо ошибки "database is locked" при повышении блокировки
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Тестовая база в файле: общая in-memory база SQLite не поддерживает ожидание блокировок
+        # между потоками, а тесты корзины проверяют параллельные запросы.
+        # Файл удаляется по окончании прогона (кроме --keepdb) и указан в .gitignore
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Cache
+# CACHE_BACKEND=locmem - кэш в памяти процесса (один процесс),
+# file или db - общий кэш для нескольких процессов (для db нужна команда createcachetable)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, '.cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'django_cache'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+# Время жизни кэшированных ответов каталога для анонимных пользователей, секунды
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -123,12 +157,48 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
 # Session settings
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# SESSION_BACKEND=db - сессии в таблице django_session (каждое изменение корзины гостя - запись в базу),
+# cached_db - чтение из кэша, запись в базу; cache - только в кэше (нужен общий для процессов CACHE_BACKEND);
+# signed_cookies - в подписанной cookie, без хранения на сервере
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'db')
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SECURE = False # Установите в True, если используете HTTPS
 SESSION_COOKIE_SAMESITE = 'Lax'
 
+# Время, на которое подтвержденный заказ резервирует остатки до оплаты, секунды
+# (просроченные резервы снимает команда release_expired_reservations)
+STOCK_RESERVATION_TIMEOUT = int(os.environ.get('STOCK_RESERVATION_TIMEOUT', 15 * 60))
+
+# Очередь оплаты: обработчик платежей (путь к функции), число попыток до перевода задачи
+# в dead-letter, базовая задержка повтора (удваивается с каждой попыткой) и время аренды задачи
+# воркером, секунды (задачу упавшего воркера после истечения аренды заберет другой)
+PAYMENT_PROCESSOR = os.environ.get('PAYMENT_PROCESSOR', 'orders.payments.stub_processor')
+PAYMENT_MAX_ATTEMPTS = int(os.environ.get('PAYMENT_MAX_ATTEMPTS', 5))
+PAYMENT_RETRY_DELAY = int(os.environ.get('PAYMENT_RETRY_DELAY', 5))
+PAYMENT_JOB_LEASE = int(os.environ.get('PAYMENT_JOB_LEASE', 60))
+# Без запущенного run_payment_worker платежи остаются в статусе pending. PAYMENT_INLINE=1
+# обрабатывает платеж сразу в запросе оплаты - для локального runserver без воркера
+PAYMENT_INLINE = os.environ.get('PAYMENT_INLINE', '').lower() in ('1', 'true', 'yes')
+
+# Канал статуса оплаты (SSE и long-poll): сколько держать соединение открытым
+# и как часто проверять статус в базе, секунды, а также сколько соединений процесса
+# могут ждать одновременно (остальные сразу получают текущий статус)
+PAYMENT_STATUS_TIMEOUT = int(os.environ.get('PAYMENT_STATUS_TIMEOUT', 25))
+PAYMENT_STATUS_INTERVAL = float(os.environ.get('PAYMENT_STATUS_INTERVAL', 0.5))
+PAYMENT_STATUS_MAX_WATCHERS = int(os.environ.get('PAYMENT_STATUS_MAX_WATCHERS', 500))
+
+# Ограничения корзины гостя в сессии: число строк и размер закодированной строки в байтах
+GUEST_BASKET_MAX_LINES = int(os.environ.get('GUEST_BASKET_MAX_LINES', 50))
+GUEST_BASKET_MAX_BYTES = int(os.environ.get('GUEST_BASKET_MAX_BYTES', 1024))
+
 # CSRF settings
 CSRF_COOKIE_HTTPONLY = False
 CSRF_COOKIE_SECURE = False  # Установите в True, если используете HTTPS
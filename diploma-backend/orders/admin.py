@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderProduct, Cart, Payment
+from .models import Order, OrderProduct, Cart, Payment, PaymentJob, StockReservation
 
 
 class OrderProductInline(admin.TabularInline):
@@ -41,3 +41,21 @@ class PaymentAdmin(admin.ModelAdmin):
     list_display = ('id', 'order', 'number', 'status', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('order__id', 'number')
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    """Stock reservation admin configuration."""
+
+    list_display = ('id', 'order', 'product', 'count', 'status', 'created_at', 'expires_at')
+    list_filter = ('status',)
+    search_fields = ('product__title',)
+
+
+@admin.register(PaymentJob)
+class PaymentJobAdmin(admin.ModelAdmin):
+    """Payment job admin configuration."""
+
+    list_display = ('id', 'payment', 'status', 'attempts', 'run_at', 'locked_by', 'last_error')
+    list_filter = ('status',)
+    search_fields = ('payment__order__id',)
@@ -0,0 +1,121 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from products.models import Product
+
+from .models import Order, OrderProduct
+
+
+def get_basket(user, create=False):
+    """
+    Корзина пользователя (заказ со статусом accepted) или None.
+    Уникальное ограничение на (user) для корзин делает get_or_create безопасным при гонке:
+    проигравший запрос получает IntegrityError и читает созданную строку.
+    """
+    if create:
+        basket, _ = Order.objects.get_or_create(user=user, status='accepted')
+        return basket
+    return Order.objects.filter(user=user, status='accepted').first()
+
+
+def add_to_basket(user, product, count):
+    """
+    Добавить count единиц товара в корзину одной транзакцией.
+    Количество увеличивается выражением F('count') + count на стороне базы,
+    поэтому параллельные добавления не теряют друг друга.
+    """
+    with transaction.atomic():
+        basket = get_basket(user, create=True)
+        updated = OrderProduct.objects.filter(order=basket, product=product).update(count=F('count') + count)
+        if updated:
+            return basket
+
+        try:
+            # Точка сохранения: при гонке откатывается только неудачная вставка
+            with transaction.atomic():
+                OrderProduct.objects.create(order=basket, product=product, count=count, price=product.price)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос (ограничение order + product)
+            OrderProduct.objects.filter(order=basket, product=product).update(count=F('count') + count)
+    return basket
+
+
+def remove_from_basket(user, product_id, count):
+    """
+    Убрать count единиц товара из корзины; строка удаляется, если товара не останется.
+    Оба запроса условные, поэтому уменьшение не уходит в минус при параллельных запросах.
+    """
+    with transaction.atomic():
+        items = OrderProduct.objects.filter(order__user=user, order__status='accepted', product_id=product_id)
+        if not items.filter(count__gt=count).update(count=F('count') - count):
+            items.filter(count__lte=count).delete()
+
+
+def merge_into_basket(user, items):
+    """
+    Перенести строки корзины гостя [{'id', 'count'}, ...] в корзину пользователя одной транзакцией.
+    Количества складываются; товары загружаются одним запросом, удаленные пропускаются.
+    """
+    products = Product.objects.filter(id__in=[item['id'] for item in items]).only('id', 'price').in_bulk()
+    with transaction.atomic():
+        for item in items:
+            product = products.get(item['id'])
+            if product is not None and item['count'] > 0:
+                add_to_basket(user, product, item['count'])
+
+
+def basket_lines(user):
+    """
+    Строки корзины пользователя с товарами.
+    Один запрос строк вместе с товарами и по одному пакетному запросу изображений и тегов.
+    """
+    return list(
+        OrderProduct.objects.filter(order__user=user, order__status='accepted')
+        .select_related('product').prefetch_related('product__images', 'product__tags')
+        .order_by('id')
+    )
+
+
+def hydrate_session_basket(items):
+    """
+    Товары сессионной корзины [{'id', 'count'}, ...]: один запрос id__in
+    и по одному пакетному запросу изображений и тегов.
+    Возвращает пары (товар, количество) в порядке корзины и строки корзины без удаленных товаров.
+    """
+    ids = set()
+    for item in items:
+        try:
+            ids.add(int(item['id']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    products = Product.objects.filter(id__in=ids).prefetch_related('images', 'tags').in_bulk() if ids else {}
+
+    lines, kept = [], []
+    for item in items:
+        try:
+            product = products.get(int(item['id']))
+        except (KeyError, TypeError, ValueError):
+            product = None
+        if product is not None:
+            lines.append((product, item['count']))
+            kept.append(item)
+    return lines, kept
+
+
+def basket_line(user, product_id):
+    """Строка корзины товара {'count', 'price'} или None, если товара в корзине нет"""
+    return OrderProduct.objects.filter(
+        order__user=user, order__status='accepted', product_id=product_id
+    ).values('count', 'price').first()
+
+
+def basket_totals(user):
+    """Итоги корзины одним агрегирующим запросом: строки, единицы товара и сумма"""
+    totals = OrderProduct.objects.filter(order__user=user, order__status='accepted').aggregate(
+        lines=Count('id'), units=Sum('count'), amount=Sum(F('price') * F('count'))
+    )
+    return summarize(totals['lines'], totals['units'] or 0, totals['amount'] or 0)
+
+
+def summarize(lines, count, total):
+    return {'lines': lines, 'count': count, 'total': float(total)}
@@ -0,0 +1,62 @@
+from django.conf import settings
+
+
+# Корзина гостя хранится в сессии компактной строкой "id:count,id:count".
+# Хранилище сессии выбирается настройкой SESSION_BACKEND: при cache и signed_cookies
+# изменения корзины гостя не пишут в базу
+GUEST_BASKET_KEY = 'basket'
+GUEST_BASKET_MAX_LINES = getattr(settings, 'GUEST_BASKET_MAX_LINES', 50)
+# Ограничение размера закодированной корзины: подписанная cookie сессии не должна превысить 4 КБ
+GUEST_BASKET_MAX_BYTES = getattr(settings, 'GUEST_BASKET_MAX_BYTES', 1024)
+
+
+class GuestBasketFull(ValueError):
+    """Корзина гостя превышает допустимый размер"""
+
+
+def encode(items):
+    return ','.join(f'{item["id"]}:{item["count"]}' for item in items)
+
+
+def decode(value):
+    """Строки корзины [{'id', 'count'}, ...]; поврежденные пары пропускаются"""
+    if not value:
+        return []
+    if isinstance(value, list):
+        # Прежний формат: список словарей
+        pairs = [(item.get('id'), item.get('count')) for item in value if isinstance(item, dict)]
+    else:
+        pairs = [part.partition(':')[::2] for part in str(value).split(',')]
+
+    items = []
+    for product_id, count in pairs:
+        try:
+            items.append({'id': int(product_id), 'count': int(count)})
+        except (TypeError, ValueError):
+            continue
+    return items
+
+
+def load(session):
+    return decode(session.get(GUEST_BASKET_KEY))
+
+
+def save(session, items):
+    """
+    Сохранить корзину гостя. Сессия помечается измененной, только если содержимое изменилось,
+    поэтому чтение корзины не приводит к записи сессии.
+    """
+    if not items:
+        clear(session)
+        return
+
+    encoded = encode(items)
+    if len(items) > GUEST_BASKET_MAX_LINES or len(encoded) > GUEST_BASKET_MAX_BYTES:
+        raise GuestBasketFull(len(items))
+    if session.get(GUEST_BASKET_KEY) != encoded:
+        session[GUEST_BASKET_KEY] = encoded
+
+
+def clear(session):
+    if GUEST_BASKET_KEY in session:
+        del session[GUEST_BASKET_KEY]
@@ -0,0 +1,103 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from orders.models import Order, OrderProduct
+from orders.stock import OutOfStock, reserve_order
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочная проверка резервирования: много покупателей одновременно подтверждают '
+            'заказы на товар с ограниченным остатком (limited). Замер идет во временной тестовой базе, '
+            'рабочие данные не затрагиваются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200, help='Количество покупателей (заказов)')
+        parser.add_argument('--stock', type=int, default=50, help='Остаток товара')
+        parser.add_argument('--threads', type=int, default=8, help='Количество параллельных потоков')
+        parser.add_argument('--per-order', type=int, default=1, help='Количество товара в заказе')
+
+    def handle(self, *args, **options):
+        # Потокам нужны закоммиченные данные, поэтому откат транзакции здесь не подходит:
+        # замер идет в отдельной базе, которую создает и удаляет механизм тестовых баз Django
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            product, orders = self.create_data(options)
+            results = self.run(orders, options['threads'])
+            self.report(product, options, results)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def create_data(self, options):
+        User = get_user_model()
+        category = Category.objects.create(title='Benchmark')
+        product = Product.objects.create(
+            category=category, title='Benchmark limited', price=1, count=options['stock'], limited=True
+        )
+        users = User.objects.bulk_create([
+            User(username=f'benchmark-stock-{i}') for i in range(options['buyers'])
+        ])
+        orders = Order.objects.bulk_create([Order(user=user, status='created') for user in users])
+        OrderProduct.objects.bulk_create([
+            OrderProduct(order=order, product=product, count=options['per_order'], price=1) for order in orders
+        ])
+        return product, orders
+
+    def run(self, orders, threads):
+        queue = list(orders)
+        lock = threading.Lock()
+        results = {'reserved': 0, 'out_of_stock': 0, 'errors': 0, 'timings': []}
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        order = queue.pop()
+                    start = time.perf_counter()
+                    try:
+                        reserve_order(order)
+                        outcome = 'reserved'
+                    except OutOfStock:
+                        outcome = 'out_of_stock'
+                    except OperationalError:
+                        outcome = 'errors'
+                    elapsed = (time.perf_counter() - start) * 1000
+                    with lock:
+                        results[outcome] += 1
+                        results['timings'].append(elapsed)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        results['elapsed'] = time.perf_counter() - started
+        return results
+
+    def report(self, product, options, results):
+        product.refresh_from_db()
+        timings = sorted(results['timings'])
+        expected = min(options['buyers'], options['stock'] // options['per_order'])
+        self.stdout.write(
+            f'покупателей: {options["buyers"]}, остаток: {options["stock"]}, потоков: {options["threads"]}\n'
+            f'зарезервировано: {results["reserved"]}, отказов по остатку: {results["out_of_stock"]}, '
+            f'ошибок блокировки: {results["errors"]}\n'
+            f'остаток после: {product.count}\n'
+            f'время: {results["elapsed"]:.2f} с, {len(timings) / results["elapsed"]:.0f} резервов/с, '
+            f'медиана {statistics.median(timings):.1f} мс, p95 {timings[int(len(timings) * 0.95) - 1]:.1f} мс'
+        )
+        if product.count < 0 or results['reserved'] != expected:
+            self.stderr.write(self.style.ERROR('Продано больше или меньше, чем было на складе'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Перепродажи нет'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Снять просроченные резервы неоплаченных заказов и вернуть остатки товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, default=0, metavar='SECONDS',
+                            help='Повторять с указанным интервалом (запуск вместо cron)')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired()
+            self.stdout.write(f'Снято резервов: {released}')
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
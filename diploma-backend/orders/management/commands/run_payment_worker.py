@@ -0,0 +1,36 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from orders.payments import get_processor, run_payment_jobs
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывать очередь оплаты: обращение к банку, повторы с задержкой и dead-letter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать готовые задачи и завершиться')
+        parser.add_argument('--interval', type=float, default=1.0, metavar='SECONDS',
+                            help='Пауза между проверками пустой очереди')
+        parser.add_argument('--processor', default=None, metavar='PATH',
+                            help='Обработчик платежей вместо настройки PAYMENT_PROCESSOR, '
+                                 'например orders.payments.stub_processor')
+        parser.add_argument('--worker-id', default=None,
+                            help='Имя воркера в блокировках задач (по умолчанию хост:pid)')
+
+    def handle(self, *args, **options):
+        processor = import_string(options['processor']) if options['processor'] else get_processor()
+        worker_id = options['worker_id'] or f'{socket.gethostname()}:{os.getpid()}'
+
+        while True:
+            processed = run_payment_jobs(worker_id, processor)
+            if processed:
+                self.stdout.write(f'Обработано задач оплаты: {processed}')
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-17 22:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """Объединить повторяющиеся корзины пользователя и строки товара в заказе перед созданием ограничений"""
+    Order = apps.get_model('orders', 'Order')
+    OrderProduct = apps.get_model('orders', 'OrderProduct')
+
+    duplicated_users = (
+        Order.objects.filter(status='accepted', user__isnull=False)
+        .values('user').annotate(total=Count('id')).filter(total__gt=1).values_list('user', flat=True)
+    )
+    for user_id in list(duplicated_users):
+        basket_ids = list(Order.objects.filter(user_id=user_id, status='accepted').order_by('id').values_list('id', flat=True))
+        OrderProduct.objects.filter(order_id__in=basket_ids[1:]).update(order_id=basket_ids[0])
+        Order.objects.filter(id__in=basket_ids[1:]).delete()
+
+    duplicated_rows = (
+        OrderProduct.objects.values('order', 'product')
+        .annotate(total=Count('id'), first=Min('id'), count_sum=Sum('count')).filter(total__gt=1)
+    )
+    for row in list(duplicated_rows):
+        OrderProduct.objects.filter(id=row['first']).update(count=row['count_sum'])
+        OrderProduct.objects.filter(order_id=row['order'], product_id=row['product']).exclude(id=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_cart_orders_cart_user_id_7d3dad_idx_and_more'),
+        ('products', '0009_product_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='orderproduct',
+            name='orders_orde_order_i_b7e52c_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'accepted')), fields=('user',), name='orders_order_unique_basket'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderproduct',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='orders_orderproduct_unique_product'),
+        ),
+    ]
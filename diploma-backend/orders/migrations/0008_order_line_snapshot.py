@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-18 00:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SHORT_DESCRIPTION_LENGTH = 100
+
+
+def fill_snapshots(apps, schema_editor):
+    """Заполнить снимки товаров в строках оформленных заказов пачками"""
+    OrderProduct = apps.get_model('orders', 'OrderProduct')
+    lines = (
+        OrderProduct.objects.exclude(order__status='accepted').filter(product__isnull=False, title='')
+        .select_related('product').prefetch_related('product__images').order_by('id')
+    )
+    batch = []
+    for line in lines.iterator(chunk_size=1000):
+        images = list(line.product.images.all())
+        description = line.product.description or ''
+        line.title = line.product.title
+        line.image = images[0].src.url if images and images[0].src else ''
+        line.short_description = description[:SHORT_DESCRIPTION_LENGTH] + '...' if description else ''
+        batch.append(line)
+        if len(batch) >= 1000:
+            OrderProduct.objects.bulk_update(batch, ['title', 'image', 'short_description'])
+            batch = []
+    if batch:
+        OrderProduct.objects.bulk_update(batch, ['title', 'image', 'short_description'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_stock_reservation'),
+        ('products', '0009_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='image',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='short_description',
+            field=models.CharField(blank=True, max_length=103),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='title',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='orderproduct',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.product'),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
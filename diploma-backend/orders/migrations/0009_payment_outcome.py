@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_line_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='error',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Ошибка оплаты'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 02:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_payment_outcome'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('processing', 'Обрабатывается'), ('done', 'Выполнена'), ('dead', 'Попытки исчерпаны')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=64)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('payment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='orders.payment')),
+            ],
+            options={
+                'verbose_name': 'Задача оплаты',
+                'verbose_name_plural': 'Задачи оплаты',
+                'indexes': [models.Index(fields=['status', 'run_at'], name='orders_paym_status_68eb18_idx'), models.Index(fields=['status', 'locked_until'], name='orders_paym_status_0f3beb_idx')],
+            },
+        ),
+    ]
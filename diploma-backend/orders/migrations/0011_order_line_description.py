@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+def fill_descriptions(apps, schema_editor):
+    """Дополнить снимки оформленных заказов полным описанием и датой товара пачками"""
+    OrderProduct = apps.get_model('orders', 'OrderProduct')
+    lines = (
+        OrderProduct.objects.exclude(order__status='accepted').filter(product__isnull=False)
+        .select_related('product').order_by('id')
+    )
+    batch = []
+    for line in lines.iterator(chunk_size=1000):
+        line.description = line.product.description or ''
+        line.product_created_at = line.product.created_at
+        batch.append(line)
+        if len(batch) >= 1000:
+            OrderProduct.objects.bulk_update(batch, ['description', 'product_created_at'])
+            batch = []
+    if batch:
+        OrderProduct.objects.bulk_update(batch, ['description', 'product_created_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_payment_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='description',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='product_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_descriptions, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Order(models.Model):
@@ -48,6 +49,22 @@ class Order(models.Model):
     city = models.CharField(max_length=100, blank=True)
     address = models.CharField(max_length=200, blank=True)
     comment = models.TextField(blank=True)
+    # Ключ идемпотентности оформления (заголовок Idempotency-Key): повтор запроса возвращает тот же заказ
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    # Допустимые переходы статусов: корзина -> создан -> подтвержден -> оплачен/отменен.
+    # Повторное подтверждение разрешено, пока заказ не оплачен (покупатель меняет данные доставки)
+    STATUS_TRANSITIONS = {
+        'accepted': {'created'},
+        'created': {'confirmed', 'cancelled'},
+        'confirmed': {'confirmed', 'paid', 'cancelled'},
+        'paid': {'delivered'},
+        'delivered': set(),
+        'cancelled': set(),
+    }
+
+    def can_transition(self, status):
+        return status in self.STATUS_TRANSITIONS.get(self.status, set())
 
     def __str__(self):
         return f"Order {self.id} by {self.fullName}"
@@ -60,22 +77,59 @@ class Order(models.Model):
             models.Index(fields=['-createdAt']),  # Для сортировки по дате создания (новые первыми)
             models.Index(fields=['status', 'createdAt']),  # Комбинированный индекс для фильтрации по статусу и сортировки по дате
         ]
+        constraints = [
+            # Корзина - заказ со статусом accepted, у пользователя она одна
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(status='accepted'), name='orders_order_unique_basket'
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'idempotency_key'], condition=models.Q(idempotency_key__isnull=False),
+                name='orders_order_unique_idempotency_key'
+            ),
+        ]
 
 
 class OrderProduct(models.Model):
+    SHORT_DESCRIPTION_LENGTH = 100
+
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='products')
-    product = models.ForeignKey('products.Product', on_delete=models.CASCADE)
+    # Удаление товара не удаляет строки оформленных заказов: они отображаются по снимку
+    product = models.ForeignKey('products.Product', on_delete=models.SET_NULL, null=True, blank=True)
     count = models.IntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    # Снимок товара на момент оформления заказа (у строк корзины пустой):
+    # заказ отображается без обращения к таблицам товаров и не меняется при их редактировании
+    title = models.CharField(max_length=200, blank=True)
+    image = models.CharField(max_length=255, blank=True)
+    short_description = models.CharField(max_length=SHORT_DESCRIPTION_LENGTH + 3, blank=True)
+    description = models.TextField(blank=True)
+    product_created_at = models.DateTimeField(null=True, blank=True)
+
+    def fill_snapshot(self, product=None):
+        """Заполнить снимок из товара; изображения лучше подгрузить заранее (prefetch_related)"""
+        product = product or self.product
+        images = list(product.images.all())
+        description = product.description or ''
+        self.title = product.title
+        self.image = images[0].src.url if images and images[0].src else ''
+        self.short_description = (
+            description[:self.SHORT_DESCRIPTION_LENGTH] + '...' if description else ''
+        )
+        self.description = description
+        self.product_created_at = product.created_at
+
     def __str__(self):
-        return f"{self.product.title} x{self.count}"
+        return f"{self.title or self.product_id} x{self.count}"
 
     class Meta:
         indexes = [
             models.Index(fields=['order']),
             models.Index(fields=['product']),
-            models.Index(fields=['order', 'product']),  # Комбинированный индекс для быстрого доступа к товарам в заказе
+        ]
+        constraints = [
+            # Товар входит в заказ одной строкой; уникальный индекс заменяет прежний (order, product)
+            models.UniqueConstraint(fields=['order', 'product'], name='orders_orderproduct_unique_product'),
         ]
 
 
@@ -87,6 +141,9 @@ class Payment(models.Model):
     year = models.CharField(max_length=4, verbose_name='Год', blank=True)
     code = models.CharField(max_length=4, verbose_name='CVV/CVC', blank=True)
     status = models.CharField(max_length=20, verbose_name='Статус платежа', default='pending')
+    error = models.CharField(max_length=100, verbose_name='Ошибка оплаты', blank=True)
+    # Ключ идемпотентности запроса оплаты (заголовок Idempotency-Key)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -120,3 +177,63 @@ class Cart(models.Model):
 
     def __str__(self):
         return f"Cart item: {self.product.title} x{self.count}"
+
+
+class StockReservation(models.Model):
+    """Резерв остатка товара под подтвержденный заказ"""
+    STATUS_CHOICES = [
+        ('active', 'Действует'),
+        ('consumed', 'Списан'),
+        ('released', 'Снят'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+        indexes = [
+            models.Index(fields=['order', 'status']),
+            models.Index(fields=['status', 'expires_at']),  # Для поиска просроченных резервов
+        ]
+
+    def __str__(self):
+        return f"Reservation {self.product_id} x{self.count} for order {self.order_id}"
+
+
+class PaymentJob(models.Model):
+    """Задача очереди оплаты: платеж обрабатывает воркер run_payment_worker вне запроса"""
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('processing', 'Обрабатывается'),
+        ('done', 'Выполнена'),
+        ('dead', 'Попытки исчерпаны'),
+    ]
+
+    payment = models.OneToOneField(Payment, on_delete=models.CASCADE, related_name='job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    # Время следующей попытки; повторы откладываются с растущей задержкой
+    run_at = models.DateTimeField(default=timezone.now)
+    # Воркер, взявший задачу, и срок аренды: после него задачу может забрать другой воркер
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Задача оплаты'
+        verbose_name_plural = 'Задачи оплаты'
+        indexes = [
+            models.Index(fields=['status', 'run_at']),  # Выбор готовых к запуску задач
+            models.Index(fields=['status', 'locked_until']),  # Поиск задач с истекшей арендой
+        ]
+
+    def __str__(self):
+        return f"Payment job {self.id} ({self.status})"
@@ -0,0 +1,262 @@
+import datetime
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Order, Payment, PaymentJob
+from .stock import OutOfStock, consume_order, release_order
+
+
+PAYMENT_MAX_ATTEMPTS = getattr(settings, 'PAYMENT_MAX_ATTEMPTS', 5)
+PAYMENT_RETRY_DELAY = getattr(settings, 'PAYMENT_RETRY_DELAY', 5)
+PAYMENT_JOB_LEASE = getattr(settings, 'PAYMENT_JOB_LEASE', 60)
+# Обрабатывать платеж сразу в запросе оплаты, без воркера (локальный runserver)
+PAYMENT_INLINE = getattr(settings, 'PAYMENT_INLINE', False)
+# Сколько готовых задач просматривать при захвате, если соседние уже забрали другие воркеры
+CLAIM_BATCH = 10
+
+BANK_ERRORS = [
+    "Card number validation failed",
+    "Payment declined by bank",
+    "Insufficient funds",
+    "Card expired",
+]
+OUT_OF_STOCK_ERROR = "Insufficient stock"
+ORDER_STATUS_ERROR = "Invalid order status"
+PROCESSING_ERROR = "Payment processing failed"
+
+
+class InvalidTransition(Exception):
+    """Заказ в текущем статусе нельзя оплатить"""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class IdempotencyConflict(Exception):
+    """Заказ уже оплачивался запросом с другим ключом идемпотентности"""
+
+
+def parse_number(number):
+    """Номер карты или счета без пробелов; ValueError, если это не число"""
+    number = str(number or '').replace(' ', '')
+    if number:
+        int(number)
+    return number
+
+
+def check_payment(number):
+    """
+    Имитация банка: номер должен быть четным и не заканчиваться на 0.
+    Возвращает текст ошибки или None при успехе.
+    """
+    if number:
+        number_int = int(number)
+        if number_int % 2 != 0 or number_int % 10 == 0:
+            return random.choice(BANK_ERRORS)
+    return None
+
+
+def stub_processor(payment):
+    """Обработчик для локальной разработки и тестов: имитация банка без сетевых вызовов"""
+    return check_payment(payment.number)
+
+
+def get_processor():
+    return import_string(getattr(settings, 'PAYMENT_PROCESSOR', 'orders.payments.stub_processor'))
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: удваивается с каждой неудачной попыткой"""
+    return datetime.timedelta(seconds=PAYMENT_RETRY_DELAY * 2 ** max(attempts - 1, 0))
+
+
+def enqueue_payment(order_id, data, idempotency_key=None):
+    """
+    Принять оплату заказа в очередь. Возвращает (платеж, повтор).
+
+    Заказ блокируется select_for_update, поэтому параллельные запросы оплаты выполняются
+    по очереди; у заказа один платеж, и повторный запрос получает сохраненный платеж
+    первого (повтор=True): ожидающий обработки или уже с результатом.
+    Платеж и задача создаются одной транзакцией, обращение к банку выполняет воркер.
+    """
+    number = parse_number(data.get('number', ''))
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(id=order_id)
+        payment = Payment.objects.filter(order=order).first()
+        if payment is not None:
+            if idempotency_key and payment.idempotency_key and payment.idempotency_key != idempotency_key:
+                raise IdempotencyConflict(idempotency_key)
+            return payment, True
+
+        if not order.can_transition('paid'):
+            raise InvalidTransition(order.status)
+
+        payment = Payment.objects.create(
+            order=order,
+            number=number,
+            name=data.get('name', ''),
+            month=data.get('month', ''),
+            year=data.get('year', ''),
+            code=data.get('code', ''),
+            idempotency_key=idempotency_key,
+        )
+        PaymentJob.objects.create(payment=payment)
+    return payment, False
+
+
+def _ready(now):
+    """Задачи, которые можно взять: в очереди и подошло время, либо аренда упавшего воркера истекла"""
+    return Q(status='queued', run_at__lte=now) | Q(status='processing', locked_until__lt=now)
+
+
+def claim_job(worker_id, now=None):
+    """
+    Взять одну готовую задачу. Захват - условный UPDATE по тому же условию готовности,
+    поэтому из параллельных воркеров задачу получает только один; остальные берут следующую.
+    Возвращает задачу с платежом или None, если очередь пуста.
+    """
+    now = now or timezone.now()
+    candidates = PaymentJob.objects.filter(_ready(now)).order_by('run_at', 'id').values_list('id', flat=True)
+    for pk in candidates[:CLAIM_BATCH]:
+        job = _claim(PaymentJob.objects.filter(pk=pk), worker_id, now)
+        if job is not None:
+            return job
+    return None
+
+
+def _claim(jobs, worker_id, now):
+    """Условный захват одной задачи из jobs; задача с платежом или None, если ее забрал другой"""
+    lease = datetime.timedelta(seconds=PAYMENT_JOB_LEASE)
+    claimed = jobs.filter(_ready(now)).update(
+        status='processing', locked_by=worker_id, locked_until=now + lease,
+        attempts=F('attempts') + 1, updated_at=now
+    )
+    return jobs.select_related('payment').get() if claimed else None
+
+
+def complete_payment(job, error, job_status='done'):
+    """
+    Записать результат обработки одной транзакцией: статусы заказа и платежа,
+    списание или снятие резерва и завершение задачи.
+    Результат записывается один раз: если платеж уже не ожидает обработки
+    (его завершил другой воркер после истечения аренды), задача просто закрывается.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(id=job.payment.order_id)
+        payment = Payment.objects.get(pk=job.payment_id)
+        if payment.status == 'pending':
+            if error is None and not order.can_transition('paid'):
+                # Заказ отменили, пока платеж ждал в очереди
+                error = ORDER_STATUS_ERROR
+            if error is None:
+                try:
+                    # Успешная оплата: резерв списывается окончательно
+                    consume_order(order)
+                except OutOfStock:
+                    error = OUT_OF_STOCK_ERROR
+
+            if error is None:
+                order.status = 'paid'
+                payment.status = 'completed'
+            else:
+                if order.can_transition('cancelled'):
+                    order.status = 'cancelled'
+                release_order(order)
+                payment.status = 'failed'
+                payment.error = error
+            order.save(update_fields=['status'])
+            payment.save(update_fields=['status', 'error'])
+
+        PaymentJob.objects.filter(pk=job.pk).update(
+            status=job_status, locked_by='', locked_until=None, updated_at=timezone.now()
+        )
+    job.payment = payment
+    return payment
+
+
+def retry_job(job, reason, now=None):
+    """
+    Временный сбой обработчика: задача возвращается в очередь с растущей задержкой.
+    Когда попытки исчерпаны, задача переводится в dead-letter, а платеж - в failed.
+    """
+    now = now or timezone.now()
+    if job.attempts >= PAYMENT_MAX_ATTEMPTS:
+        PaymentJob.objects.filter(pk=job.pk).update(last_error=reason[:200])
+        return complete_payment(job, PROCESSING_ERROR, job_status='dead')
+
+    PaymentJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        status='queued', run_at=now + retry_delay(job.attempts), last_error=reason[:200],
+        locked_by='', locked_until=None, updated_at=now
+    )
+    return None
+
+
+def run_job(job, processor):
+    """Обработать взятую задачу: обращение к банку вне транзакции, затем запись результата"""
+    if job.attempts > PAYMENT_MAX_ATTEMPTS:
+        # Воркеры падали на этой задаче, пока не истекли попытки
+        return retry_job(job, 'Worker lease expired')
+    try:
+        error = processor(job.payment)
+    except Exception as exc:
+        return retry_job(job, f'{type(exc).__name__}: {exc}')
+    return complete_payment(job, error)
+
+
+def run_payment_now(payment, processor=None):
+    """
+    Обработать задачу платежа сразу, в запросе оплаты (PAYMENT_INLINE): так платежи проходят
+    без запущенного run_payment_worker. Захват тот же, поэтому задачу не обработают дважды;
+    временный сбой возвращает задачу в очередь. Возвращает платеж с актуальным статусом.
+    """
+    job = _claim(PaymentJob.objects.filter(payment=payment), 'inline', timezone.now())
+    if job is not None:
+        run_job(job, processor or get_processor())
+    payment.refresh_from_db()
+    return payment
+
+
+def run_payment_jobs(worker_id, processor=None, limit=None):
+    """Обработать готовые задачи очереди; возвращает число взятых задач"""
+    processor = processor or get_processor()
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job(worker_id)
+        if job is None:
+            break
+        run_job(job, processor)
+        processed += 1
+    return processed
+
+
+def is_settled(progress):
+    """Оплата завершена: статус больше не изменится без действий покупателя"""
+    return progress['payment'] in ('completed', 'failed') or progress['status'] in ('paid', 'delivered', 'cancelled')
+
+
+def payment_progress(order):
+    """
+    Состояние оплаты заказа для PaymentStatusView.
+    Платеж и задачу лучше подгрузить заранее: select_related('payment__job').
+    """
+    try:
+        payment = order.payment
+    except Payment.DoesNotExist:
+        payment = None
+    try:
+        job = payment.job if payment is not None else None
+    except PaymentJob.DoesNotExist:
+        job = None
+    return {
+        "status": order.status,
+        "payment": payment.status if payment is not None else None,
+        "attempts": job.attempts if job is not None else 0,
+        "error": (payment.error or None) if payment is not None else None,
+    }
@@ -10,49 +10,40 @@ User = get_user_model()
 class OrderProductSerializer(serializers.ModelSerializer):
     """Сериализатор для товаров в заказе"""
 
-    date = serializers.SerializerMethodField(read_only=True)
-    id = serializers.IntegerField(source='product.id', read_only=True)
-    category = serializers.IntegerField(source='product.category.id', read_only=True)
-    title = serializers.CharField(source='product.title', read_only=True)
-    description = serializers.CharField(source='product.description', read_only=True)
     price = serializers.DecimalField(max_digits=10, decimal_places=2)
     count = serializers.IntegerField()
-    freeDelivery = serializers.BooleanField(source='product.freeDelivery', read_only=True)
-    images = serializers.SerializerMethodField(read_only=True)
-    tags = serializers.SerializerMethodField(read_only=True)
-    reviews = serializers.SerializerMethodField(read_only=True)
-    rating = serializers.FloatField(source='product.rating', read_only=True)
-    limited = serializers.BooleanField(source='product.limited', read_only=True)
-    available = serializers.BooleanField(source='product.available', read_only=True)
-    salePrice = serializers.SerializerMethodField(read_only=True)
+
+    # Поля строки заказа: цена и количество из строки, остальное - из товара
+    LINE_FIELDS = [
+        'id', 'category', 'title', 'description', 'price', 'count', 'date',
+        'freeDelivery', 'images', 'tags', 'reviews', 'rating', 'limited',
+        'available', 'salePrice'
+    ]
 
     class Meta:
         model = OrderProduct
-        fields = [
-            'id', 'category', 'title', 'description', 'price', 'count', 'date',
-            'freeDelivery', 'images', 'tags', 'reviews', 'rating', 'limited',
-            'available', 'salePrice'
-        ]
-
-    def get_date(self, obj):
-        """Форматирование даты как в swagger"""
-        return obj.product.created_at.strftime("%a %b %d %Y %H:%M:%S GMT%z")
+        fields = ['price', 'count']
 
-    def get_images(self, obj):
-        serializer = ProductShortSerializer(obj.product, context=self.context)
-        return serializer.data.get('images', [])
-
-    def get_tags(self, obj):
-        serializer = ProductShortSerializer(obj.product, context=self.context)
-        return serializer.data.get('tags', [])
-
-    def get_reviews(self, obj):
-        serializer = ProductShortSerializer(obj.product, context=self.context)
-        return serializer.data.get('reviews', 0)
-
-    def get_salePrice(self, obj):
-        serializer = ProductShortSerializer(obj.product, context=self.context)
-        return serializer.data.get('salePrice', None)
+    def to_representation(self, instance):
+        # Товар сериализуется один раз на строку; изображения, теги и скидки
+        # должны быть подгружены заранее (prefetch_related, attach_active_sales)
+        line = super().to_representation(instance)
+        if instance.product is None:
+            product = self.snapshot_data(instance)
+        else:
+            product = ProductShortSerializer(instance.product, context=self.context).data
+        return {field: line[field] if field in line else product[field] for field in self.LINE_FIELDS}
+
+    def snapshot_data(self, instance):
+        """Товар удален: строка отображается по снимку, сделанному при оформлении"""
+        created_at = instance.product_created_at
+        return {
+            'id': None, 'category': None, 'title': instance.title, 'description': instance.description,
+            'date': created_at.strftime("%a %b %d %Y %H:%M:%S GMT%z") if created_at else None,
+            'freeDelivery': False,
+            'images': [{'src': instance.image, 'alt': instance.title}] if instance.image else [],
+            'tags': [], 'reviews': 0, 'rating': 0.0, 'limited': False, 'available': False, 'salePrice': None,
+        }
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -0,0 +1,41 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import guest_basket
+from .basket import merge_into_basket
+from products.models import Product
+
+from .models import Order, OrderProduct
+from .stock import release_order
+
+
+@receiver(user_logged_in)
+def merge_guest_basket(sender, request, user, **kwargs):
+    """Перенести корзину гостя из сессии в корзину пользователя при входе и регистрации"""
+    session = getattr(request, 'session', None)
+    if session is None:
+        return
+    items = guest_basket.load(session)
+    if items:
+        merge_into_basket(user, items)
+        guest_basket.clear(session)
+
+
+@receiver(pre_delete, sender=Order)
+def release_order_stock(sender, instance, **kwargs):
+    """Удаление заказа вместе с резервами не должно терять зарезервированный остаток"""
+    release_order(instance)
+
+
+@receiver(pre_save, sender=OrderProduct)
+def fill_order_line_snapshot(sender, instance, **kwargs):
+    """Строки заказов, созданные не через оформление корзины (админка), тоже получают снимок товара"""
+    if not instance.title and instance.product_id and instance.order.status != 'accepted':
+        instance.fill_snapshot()
+
+
+@receiver(pre_delete, sender=Product)
+def remove_deleted_product_from_baskets(sender, instance, **kwargs):
+    """Оформленные заказы сохраняют строку со снимком, а из корзин удаленный товар убирается"""
+    OrderProduct.objects.filter(product=instance, order__status='accepted').delete()
@@ -0,0 +1,139 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from products.cache import bump_namespace
+from products.models import Product
+from products.rankings import update_rankings
+
+from .models import OrderProduct, StockReservation
+
+
+# Время, на которое подтвержденный заказ удерживает остаток до оплаты, секунды
+RESERVATION_TIMEOUT = getattr(settings, 'STOCK_RESERVATION_TIMEOUT', 15 * 60)
+
+
+class OutOfStock(Exception):
+    """Остатка не хватает; product_ids - товары, которые не удалось зарезервировать"""
+
+    def __init__(self, product_ids):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+
+def _take(product_id, count, now):
+    """
+    Условное списание: UPDATE ... SET count = count - n WHERE count >= n.
+    Доступный товар, остаток которого закончился, в том же UPDATE становится недоступным
+    с отметкой sold_out. count изменяется последним: MySQL вычисляет SET слева направо.
+    """
+    sells_out = Q(count=count, available=True)
+    return Product.objects.filter(pk=product_id, count__gte=count).update(
+        sold_out=Case(When(sells_out, then=Value(True)), default=F('sold_out')),
+        available=Case(When(sells_out, then=Value(False)), default=F('available')),
+        updated_at=now,
+        count=F('count') - count,
+    )
+
+
+def _give_back(product_id, count, now):
+    """
+    Вернуть остаток. Доступным снова становится только товар, который скрыло списание (sold_out);
+    товар, отключенный вручную, остается недоступным.
+    """
+    Product.objects.filter(pk=product_id).update(
+        available=Case(When(sold_out=True, then=Value(True)), default=F('available')),
+        sold_out=False,
+        updated_at=now,
+        count=F('count') + count,
+    )
+
+
+def _stock_changed(product_ids):
+    """
+    update() не вызывает сигналы товара, поэтому после фиксации транзакции здесь
+    сбрасываются кэши каталога и обновляются списки лучших товаров (остаток и доступность).
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+
+    def refresh():
+        bump_namespace('products')
+        update_rankings(Product.objects.filter(pk__in=product_ids))
+
+    transaction.on_commit(refresh)
+
+
+def reserve_order(order, timeout=None):
+    """
+    Зарезервировать остатки под все строки заказа одной транзакцией.
+
+    Каждая строка - условный UPDATE без предварительного чтения остатка, поэтому параллельные
+    покупатели не могут продать больше, чем есть: проигравший получает 0 обновленных строк.
+    Если не хватило хотя бы одного товара, все списания откатываются и выбрасывается OutOfStock.
+    Возвращает False, если заказ уже зарезервирован или оплачен (резерв действует или списан).
+    """
+    now = timezone.now()
+    expires_at = now + datetime.timedelta(seconds=RESERVATION_TIMEOUT if timeout is None else timeout)
+    with transaction.atomic():
+        if order.reservations.exclude(status='released').exists():
+            return False
+
+        # Одинаковый порядок блокировок строк товаров во всех транзакциях исключает взаимные блокировки
+        lines = list(
+            OrderProduct.objects.filter(order=order, product__isnull=False)
+            .order_by('product_id').values_list('product_id', 'count')
+        )
+        missing = [product_id for product_id, count in lines if not _take(product_id, count, now)]
+        if missing:
+            raise OutOfStock(missing)
+
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_id=product_id, count=count, expires_at=expires_at)
+            for product_id, count in lines
+        ])
+        _stock_changed(product_id for product_id, _ in lines)
+    return True
+
+
+def consume_order(order):
+    """
+    Оплаченный заказ: резервы списываются окончательно, остаток не возвращается.
+    Если резерв истек и был снят (или заказ подтвержден до появления резервов),
+    остаток резервируется заново; OutOfStock, если его уже нет.
+    """
+    with transaction.atomic():
+        reserve_order(order)
+        return order.reservations.filter(status='active').update(status='consumed')
+
+
+def release(reservations):
+    """
+    Снять действующие резервы и вернуть остаток.
+    Переход active -> released условный, поэтому параллельные снятия не вернут остаток дважды.
+    """
+    now = timezone.now()
+    released = 0
+    returned = set()
+    with transaction.atomic():
+        for pk, product_id, count in reservations.filter(status='active').values_list('id', 'product_id', 'count'):
+            if StockReservation.objects.filter(pk=pk, status='active').update(status='released'):
+                _give_back(product_id, count, now)
+                returned.add(product_id)
+                released += 1
+        _stock_changed(returned)
+    return released
+
+
+def release_order(order):
+    """Отмена заказа или неудачная оплата"""
+    return release(order.reservations.all())
+
+
+def release_expired(now=None):
+    """Снять резервы, срок которых истек (неоплаченные заказы)"""
+    return release(StockReservation.objects.filter(expires_at__lt=now or timezone.now()))
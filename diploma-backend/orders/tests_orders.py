@@ -1,9 +1,26 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from asgiref.sync import sync_to_async
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
-from orders.models import Order, OrderProduct, Payment
+from orders.basket import add_to_basket, remove_from_basket
+from orders.models import Order, OrderProduct, Payment, PaymentJob, StockReservation
+from orders.payments import run_payment_jobs
+from orders.stock import OutOfStock, consume_order, release_expired, reserve_order
+from orders import views
+from orders.views import create_order_from_basket
+from products.cache import get_cache
 from products.models import Product, Category, ProductImage
 from decimal import Decimal
 
@@ -195,7 +212,36 @@ class OrderAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         # Проверяем количество заказов (исключая корзину)
         orders_count = Order.objects.filter(user=self.user).exclude(status='accepted').count()
+        # Без cursor и limit ответ - прежний список всех заказов
         self.assertEqual(len(response.data), orders_count)
+        self.assertEqual([order['id'] for order in response.data], [order2.id, order1.id])
+
+    def test_orders_history_is_paginated_with_constant_queries(self):
+        products = [
+            Product.objects.create(category=self.category, title=f'Product {i}', description='', price=Decimal('10.00'))
+            for i in range(3)
+        ]
+        for _ in range(5):
+            order = Order.objects.create(user=self.user, status='paid')
+            OrderProduct.objects.bulk_create([
+                OrderProduct(order=order, product=product, count=2, price=product.price) for product in products
+            ])
+        url = reverse('api_orders')
+
+        # Заказы, строки с товарами, изображения, теги, скидки - независимо от числа заказов и строк
+        with self.assertNumQueries(5):
+            response = self.client.get(url, {'limit': 3})
+
+        self.assertEqual(len(response.data['items']), 3)
+        line = response.data['items'][0]['products'][0]
+        self.assertEqual((line['id'], line['count'], line['price']), (products[0].id, 2, '10.00'))
+
+        response = self.client.get(url, {'limit': 3, 'cursor': response.data['nextCursor']})
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertIsNone(response.data['nextCursor'])
+
+        response = self.client.get(url, {'cursor': 'broken'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_get_order_detail(self):
         """Тест получения деталей заказа"""
@@ -290,6 +336,9 @@ class PaymentAPITest(APITestCase):
         # Авторизуемся
         self.client.force_authenticate(user=self.user)
 
+    def run_worker(self, processor=None):
+        return run_payment_jobs('test-worker', processor)
+
     def test_payment_processing(self):
         """Тест обработки платежа"""
         url = reverse('payment_api', kwargs={'id': self.order.id})
@@ -303,7 +352,10 @@ class PaymentAPITest(APITestCase):
 
         response = self.client.post(url, data, format='json')
 
-        # Проверяем, что платеж прошел успешно
+        # Платеж принят в очередь, результат записывает воркер
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.run_worker(), 1)
+        response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['result'], 'Payment successful')
 
@@ -327,6 +379,8 @@ class PaymentAPITest(APITestCase):
             'code': '123'
         }
 
+        self.client.post(url, data, format='json')
+        self.run_worker()
         response = self.client.post(url, data, format='json')
 
         # Проверяем, что платеж отклонен
@@ -340,4 +394,678 @@ class PaymentAPITest(APITestCase):
         # Проверяем, что создался объект Payment со статусом 'failed'
         payment = Payment.objects.filter(order=self.order).first()
         self.assertIsNotNone(payment)
-        self.assertEqual(payment.status, 'failed')
\ No newline at end of file
+        self.assertEqual(payment.status, 'failed')
+        self.assertEqual(payment.error, response.data['error'])
+
+    def test_double_submit_returns_cached_outcome(self):
+        """Повторная отправка формы не создает второй платеж и получает тот же результат"""
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+        first = self.client.post(url, {'number': '12345679'}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        # Повтор с другим номером не должен ставить вторую задачу
+        second = self.client.post(url, {'number': '12345678'}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.run_worker(), 1)
+
+        third = self.client.post(url, {'number': '12345678'}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+
+        self.assertEqual(third.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(third.data['error'], Payment.objects.get(order=self.order).error)
+        self.assertEqual(third['Idempotent-Replayed'], 'true')
+        self.assertEqual(Payment.objects.filter(order=self.order).count(), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+
+    def test_different_idempotency_key_is_rejected(self):
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+        self.client.post(url, {'number': '12345678'}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+
+        response = self.client.post(url, {'number': '12345678'}, format='json', HTTP_IDEMPOTENCY_KEY='pay-2')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Payment.objects.filter(order=self.order).count(), 1)
+
+    def test_unconfirmed_order_cannot_be_paid(self):
+        self.order.status = 'created'
+        self.order.save()
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+
+        response = self.client.post(url, {'number': '12345678'}, format='json')
+
+        # Оплачивается только подтвержденный заказ: без подтверждения нет данных доставки и резерва
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data, {'error': 'Invalid order status', 'status': 'created'})
+        self.assertFalse(Payment.objects.filter(order=self.order).exists())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'created')
+
+    def test_inline_mode_processes_payment_without_worker(self):
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+
+        with patch('orders.views.PAYMENT_INLINE', True):
+            response = self.client.post(url, {'number': '12345678'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['result'], 'Payment successful')
+        self.assertEqual(PaymentJob.objects.get(payment__order=self.order).status, 'done')
+        self.assertEqual(self.run_worker(), 0)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    def test_invalid_number_does_not_record_payment(self):
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+
+        response = self.client.post(url, {'number': 'abc'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Payment.objects.filter(order=self.order).exists())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'confirmed')
+
+    def test_paid_order_cannot_be_confirmed_again(self):
+        self.order.status = 'paid'
+        self.order.save()
+
+        response = self.client.post(
+            reverse('api_order_detail', kwargs={'id': self.order.id}), {'fullName': 'Test User'}, format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+        self.client.post(url, {'number': '12345678'}, format='json')
+        calls = []
+
+        def flaky(payment):
+            calls.append(payment.id)
+            if len(calls) == 1:
+                raise ConnectionError('bank timeout')
+            return None
+
+        self.assertEqual(self.run_worker(flaky), 1)
+        job = PaymentJob.objects.get(payment__order=self.order)
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.last_error, 'ConnectionError: bank timeout')
+        self.assertGreater(job.run_at, timezone.now())
+        # Повтор не раньше назначенного времени
+        self.assertEqual(self.run_worker(flaky), 0)
+
+        PaymentJob.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(self.run_worker(flaky), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    def test_exhausted_job_goes_to_dead_letter(self):
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+        self.client.post(url, {'number': '12345678'}, format='json')
+
+        def broken(payment):
+            raise ConnectionError('bank is down')
+
+        with patch('orders.payments.PAYMENT_MAX_ATTEMPTS', 2):
+            for _ in range(2):
+                PaymentJob.objects.update(run_at=timezone.now())
+                self.run_worker(broken)
+
+        job = PaymentJob.objects.get(payment__order=self.order)
+        self.assertEqual((job.status, job.attempts), ('dead', 2))
+        payment = Payment.objects.get(order=self.order)
+        self.assertEqual(payment.status, 'failed')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+
+    def test_expired_lease_is_reclaimed_once(self):
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+        self.client.post(url, {'number': '12345678'}, format='json')
+        # Воркер взял задачу и упал, не записав результат
+        PaymentJob.objects.update(
+            status='processing', attempts=1, locked_by='crashed',
+            locked_until=timezone.now() - datetime.timedelta(seconds=1)
+        )
+
+        self.assertEqual(self.run_worker(), 1)
+        self.assertEqual(self.run_worker(), 0)
+        job = PaymentJob.objects.get(payment__order=self.order)
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+
+    def test_status_reports_progress(self):
+        url = reverse('payment_status_api', kwargs={'id': self.order.id})
+        self.client.post(reverse('payment_api', kwargs={'id': self.order.id}), {'number': '12345678'}, format='json')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data, {'status': 'confirmed', 'payment': 'pending', 'attempts': 0, 'error': None})
+
+        self.run_worker()
+        response = self.client.get(url)
+        self.assertEqual(response.data, {'status': 'paid', 'payment': 'completed', 'attempts': 1, 'error': None})
+
+
+@patch('orders.views.PAYMENT_STATUS_INTERVAL', 0.01)
+@patch('orders.views.PAYMENT_STATUS_TIMEOUT', 2)
+class PaymentStatusWatchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpass123')
+        self.order = Order.objects.create(user=self.user, status='confirmed')
+        payment = Payment.objects.create(order=self.order, number='12345678')
+        PaymentJob.objects.create(payment=payment)
+        self.url = reverse('payment_status_watch', kwargs={'id': self.order.id})
+        self.async_client.force_login(self.user)
+
+    async def pay_later(self):
+        # Воркер записывает результат, пока клиент ждет ответа
+        await asyncio.sleep(0.05)
+        await sync_to_async(run_payment_jobs)('test-worker')
+
+    async def test_without_since_returns_current_status(self):
+        response = await self.async_client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'status': 'confirmed', 'payment': 'pending', 'attempts': 0, 'error': None})
+
+    async def test_long_poll_returns_when_status_changes(self):
+        response, _ = await asyncio.gather(self.async_client.get(self.url, {'since': 'pending'}), self.pay_later())
+
+        self.assertEqual(response.json()['payment'], 'completed')
+        self.assertEqual(response.json()['status'], 'paid')
+
+    async def test_long_poll_falls_back_to_current_status_on_timeout(self):
+        with patch('orders.views.PAYMENT_STATUS_TIMEOUT', 0.05):
+            response = await self.async_client.get(self.url, {'since': 'pending'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['payment'], 'pending')
+
+    async def test_event_stream_pushes_changes_until_settled(self):
+        async def read_events():
+            response = await self.async_client.get(self.url, headers={'Accept': 'text/event-stream'})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = [chunk.decode() async for chunk in response.streaming_content]
+            return [json.loads(chunk[len('data: '):]) for chunk in chunks if chunk.startswith('data: ')]
+
+        events, _ = await asyncio.gather(read_events(), self.pay_later())
+
+        self.assertEqual([event['payment'] for event in events], ['pending', 'completed'])
+
+    async def test_other_users_order_is_denied(self):
+        other = await User.objects.acreate(username='other', email='other@example.com')
+        order = await Order.objects.acreate(user=other, status='confirmed')
+
+        response = await self.async_client.get(reverse('payment_status_watch', kwargs={'id': order.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_staff_can_watch_any_order(self):
+        staff = await User.objects.acreate(username='staff', email='staff@example.com', is_staff=True)
+        await sync_to_async(self.async_client.force_login)(staff)
+
+        response = await self.async_client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['payment'], 'pending')
+
+    async def test_watchers_over_limit_get_current_status(self):
+        with patch('orders.views.PAYMENT_STATUS_MAX_WATCHERS', 0), patch('orders.views.PAYMENT_STATUS_TIMEOUT', 30):
+            response = await asyncio.wait_for(self.async_client.get(self.url, {'since': 'pending'}), 5)
+
+        self.assertEqual(response.json()['payment'], 'pending')
+
+    def test_long_poll_under_wsgi_returns_immediately(self):
+        self.client.force_login(self.user)
+        started = time.monotonic()
+        with patch('orders.views.PAYMENT_STATUS_TIMEOUT', 30):
+            response = self.client.get(self.url, {'since': 'pending'})
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response.json()['payment'], 'pending')
+        self.assertEqual(views._watchers, 0)
+
+    async def test_finished_long_poll_frees_watcher_slot(self):
+        await asyncio.gather(self.async_client.get(self.url, {'since': 'pending'}), self.pay_later())
+
+        self.assertEqual(views._watchers, 0)
+
+
+class BasketAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpass123')
+        self.category = Category.objects.create(title='Test Category')
+        self.product = Product.objects.create(
+            category=self.category, title='Test Product', description='Test description',
+            price=Decimal('100.00'), count=10, available=True
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('basket_api')
+
+    def test_repeated_add_increments_single_row(self):
+        self.client.post(self.url, {'id': self.product.id, 'count': 2}, format='json')
+        response = self.client.post(self.url, {'id': self.product.id, 'count': 3}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['count'], 5)
+        self.assertEqual(Order.objects.filter(user=self.user, status='accepted').count(), 1)
+        self.assertEqual(OrderProduct.objects.get(product=self.product).count, 5)
+
+    def test_delete_decrements_and_removes(self):
+        self.client.post(self.url, {'id': self.product.id, 'count': 3}, format='json')
+
+        response = self.client.delete(self.url, {'id': self.product.id, 'count': 2}, format='json')
+        self.assertEqual(response.data[0]['count'], 1)
+
+        response = self.client.delete(self.url, {'id': self.product.id, 'count': 5}, format='json')
+        self.assertEqual(response.data, [])
+        self.assertFalse(OrderProduct.objects.filter(product=self.product).exists())
+
+    def test_get_uses_constant_number_of_queries(self):
+        for i in range(5):
+            product = Product.objects.create(
+                category=self.category, title=f'Product {i}', description='', price=Decimal('10.00')
+            )
+            add_to_basket(self.user, product, 1)
+
+        # Строки с товарами, изображения, теги - независимо от числа строк
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 5)
+
+    def test_summary_and_delta_responses(self):
+        other = Product.objects.create(category=self.category, title='Other', description='', price=Decimal('50.00'))
+        add_to_basket(self.user, other, 1)
+
+        response = self.client.post(self.url + '?response=summary', {'id': self.product.id, 'count': 2}, format='json')
+        self.assertEqual(response.data, {'lines': 2, 'count': 3, 'total': 250.0})
+
+        response = self.client.post(self.url + '?response=delta', {'id': self.product.id, 'count': 1}, format='json')
+        self.assertEqual(response.data['item'], {'id': self.product.id, 'count': 3, 'price': 100.0, 'total': 300.0})
+        self.assertEqual(response.data['summary'], {'lines': 2, 'count': 4, 'total': 350.0})
+
+        response = self.client.delete(self.url + '?response=delta', {'id': self.product.id, 'count': 3}, format='json')
+        self.assertEqual(response.data['item']['count'], 0)
+        self.assertEqual(response.data['summary'], {'lines': 1, 'count': 1, 'total': 50.0})
+
+        response = self.client.get(self.url, {'response': 'unknown'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_anonymous_basket_is_hydrated_in_one_query(self):
+        self.client.force_authenticate(user=None)
+        products = [
+            Product.objects.create(category=self.category, title=f'Product {i}', description='', price=Decimal('10.00'))
+            for i in range(5)
+        ]
+        for product in products:
+            self.client.post(self.url, {'id': product.id, 'count': 2}, format='json')
+
+        # Товары, изображения, теги - независимо от числа строк; плюс чтение сессии из базы при SESSION_BACKEND=db
+        session_queries = 1 if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.db' else 0
+        with self.assertNumQueries(3 + session_queries):
+            response = self.client.get(self.url)
+        self.assertEqual([item['id'] for item in response.data], [product.id for product in products])
+
+        response = self.client.get(self.url, {'response': 'summary'})
+        self.assertEqual(response.data, {'lines': 5, 'count': 10, 'total': 100.0})
+
+    def test_deleted_products_are_pruned_from_session(self):
+        self.client.force_authenticate(user=None)
+        self.client.post(self.url, {'id': self.product.id, 'count': 1}, format='json')
+        other = Product.objects.create(category=self.category, title='Other', description='', price=Decimal('5.00'))
+        self.client.post(self.url, {'id': other.id, 'count': 1}, format='json')
+
+        other.delete()
+        response = self.client.get(self.url)
+
+        self.assertEqual([item['id'] for item in response.data], [self.product.id])
+        self.assertEqual(self.client.session['basket'], f'{self.product.id}:1')
+
+    def test_guest_basket_size_guard(self):
+        self.client.force_authenticate(user=None)
+        other = Product.objects.create(category=self.category, title='Other', description='', price=Decimal('5.00'))
+
+        with patch('orders.guest_basket.GUEST_BASKET_MAX_LINES', 1):
+            self.client.post(self.url, {'id': self.product.id, 'count': 1}, format='json')
+            response = self.client.post(self.url, {'id': other.id, 'count': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.session['basket'], f'{self.product.id}:1')
+
+    def test_guest_basket_is_merged_on_sign_in(self):
+        self.client.force_authenticate(user=None)
+        other = Product.objects.create(category=self.category, title='Other', description='', price=Decimal('5.00'))
+        add_to_basket(self.user, self.product, 1)
+        self.client.post(self.url, {'id': self.product.id, 'count': 2}, format='json')
+        self.client.post(self.url, {'id': other.id, 'count': 1}, format='json')
+
+        response = self.client.post('/api/sign-in/', {'username': 'buyer', 'password': 'testpass123'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts = dict(OrderProduct.objects.filter(order__user=self.user).values_list('product_id', 'count'))
+        self.assertEqual(counts, {self.product.id: 3, other.id: 1})
+        self.assertNotIn('basket', self.client.session)
+
+    def test_invalid_count_is_rejected(self):
+        for count in (0, -1, 'abc'):
+            response = self.client.post(self.url, {'id': self.product.id, 'count': count}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+
+
+class CheckoutTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpass123')
+        category = Category.objects.create(title='Test Category')
+        self.products = [
+            Product.objects.create(category=category, title=f'Product {i}', description='', price=Decimal('100.00'))
+            for i in range(3)
+        ]
+        for count, product in enumerate(self.products, start=1):
+            add_to_basket(self.user, product, count)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('api_orders')
+
+    def test_checkout_moves_lines_and_computes_total(self):
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(id=response.data['orderId'])
+        self.assertEqual(order.status, 'created')
+        # 600 за товары, доставка бесплатна от 2000
+        self.assertEqual(order.totalCost, Decimal('800.00'))
+        self.assertEqual(
+            dict(order.products.values_list('product_id', 'count')),
+            {product.id: count for count, product in enumerate(self.products, start=1)}
+        )
+        self.assertFalse(Order.objects.filter(user=self.user, status='accepted').exists())
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_total_matches_copied_lines(self):
+        # Строка товара, удаленного без сигналов (например, массовым удалением в базе)
+        OrderProduct.objects.filter(order__status='accepted', product=self.products[2]).update(product=None)
+
+        order = Order.objects.get(id=self.client.post(self.url).data['orderId'])
+
+        # 100 + 200 за оставшиеся строки и 200 за доставку
+        self.assertEqual(order.totalCost, Decimal('500.00'))
+        self.assertEqual(order.products.count(), 2)
+
+    def test_retry_with_idempotency_key_returns_same_order(self):
+        first = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        add_to_basket(self.user, self.products[0], 1)
+        retry = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data['orderId'], first.data['orderId'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.filter(user=self.user).exclude(status='accepted').count(), 1)
+        # Новая корзина не тронута повтором
+        self.assertTrue(Order.objects.filter(user=self.user, status='accepted').exists())
+
+    def test_order_detail_renders_from_snapshot(self):
+        order_id = self.client.post(self.url).data['orderId']
+        product = self.products[0]
+        product.title = 'Renamed'
+        product.save()
+        self.products[1].delete()
+
+        # Заказ и строки заказа, без запросов к товарам и изображениям
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_order_detail', kwargs={'id': order_id}))
+
+        lines = response.data['products']
+        self.assertEqual([line['title'] for line in lines], ['Product 0', 'Product 1', 'Product 2'])
+        self.assertEqual(lines[1]['id'], None)
+        self.assertEqual(lines[0]['images'], [])
+
+    def test_order_detail_keeps_product_keys(self):
+        product = self.products[0]
+        product.description = 'Long description ' * 10
+        product.save()
+        order_id = self.client.post(self.url).data['orderId']
+        product.description = 'Changed'
+        product.save()
+
+        line = self.client.get(reverse('api_order_detail', kwargs={'id': order_id})).data['products'][0]
+
+        self.assertEqual(
+            set(line), {'id', 'title', 'description', 'price', 'count', 'date', 'images', 'shortDescription'}
+        )
+        self.assertEqual(line['description'], 'Long description ' * 10)
+        self.assertEqual(line['shortDescription'], ('Long description ' * 10)[:100] + '...')
+        self.assertEqual(line['date'], product.created_at.strftime("%a %b %d %Y %H:%M:%S GMT%z"))
+
+    def test_deleted_product_leaves_basket(self):
+        self.products[0].delete()
+
+        response = self.client.post(self.url)
+
+        order = Order.objects.get(id=response.data['orderId'])
+        self.assertEqual(order.products.count(), 2)
+        self.assertEqual(order.totalCost, Decimal('700.00'))
+
+    def test_failure_midway_leaves_basket_intact(self):
+        with patch.object(OrderProduct.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.url)
+
+        self.assertFalse(Order.objects.filter(user=self.user).exclude(status='accepted').exists())
+        basket = Order.objects.get(user=self.user, status='accepted')
+        self.assertEqual(basket.products.count(), 3)
+
+
+class StockReservationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpass123')
+        category = Category.objects.create(title='Test Category')
+        self.product = Product.objects.create(
+            category=category, title='Limited', description='', price=Decimal('100.00'), count=3, limited=True
+        )
+        self.order = Order.objects.create(user=self.user, status='created')
+        OrderProduct.objects.create(order=self.order, product=self.product, count=2, price=Decimal('100.00'))
+        self.client.force_authenticate(user=self.user)
+
+    def confirm(self, order=None):
+        url = reverse('api_order_detail', kwargs={'id': (order or self.order).id})
+        return self.client.post(url, {'fullName': 'Buyer'}, format='json')
+
+    def pay(self, number):
+        url = reverse('payment_api', kwargs={'id': self.order.id})
+        self.client.post(url, {'number': number}, format='json')
+        run_payment_jobs('test-worker')
+        return self.client.post(url, {'number': number}, format='json')
+
+    def test_confirmation_reserves_stock_once(self):
+        self.assertEqual(self.confirm().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.confirm().status_code, status.HTTP_200_OK)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count, 1)
+        self.assertEqual(StockReservation.objects.get(order=self.order).status, 'active')
+
+    def test_insufficient_stock_is_rejected(self):
+        other = Order.objects.create(user=self.user, status='created')
+        OrderProduct.objects.create(order=other, product=self.product, count=2, price=Decimal('100.00'))
+        self.confirm()
+
+        response = self.confirm(other)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['products'], [self.product.id])
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'created')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count, 1)
+
+    def test_failed_payment_releases_reservation(self):
+        self.confirm()
+        self.pay('12345679')  # Нечетный номер - отказ
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count, 3)
+        self.assertEqual(StockReservation.objects.get(order=self.order).status, 'released')
+
+    def test_payment_consumes_reservation(self):
+        self.confirm()
+        # Резерв истек и снят до оплаты: оплата резервирует остаток заново
+        release_expired(now=timezone.now() + datetime.timedelta(days=1))
+
+        self.assertEqual(self.pay('12345678').status_code, status.HTTP_200_OK)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count, 1)
+        self.assertEqual(self.order.reservations.filter(status='consumed').count(), 1)
+
+    def test_reservation_refreshes_cached_catalog(self):
+        get_cache().clear()
+        self.client.force_authenticate(user=None)
+        url = reverse('product-limited')
+        self.assertEqual(self.client.get(url).data[0]['count'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_order(self.order)
+        self.assertEqual(self.client.get(url).data[0]['count'], 1)
+
+        other = Order.objects.create(user=self.user, status='created')
+        OrderProduct.objects.create(order=other, product=self.product, count=1, price=Decimal('100.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_order(other)
+        # Остаток закончился: товар недоступен и выбыл из списка
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.available)
+        self.assertEqual(self.client.get(url).data, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_expired(now=timezone.now() + datetime.timedelta(days=1))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.count, self.product.available), (3, True))
+        self.assertEqual(self.client.get(url).data[0]['count'], 3)
+
+    def test_manually_disabled_product_stays_unavailable(self):
+        self.product.available = False
+        self.product.save()
+
+        reserve_order(self.order)
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.sold_out)
+
+        release_expired(now=timezone.now() + datetime.timedelta(days=1))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.count, self.product.available), (3, False))
+
+    def test_restock_returns_sold_out_product(self):
+        self.product.count = 2
+        self.product.save()
+        reserve_order(self.order)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.available, self.product.sold_out), (False, True))
+
+        # Резерв оплачен, остаток пополняется в админке
+        consume_order(self.order)
+        self.product.count = 5
+        self.product.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.available, self.product.sold_out), (True, False))
+
+    def test_expired_reservations_are_released(self):
+        reserve_order(self.order, timeout=-1)
+
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(release_expired(), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count, 3)
+
+
+class BasketConcurrencyTest(TransactionTestCase):
+    """Параллельные изменения одной корзины из нескольких потоков"""
+
+    THREADS = 8
+    ROUNDS = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpass123')
+        category = Category.objects.create(title='Test Category')
+        self.products = [
+            Product.objects.create(category=category, title=f'Product {i}', description='', price=Decimal('10.00'))
+            for i in range(2)
+        ]
+
+    def hammer(self, action):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.ROUNDS):
+                    for product in self.products:
+                        action(product)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_adds_are_not_lost(self):
+        self.hammer(lambda product: add_to_basket(self.user, product, 1))
+
+        basket = Order.objects.get(user=self.user, status='accepted')
+        for product in self.products:
+            self.assertEqual(OrderProduct.objects.get(order=basket, product=product).count, self.THREADS * self.ROUNDS)
+
+    def test_concurrent_removes_never_go_negative(self):
+        for product in self.products:
+            add_to_basket(self.user, product, self.THREADS * self.ROUNDS - 3)
+
+        self.hammer(lambda product: remove_from_basket(self.user, product.id, 1))
+
+        self.assertFalse(OrderProduct.objects.filter(order__user=self.user).exists())
+
+    def test_concurrent_checkouts_with_same_key_create_one_order(self):
+        add_to_basket(self.user, self.products[0], 2)
+        results = []
+
+        def checkout(_):
+            order, _ = create_order_from_basket(self.user, 'checkout-1')
+            results.append(order and order.id)
+
+        self.products = self.products[:1]
+        self.hammer(checkout)
+
+        order = Order.objects.get(user=self.user, idempotency_key='checkout-1')
+        self.assertEqual(results, [order.id] * self.THREADS * self.ROUNDS)
+        self.assertEqual(order.products.get().count, 2)
+
+    def test_concurrent_reservations_do_not_oversell(self):
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(count=self.THREADS)
+        orders = []
+        for _ in range(self.THREADS * self.ROUNDS):
+            order = Order.objects.create(user=self.user, status='created')
+            OrderProduct.objects.create(order=order, product=product, count=1, price=product.price)
+            orders.append(order)
+        reserved = []
+
+        def reserve(_):
+            order = orders.pop()
+            try:
+                reserve_order(order)
+                reserved.append(order.id)
+            except OutOfStock:
+                pass
+
+        self.products = [product]
+        self.hammer(reserve)
+
+        product.refresh_from_db()
+        self.assertEqual(product.count, 0)
+        self.assertEqual(len(reserved), self.THREADS)
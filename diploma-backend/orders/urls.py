@@ -41,4 +41,8 @@ urlpatterns = [
     path('payment-status/<int:id>/', views.PaymentStatusView.as_view(), name='payment_status_api'),
     path('payment-status/<int:id>', views.PaymentStatusView.as_view(), name='payment_status_api_no_slash'),
 
+    # GET: статус оплаты потоком SSE или long-poll (ASGI)
+    path('payment-status/<int:id>/watch/', views.payment_status_watch, name='payment_status_watch'),
+    path('payment-status/<int:id>/watch', views.payment_status_watch, name='payment_status_watch_no_slash'),
+
 ]
\ No newline at end of file
@@ -660,14 +660,35 @@ class PaymentStatusView(APIView):
             "error": None
         })
 
+import asyncio
+import time
+from contextlib import aclosing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, Sum, prefetch_related_objects
 from .models import Order, OrderProduct, Cart, Payment
+from . import guest_basket
+from .basket import (
+    add_to_basket, basket_line, basket_lines, basket_totals, hydrate_session_basket, remove_from_basket, summarize
+)
+from .payments import (
+    PAYMENT_INLINE, IdempotencyConflict, InvalidTransition, OUT_OF_STOCK_ERROR, enqueue_payment, is_settled,
+    parse_number, payment_progress, run_payment_now
+)
+from .stock import OutOfStock, reserve_order
 from products.models import Product
+from products.pagination import InvalidCursor, keyset_page
+from products.sales import attach_active_sales
 from .serializers import OrderSerializer, PaymentSerializer
 import json
 
@@ -691,7 +712,7 @@ def create_product_data(product, count, price=None):
 
     return {
         'id': product.id,
-        'category': product.category.id,
+        'category': product.category_id,
         'price': float(price),
         'count': count,
         'date': product.created_at.strftime("%a %b %d %Y %H:%M:%S GMT%z"),
@@ -706,7 +727,7 @@ def create_product_data(product, count, price=None):
             for img in product.images.all()
         ],
         'tags': [tag.id for tag in product.tags.all()],
-        'reviews': product.reviews.count(),
+        'reviews': product.reviews_count,
         'rating': float(product.rating)
     }
 
@@ -715,7 +736,8 @@ def check_order_access(request, order):
     """Проверить доступ пользователя к заказу"""
     if request.user.is_staff:
         return True
-    return order.user == request.user
+    # Сравнение по id не загружает пользователя заказа
+    return order.user_id == request.user.id
 
 
 def check_basket_empty(user):
@@ -727,96 +749,152 @@ def check_basket_empty(user):
         return True
 
 
-def create_order_from_basket(user):
-    """Создать заказ из корзины пользователя"""
+def create_order_from_basket(user, idempotency_key=None):
+    """
+    Создать заказ из корзины пользователя одной транзакцией.
+    Возвращает (заказ, создан) или (None, False), если корзина пуста.
+
+    Строки копируются одним bulk_create, сумма считается агрегатом в базе, корзина удаляется
+    в той же транзакции: сбой посередине не оставляет частично скопированный заказ.
+    Повтор с тем же idempotency_key возвращает ранее созданный заказ.
+    """
+    orders = Order.objects.filter(user=user)
+    if idempotency_key:
+        existing = orders.filter(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+
     try:
-        basket_order = Order.objects.get(user=user, status='accepted')
-        basket_items = OrderProduct.objects.filter(order=basket_order)
+        with transaction.atomic():
+            basket_order = orders.select_for_update().filter(status='accepted').first()
+            if idempotency_key:
+                # Повторная проверка после блокировки корзины: параллельный повтор с тем же ключом
+                # ждал блокировку, пока первый запрос создавал заказ и удалял корзину
+                existing = orders.filter(idempotency_key=idempotency_key).first()
+                if existing:
+                    return existing, False
+            if basket_order is None:
+                return None, False
+
+            # Строки удаленных товаров не копируются и не входят в сумму
+            lines = OrderProduct.objects.filter(order=basket_order, product__isnull=False)
+            basket_items = list(lines.select_related('product').prefetch_related('product__images'))
+            if not basket_items:
+                return None, False
+
+            total_cost = lines.aggregate(total=Sum(F('price') * F('count')))['total']
+
+            # Создаем новый заказ со статусом 'created' с пустыми полями для заполнения пользователем
+            order = Order.objects.create(
+                user=user,
+                fullName='',
+                email='',
+                phone='',
+                deliveryType='ordinary',
+                paymentType='online',
+                status='created',
+                city='',
+                address='',
+                totalCost=total_cost + calculate_delivery_price('ordinary', total_cost),
+                idempotency_key=idempotency_key or None
+            )
+            # Строки заказа получают снимок товара: название, первое изображение, описание и дату
+            order_lines = []
+            for item in basket_items:
+                line = OrderProduct(order=order, product=item.product, count=item.count, price=item.price)
+                line.fill_snapshot()
+                order_lines.append(line)
+            OrderProduct.objects.bulk_create(order_lines)
 
-        if basket_items.count() == 0:
-            return None
+            # Удаляем корзину
+            basket_order.delete()
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел создать заказ
+        if not idempotency_key:
+            raise
+        return orders.get(idempotency_key=idempotency_key), False
 
-        # Проверяем, не был ли уже создан заказ из этой корзины
-        existing_order = Order.objects.filter(
-            user=user,
-            status='created',
-            createdAt__gte=basket_order.createdAt
-        ).exists()
+    return order, True
 
-        if existing_order:
-            # Если заказ уже был создан, возвращаем последний созданный заказ
-            return Order.objects.filter(user=user).exclude(status='accepted').order_by('-createdAt').first()
 
-        # Создаем новый заказ со статусом 'created' с пустыми полями для заполнения пользователем
-        order = Order.objects.create(
-            user=user,
-            fullName='',
-            email='',
-            phone='',
-            deliveryType='ordinary',
-            paymentType='online',
-            status='created',
-            city='',
-            address=''
-        )
+def get_basket_items_for_user(request):
+    """Получить элементы корзины для пользователя (авторизованного или анонимного)"""
+    if request.user.is_authenticated:
+        return [create_product_data(op.product, op.count, op.price) for op in basket_lines(request.user)]
+    else:
+        # Для анонимных пользователей используем сессию
+        basket = guest_basket.load(request.session)
+        lines, kept = hydrate_session_basket(basket)
+        if len(kept) != len(basket):
+            # Удаленные товары убираются из сессии в том же проходе
+            guest_basket.save(request.session, kept)
+        return [create_product_data(product, count) for product, count in lines]
 
-        # Переносим товары из корзины
-        total_cost = 0
-        for item in basket_items:
-            OrderProduct.objects.create(
-                order=order,
-                product=item.product,
-                count=item.count,
-                price=item.price
-            )
-            total_cost += item.price * item.count
 
-        # Рассчитываем доставку
-        delivery_price = calculate_delivery_price(order.deliveryType, total_cost)
-        order.totalCost = total_cost + delivery_price
-        order.save()
+def get_session_prices(basket):
+    """Цены товаров сессионной корзины одним запросом"""
+    return dict(Product.objects.filter(id__in=[item['id'] for item in basket]).values_list('id', 'price'))
 
-        # Удаляем корзину
-        basket_order.delete()
 
-        return order
+def get_basket_summary(request, prices=None):
+    """Итоги корзины: количество строк, единиц товара и сумма, без сериализации товаров"""
+    if request.user.is_authenticated:
+        return basket_totals(request.user)
 
-    except Order.DoesNotExist:
-        return None
+    basket = guest_basket.load(request.session)
+    if prices is None:
+        prices = get_session_prices(basket)
+    items = [item for item in basket if item['id'] in prices]
+    return summarize(
+        len(items),
+        sum(item['count'] for item in items),
+        sum(prices[item['id']] * item['count'] for item in items)
+    )
 
 
-def get_basket_items_for_user(request):
-    """Получить элементы корзины для пользователя (авторизованного или анонимного)"""
+def get_basket_delta(request, product_id):
+    """Изменившаяся строка корзины и новые итоги; count 0 - товар удален из корзины"""
     if request.user.is_authenticated:
-        try:
-            basket_order = Order.objects.get(user=request.user, status='accepted')
-            order_products = OrderProduct.objects.filter(
-                order=basket_order
-            ).select_related('product').prefetch_related(
-                'product__images', 'product__tags', 'product__category'
-            )
+        line = basket_line(request.user, product_id)
+        summary = get_basket_summary(request)
+    else:
+        basket = guest_basket.load(request.session)
+        prices = get_session_prices(basket)
+        line = next(
+            ({'count': item['count'], 'price': prices[item['id']]}
+             for item in basket if item['id'] == product_id and item['id'] in prices),
+            None
+        )
+        summary = get_basket_summary(request, prices)
 
-            basket_items = []
-            for op in order_products:
-                basket_items.append(create_product_data(op.product, op.count, op.price))
-            return basket_items
-        except Order.DoesNotExist:
-            return []
+    if line is None:
+        item = {'id': product_id, 'count': 0, 'price': None, 'total': 0.0}
     else:
-        # Для анонимных пользователей используем сессию
-        basket = request.session.get('basket', [])
-        basket_items = []
+        item = {
+            'id': product_id,
+            'count': line['count'],
+            'price': float(line['price']),
+            'total': float(line['price'] * line['count'])
+        }
+    return {'item': item, 'summary': summary}
 
-        for item in basket:
-            try:
-                product = Product.objects.prefetch_related(
-                    'images', 'tags', 'category'
-                ).get(id=item['id'])
-                basket_items.append(create_product_data(product, item['count']))
-            except Product.DoesNotExist:
-                continue
 
-        return basket_items
+# Формат ответа корзины (параметр response): полный список товаров, только итоги
+# или изменившаяся строка с итогами
+BASKET_RESPONSES = ('full', 'summary', 'delta')
+
+
+def get_basket_response_mode(request):
+    mode = request.query_params.get('response', 'full')
+    return mode if mode in BASKET_RESPONSES else None
+
+
+def basket_response(request, mode, product_id=None):
+    if mode == 'summary':
+        return Response(get_basket_summary(request))
+    if mode == 'delta' and product_id is not None:
+        return Response(get_basket_delta(request, product_id))
+    return Response(get_basket_items_for_user(request))
 
 
 # ========== VIEW FUNCTIONS ==========
@@ -840,7 +918,7 @@ def create_order_and_redirect(request):
     if not request.user.is_authenticated:
         return redirect('/sign-in/')
 
-    order = create_order_from_basket(request.user)
+    order, _ = create_order_from_basket(request.user)
 
     if order:
         return redirect(f'/orders/{order.id}/')
@@ -891,29 +969,75 @@ def order_detail_page(request, id):
 
 
 # ========== API VIEWS ==========
+IDEMPOTENCY_KEY_MAX_LENGTH = Order._meta.get_field('idempotency_key').max_length
+
+# Размер страницы истории заказов по умолчанию и максимальный
+ORDERS_PAGE_SIZE = 20
+ORDERS_MAX_PAGE_SIZE = 100
+
+
 class ActiveOrderView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        """GET /orders/ - Список заказов пользователя"""
-        orders = Order.objects.filter(user=request.user).exclude(status='accepted').order_by('-createdAt')
-        serializer = OrderSerializer(orders, many=True, context={'request': request})
-        return Response(serializer.data)
+        """
+        GET /orders/ - История заказов пользователя: новые первыми.
+        С параметрами cursor или limit - keyset-пагинация по (createdAt, id) с индексом по -createdAt
+        и ответ {items, nextCursor, prevCursor, itemsPerPage}; без них - прежний список всех заказов.
+        Строки, товары, изображения, теги и скидки загружаются пакетно - 5 запросов на страницу.
+        """
+        queryset = Order.objects.filter(user=request.user).exclude(status='accepted')
+        if 'cursor' not in request.query_params and 'limit' not in request.query_params:
+            return Response(self._serialize_orders(request, list(queryset.order_by('-createdAt', '-id'))))
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', ORDERS_PAGE_SIZE)), 1), ORDERS_MAX_PAGE_SIZE)
+        except (ValueError, TypeError):
+            limit = ORDERS_PAGE_SIZE
+
+        try:
+            orders, next_cursor, prev_cursor = keyset_page(
+                queryset, 'createdAt', True, limit, request.query_params.get('cursor')
+            )
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'items': self._serialize_orders(request, orders),
+            'nextCursor': next_cursor,
+            'prevCursor': prev_cursor,
+            'itemsPerPage': limit,
+        })
+
+    def _serialize_orders(self, request, orders):
+        prefetch_related_objects(orders, Prefetch(
+            'products',
+            queryset=OrderProduct.objects.select_related('product').prefetch_related(
+                'product__images', 'product__tags'
+            ).order_by('id')
+        ))
+        attach_active_sales([line.product for order in orders for line in order.products.all()])
+        return OrderSerializer(orders, many=True, context={'request': request}).data
 
     def post(self, request, order=None):
         """POST /orders/ - Создание заказа из корзины"""
         if not request.user.is_authenticated:
             return Response({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
 
-        order = create_order_from_basket(request.user)
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response({"error": "Invalid Idempotency-Key"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if order:
-            return Response({"orderId": order.id}, status=status.HTTP_201_CREATED)
-        elif order is None:
-            return Response({"error": "No basket found"}, status=status.HTTP_400_BAD_REQUEST)
-        else:
+        order, created = create_order_from_basket(request.user, idempotency_key or None)
+
+        if order is None:
             return Response({"error": "Basket is empty"}, status=status.HTTP_400_BAD_REQUEST)
 
+        response = Response({"orderId": order.id}, status=status.HTTP_201_CREATED)
+        if not created:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
 
 class OrderDetailView(APIView):
     """Работа с конкретным заказом"""
@@ -971,6 +1095,13 @@ class OrderDetailView(APIView):
         if not check_order_access(request, order):
             return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
 
+        # Оплаченный или отмененный заказ подтвердить нельзя
+        if not order.can_transition('confirmed'):
+            return Response(
+                {"error": "Invalid order status", "status": order.status},
+                status=status.HTTP_409_CONFLICT
+            )
+
         data = request.data
 
         # Получаем данные из Vue объекта
@@ -1042,40 +1173,46 @@ class OrderDetailView(APIView):
         delivery_price = calculate_delivery_price(order.deliveryType, total_product_cost)
         order.totalCost = total_product_cost + delivery_price
 
-        # Устанавливаем статус
-        order.status = 'confirmed'
-        order.save()
+        # Устанавливаем статус; подтвержденный заказ резервирует остатки до оплаты
+        try:
+            with transaction.atomic():
+                reserve_order(order)
+                order.status = 'confirmed'
+                order.save()
+        except OutOfStock as error:
+            return Response(
+                {"error": "Insufficient stock", "products": error.product_ids},
+                status=status.HTTP_409_CONFLICT
+            )
 
         return Response({
             "orderId": order.id
         })
 
     def _get_products_data(self, order):
-        """Получить данные товаров заказа"""
-
-        order_products = order.products.all()
+        """
+        Получить данные товаров заказа из снимка строк: один запрос к OrderProduct
+        без обращения к таблицам товаров, изображений и категорий.
+        Ключи ответа те же, что при чтении из товаров: полное описание, дата товара,
+        первое изображение (пустой список, если изображений не было) и начало описания
+        """
 
         products_data = []
 
-        for op in order_products:
-            product = op.product
-            product_data = {
-                'id': product.id,
-                'title': product.title,
-                'description': product.description,
+        for op in order.products.order_by('id'):
+            products_data.append({
+                'id': op.product_id,
+                'title': op.title,
+                'description': op.description,
                 'price': float(op.price),
                 'count': op.count,
-                'date': product.created_at.strftime("%a %b %d %Y %H:%M:%S GMT%z"),
-                'images': [
-                    {
-                        'src': image.src.url if image.src else '/static/frontend/assets/img/product.png',
-                        'alt': image.alt or product.title
-                    }
-                    for image in product.images.all()[:1]
-                ],
-                'shortDescription': product.description[:100] + '...' if product.description else ''
-            }
-            products_data.append(product_data)
+                'date': (
+                    op.product_created_at.strftime("%a %b %d %Y %H:%M:%S GMT%z")
+                    if op.product_created_at else None
+                ),
+                'images': [{'src': op.image, 'alt': op.title}] if op.image else [],
+                'shortDescription': op.short_description
+            })
 
         return products_data
 
@@ -1098,59 +1235,60 @@ class OrderDetailUndefinedView(APIView):
 
 class BasketView(APIView):
     """Работа с корзиной"""
+    # Гости хранят корзину в сессии, поэтому эндпоинт доступен без авторизации
+    permission_classes = [AllowAny]
 
     def get(self, request):
-        return Response(get_basket_items_for_user(request))
+        mode = get_basket_response_mode(request)
+        if mode is None:
+            return Response({"error": "Invalid response mode"}, status=status.HTTP_400_BAD_REQUEST)
+        return basket_response(request, mode)
 
     def post(self, request):
+        mode = get_basket_response_mode(request)
+        if mode is None:
+            return Response({"error": "Invalid response mode"}, status=status.HTTP_400_BAD_REQUEST)
+
         product_id = request.data.get('id')
-        count = int(request.data.get('count', 1))
-        product = get_object_or_404(
-            Product.objects.prefetch_related('images', 'tags', 'category'),
-            id=product_id
-        )
+        try:
+            count = int(request.data.get('count', 1))
+        except (TypeError, ValueError):
+            count = 0
+        if count < 1:
+            return Response({"error": "Invalid count"}, status=status.HTTP_400_BAD_REQUEST)
+        # Товар нужен только для проверки существования и цены; данные для ответа загружает basket_response
+        product = get_object_or_404(Product.objects.only('id', 'price'), id=product_id)
 
         if request.user.is_authenticated:
-            basket_order, created = Order.objects.get_or_create(
-                user=request.user,
-                status='accepted'
-            )
-
-            order_product, created = OrderProduct.objects.get_or_create(
-                order=basket_order,
-                product=product,
-                defaults={'count': count, 'price': product.price}
-            )
-
-            if not created:
-                order_product.count += count
-                order_product.save()
-            else:
-                order_product.price = product.price
-                order_product.save()
-
-            return Response(get_basket_items_for_user(request))
+            add_to_basket(request.user, product, count)
+            return basket_response(request, mode, product.id)
         else:
-            basket = request.session.get('basket', [])
+            basket = guest_basket.load(request.session)
             item_exists = False
 
             for item in basket:
-                if item['id'] == product_id:
+                if item['id'] == product.id:
                     item['count'] += count
                     item_exists = True
                     break
 
             if not item_exists:
-                basket.append({'id': product_id, 'count': count})
+                basket.append({'id': product.id, 'count': count})
 
-            request.session['basket'] = basket
-            return Response(get_basket_items_for_user(request))
+            try:
+                guest_basket.save(request.session, basket)
+            except guest_basket.GuestBasketFull:
+                return Response({"error": "Basket is full"}, status=status.HTTP_400_BAD_REQUEST)
+            return basket_response(request, mode, product.id)
 
     def delete(self, request):
         """
         Удаление товара из корзины
         Обрабатывает строку JSON от фронтенда
         """
+        mode = get_basket_response_mode(request)
+        if mode is None:
+            return Response({"error": "Invalid response mode"}, status=status.HTTP_400_BAD_REQUEST)
 
         if request.content_type == 'text/plain;charset=UTF-8' and request.body:
             try:
@@ -1173,22 +1311,16 @@ class BasketView(APIView):
             product_id = request.data.get('id')
             count = int(request.data.get('count', 1))
 
-        if request.user.is_authenticated:
-            try:
-                basket_order = Order.objects.get(user=request.user, status='accepted')
-                order_product = OrderProduct.objects.get(order=basket_order, product_id=product_id)
-
-                if order_product.count > count:
-                    order_product.count -= count
-                    order_product.save()
-                else:
-                    order_product.delete()
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid product ID"}, status=status.HTTP_400_BAD_REQUEST)
 
-                return Response(get_basket_items_for_user(request))
-            except (Order.DoesNotExist, OrderProduct.DoesNotExist):
-                return Response([])
+        if request.user.is_authenticated:
+            remove_from_basket(request.user, product_id, count)
+            return basket_response(request, mode, product_id)
         else:
-            basket = request.session.get('basket', [])
+            basket = guest_basket.load(request.session)
             new_basket = []
 
             for item in basket:
@@ -1199,8 +1331,19 @@ class BasketView(APIView):
                 else:
                     new_basket.append(item)
 
-            request.session['basket'] = new_basket
-            return Response(get_basket_items_for_user(request))
+            guest_basket.save(request.session, new_basket)
+            return basket_response(request, mode, product_id)
+
+
+def payment_response(payment):
+    """Ответ на оплату по сохраненному результату платежа; 202, пока платеж ждет воркера"""
+    if payment.status == 'pending':
+        return Response({"result": "Payment accepted", "status": payment.status}, status=status.HTTP_202_ACCEPTED)
+    if payment.status == 'completed':
+        return Response({"result": "Payment successful"})
+    if payment.error == OUT_OF_STOCK_ERROR:
+        return Response({"error": payment.error}, status=status.HTTP_409_CONFLICT)
+    return Response({"error": payment.error or "Payment failed"}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class PaymentView(APIView):
@@ -1213,63 +1356,41 @@ class PaymentView(APIView):
         except (ValueError, TypeError):
             return Response({"error": "Invalid order ID"}, status=status.HTTP_400_BAD_REQUEST)
 
-        order = get_object_or_404(Order, id=id)
+        order = get_object_or_404(Order.objects.only('id', 'user_id'), id=id)
 
         # Проверяем, что пользователь имеет доступ к заказу
         if not check_order_access(request, order):
             return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
 
-        # Получаем данные для оплаты
-        payment_data = request.data
-
-        # Проверяем номер карты/счета
-        number = payment_data.get('number', '')
-        name = payment_data.get('name', '')
-        month = payment_data.get('month', '')
-        year = payment_data.get('year', '')
-        code = payment_data.get('code', '')
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response({"error": "Invalid Idempotency-Key"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Создаем запись о платеже
-        payment_obj = Payment.objects.create(
-            order=order,
-            number=number,
-            name=name,
-            month=month,
-            year=year,
-            code=code
-        )
+        # Неверный формат номера отклоняется до транзакции, платеж не создается
+        try:
+            parse_number(request.data.get('number', ''))
+        except (ValueError, AttributeError):
+            return Response({"error": "Invalid number format"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Платеж ставится в очередь, банк опрашивает воркер run_payment_worker
+        # (с PAYMENT_INLINE - сразу в запросе); повторная отправка формы получает сохраненный платеж первой
         try:
-            if number:
-                # Проверяем, что номер четный и не заканчивается на 0
-                number_int = int(number.replace(' ', ''))
-                if number_int % 2 != 0 or number_int % 10 == 0:
-                    # Случайная ошибка оплаты
-                    import random
-                    errors = [
-                        "Card number validation failed",
-                        "Payment declined by bank",
-                        "Insufficient funds",
-                        "Card expired"
-                    ]
-                    error_message = random.choice(errors)
-                    order.status = 'cancelled'
-                    order.save()
-                    payment_obj.status = 'failed'
-                    payment_obj.save()
-                    return Response({"error": error_message}, status=status.HTTP_400_BAD_REQUEST)
+            payment, replayed = enqueue_payment(order.id, request.data, idempotency_key or None)
+        except IdempotencyConflict:
+            return Response({"error": "Order already has a payment"}, status=status.HTTP_409_CONFLICT)
+        except InvalidTransition as error:
+            return Response(
+                {"error": "Invalid order status", "status": error.status},
+                status=status.HTTP_409_CONFLICT
+            )
 
-            # Успешная оплата
-            order.status = 'paid'
-            order.save()
-            payment_obj.status = 'completed'
-            payment_obj.save()
-            return Response({"result": "Payment successful"})
+        if PAYMENT_INLINE and payment.status == 'pending':
+            payment = run_payment_now(payment)
 
-        except (ValueError, AttributeError):
-            payment_obj.status = 'failed'
-            payment_obj.save()
-            return Response({"error": "Invalid number format"}, status=status.HTTP_400_BAD_REQUEST)
+        response = payment_response(payment)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
 
 
 class PaymentStatusView(APIView):
@@ -1282,13 +1403,116 @@ class PaymentStatusView(APIView):
         except (ValueError, TypeError):
             return Response({"error": "Invalid order ID"}, status=status.HTTP_400_BAD_REQUEST)
 
-        order = get_object_or_404(Order, id=id)
+        # Заказ, платеж и задача очереди - одним запросом
+        order = get_object_or_404(Order.objects.select_related('payment__job'), id=id)
 
         # Проверяем, что пользователь имеет доступ к заказу
         if not check_order_access(request, order):
             return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
 
-        return Response({
-            "status": order.status,
-            "error": None
-        })
\ No newline at end of file
+        return Response(payment_progress(order))
+
+
+# Канал статуса оплаты: соединение держится открытым, пока статус не изменится
+PAYMENT_STATUS_TIMEOUT = getattr(settings, 'PAYMENT_STATUS_TIMEOUT', 25)
+PAYMENT_STATUS_INTERVAL = getattr(settings, 'PAYMENT_STATUS_INTERVAL', 0.5)
+# Сколько соединений процесса могут одновременно ждать изменения статуса
+PAYMENT_STATUS_MAX_WATCHERS = getattr(settings, 'PAYMENT_STATUS_MAX_WATCHERS', 500)
+
+# Открытые ожидания процесса; счетчик меняется только в цикле событий, блокировка не нужна
+_watchers = 0
+
+
+async def load_payment_progress(order_id):
+    """Заказ, платеж и задача очереди одним запросом"""
+    order = await Order.objects.select_related('payment__job').aget(id=order_id)
+    return order, payment_progress(order)
+
+
+async def watch_payment(order_id, progress, timeout):
+    """
+    Состояние оплаты: текущее и затем каждое изменение, пока оплата не завершится
+    или не истечет timeout. Статус проверяется в базе каждые PAYMENT_STATUS_INTERVAL секунд
+    внутри открытого соединения: без повторной авторизации, сессии и middleware на каждую проверку.
+    Когда ждут уже PAYMENT_STATUS_MAX_WATCHERS соединений, отдается только текущее состояние:
+    клиент переподключится (SSE) или повторит запрос позже, а проверки не перегрузят базу.
+    С timeout 0 (запрос под WSGI) ожидания нет и счетчик не меняется:
+    его меняет только цикл событий ASGI, поэтому блокировка не нужна.
+    """
+    global _watchers
+    yield progress
+    if is_settled(progress) or timeout <= 0 or _watchers >= PAYMENT_STATUS_MAX_WATCHERS:
+        return
+    _watchers += 1
+    try:
+        deadline = time.monotonic() + timeout
+        while not is_settled(progress) and time.monotonic() < deadline:
+            await asyncio.sleep(PAYMENT_STATUS_INTERVAL)
+            try:
+                _, current = await load_payment_progress(order_id)
+            except Order.DoesNotExist:
+                return
+            if current != progress:
+                progress = current
+                yield progress
+    finally:
+        _watchers -= 1
+
+
+def sse_event(progress):
+    return f'data: {json.dumps(progress)}\n\n'
+
+
+async def payment_status_events(order_id, progress, timeout):
+    # Клиент EventSource переподключится через retry мс, если соединение закрыто по таймауту
+    yield f'retry: {int(PAYMENT_STATUS_INTERVAL * 1000)}\n\n'
+    # aclosing освобождает место ожидания сразу при закрытии потока, а не при сборке мусора
+    async with aclosing(watch_payment(order_id, progress, timeout)) as events:
+        async for current in events:
+            yield sse_event(current)
+
+
+async def payment_status_watch(request, id):
+    """
+    GET /api/payment-status/<id>/watch/ - статус оплаты без частого опроса PaymentStatusView.
+
+    - Accept: text/event-stream - поток SSE: событие с текущим статусом и событие на каждое изменение;
+      поток закрывается, когда оплата завершена или истек PAYMENT_STATUS_TIMEOUT
+    - ?since=<статус платежа> - long-poll: ответ приходит, как только статус платежа отличается от since,
+      или по таймауту с текущим статусом
+    - без параметров - текущий статус, как PaymentStatusView
+
+    Соединение держится открытым без занятого потока только под ASGI (backend/asgi.py, например
+    uvicorn backend.asgi:application). Под WSGI поток SSE отдает одно событие и закрывается,
+    а long-poll сразу отвечает текущим статусом.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    try:
+        order, progress = await load_payment_progress(id)
+    except Order.DoesNotExist:
+        raise Http404
+    if not await sync_to_async(check_order_access)(request, order):
+        return JsonResponse({"error": "Access denied"}, status=403)
+
+    # Под WSGI ожидание заняло бы поток воркера, поэтому сразу отдается текущий статус
+    timeout = PAYMENT_STATUS_TIMEOUT if isinstance(request, ASGIRequest) else 0
+
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        response = StreamingHttpResponse(
+            payment_status_events(order.id, progress, timeout), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Отключаем буферизацию ответа в nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    since = request.GET.get('since')
+    if since is not None:
+        async with aclosing(watch_payment(order.id, progress, timeout)) as events:
+            async for progress in events:
+                if (progress['payment'] or '') != since:
+                    break
+    return JsonResponse(progress)
\ No newline at end of file
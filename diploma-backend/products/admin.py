@@ -33,9 +33,11 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('id', 'title', 'category', 'price', 'count', 'available', 'limited', 'freeDelivery', 'rating')
+    list_display = ('id', 'title', 'category', 'price', 'count', 'available', 'limited', 'freeDelivery', 'rating',
+                    'reviews_count')
     list_filter = ('category', 'available', 'limited', 'freeDelivery', 'created_at', 'tags')
     search_fields = ('title', 'description')
+    readonly_fields = ('reviews_count', 'sold_out')
     prepopulated_fields = {'title': ('title',)}
 
     filter_horizontal = ('tags',)
@@ -4,3 +4,5 @@ class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
 
+    def ready(self):
+        from . import signals  # noqa: F401
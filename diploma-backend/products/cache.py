@@ -0,0 +1,167 @@
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+
+CATALOG_CACHE_ALIAS = getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')
+CATALOG_COUNT_TIMEOUT = getattr(settings, 'CATALOG_COUNT_CACHE_TIMEOUT', 60)
+# Ответы сбрасываются сменой версий зависимостей; таймаут ограничивает устаревание
+# данных, которые меняются со временем без записи в базу (начало и конец скидок)
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+# Параметры каталога, которые не влияют на состав выборки
+NON_FILTER_PARAMS = {'sort', 'sortType', 'currentPage', 'limit', 'cursor', 'facets'}
+
+
+def get_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def _version_key(namespace):
+    return f'ns:{namespace}:version'
+
+
+def get_namespace_version(namespace):
+    """
+    Текущая версия пространства имен кэша.
+    Ключи строятся с версией, поэтому инвалидация - это увеличение версии.
+    """
+    cache = get_cache()
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Начальное значение от времени, чтобы после вытеснения ключа
+        # версия не совпала со старой и не вернула устаревшие данные
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_namespace(*namespaces):
+    """Инвалидировать все ключи указанных пространств имен"""
+    cache = get_cache()
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def normalize_params(query_params, exclude=NON_FILTER_PARAMS):
+    """Привести параметры запроса к каноническому виду (порядок ключей и значений не важен)"""
+    return sorted(
+        (key, sorted(query_params.getlist(key)))
+        for key in query_params.keys()
+        if key not in exclude
+    )
+
+
+def params_digest(params):
+    raw = json.dumps(params, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def _get_for_filters(kind, query_params, compute):
+    cache = get_cache()
+    version = get_namespace_version('products')
+    key = f'catalog:{kind}:{version}:{params_digest(normalize_params(query_params))}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, CATALOG_COUNT_TIMEOUT)
+    return value
+
+
+def get_catalog_count(query_params, compute):
+    """
+    Количество товаров каталога для набора фильтров.
+    Кэшируется на CATALOG_COUNT_TIMEOUT секунд и сбрасывается при изменении товаров.
+    """
+    return _get_for_filters('count', query_params, compute)
+
+
+def get_catalog_facets(query_params, compute):
+    """Счетчики значений характеристик для набора фильтров, кэшируются так же, как количество"""
+    return _get_for_filters('facets', query_params, compute)
+
+
+def _stats_key(name, outcome):
+    return f'stats:{name}:{outcome}'
+
+
+def record_cache_access(name, hit):
+    """Увеличить счетчик попаданий или промахов кэша (общий для всех процессов)"""
+    cache = get_cache()
+    key = _stats_key(name, 'hit' if hit else 'miss')
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_cache_stats(names):
+    """Счетчики попаданий и промахов: {имя: {'hit': n, 'miss': n}}"""
+    cache = get_cache()
+    keys = {(name, outcome): _stats_key(name, outcome) for name in names for outcome in ('hit', 'miss')}
+    values = cache.get_many(list(keys.values()))
+    stats = {name: {'hit': 0, 'miss': 0} for name in names}
+    for (name, outcome), key in keys.items():
+        stats[name][outcome] = values.get(key, 0)
+    return stats
+
+
+def reset_cache_stats(names):
+    get_cache().delete_many([_stats_key(name, outcome) for name in names for outcome in ('hit', 'miss')])
+
+
+def response_cache_key(name, request, namespaces):
+    """
+    Ключ ответа: версии всех зависимостей, нормализованная строка запроса и хост
+    (URL изображений в ответах абсолютные).
+    """
+    versions = '.'.join(str(get_namespace_version(namespace)) for namespace in namespaces)
+    digest = params_digest([request.build_absolute_uri('/'), normalize_params(request.query_params, exclude=())])
+    return f'response:{name}:{versions}:{digest}'
+
+
+# Эндпоинты с кэшированными ответами: имена для cache_response и счетчиков response_cache_stats
+# (categories - дерево категорий из products/categories.py, оно кэшируется само)
+CACHED_RESPONSES = ('popular', 'limited', 'sales', 'tags', 'banners', 'categories')
+
+
+def cache_response(name, namespaces, timeout=None):
+    """
+    Кэшировать успешные ответы метода представления для анонимных пользователей.
+
+    namespaces - пространства имен, от которых зависит ответ; запись в любое из них
+    (сигналы в products/signals.py) меняет ключ, остальные ответы остаются в кэше.
+    """
+    if name not in CACHED_RESPONSES:
+        raise ValueError(f'Unknown cached response: {name}')
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return method(view, request, *args, **kwargs)
+
+            cache = get_cache()
+            key = response_cache_key(name, request, namespaces)
+            data = cache.get(key)
+            record_cache_access(name, data is not None)
+            if data is not None:
+                return Response(data)
+
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT if timeout is None else timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,39 @@
+import hashlib
+import json
+from collections import defaultdict
+
+from .cache import get_cache, get_namespace_version, record_cache_access
+from .models import Category
+from .serializers import CategorySerializer
+
+
+CATEGORY_TREE_TIMEOUT = None  # Дерево сбрасывается сменой версии, а не по времени
+
+
+def build_category_tree(request=None):
+    """Построить дерево категорий из одного запроса к Category"""
+    children = defaultdict(list)
+    for category in Category.objects.only('id', 'title', 'image', 'parent').order_by('id'):
+        children[category.parent_id].append(category)
+
+    context = {'request': request, 'children': children}
+    return CategorySerializer(children[None], many=True, context=context).data
+
+
+def get_category_tree(request):
+    """
+    Сериализованное дерево категорий и его ETag.
+    Кэшируется до изменения категорий; ключ учитывает хост, так как URL изображений абсолютные.
+    """
+    cache = get_cache()
+    version = get_namespace_version('categories')
+    key = f'categories:tree:{version}:{request.build_absolute_uri("/")}'
+    cached = cache.get(key)
+    # Дерево само является кэшем ответа (вместе с ETag), счетчики ведутся под именем 'categories'
+    record_cache_access('categories', cached is not None)
+    if cached is None:
+        tree = build_category_tree(request)
+        raw = json.dumps(tree, ensure_ascii=False, sort_keys=True)
+        cached = (tree, '"%s"' % hashlib.md5(raw.encode('utf-8')).hexdigest())
+        cache.set(key, cached, CATEGORY_TREE_TIMEOUT)
+    return cached
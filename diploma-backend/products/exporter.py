@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from .importer import CATEGORY_SEPARATOR, LIST_SEPARATOR, SPEC_SEPARATOR
+from .models import Category, Product
+from .sales import attach_active_sales
+
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+EXPORT_CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Колонки совпадают с полями import_catalog, поэтому выгрузку можно загрузить обратно
+EXPORT_COLUMNS = [
+    'id', 'sku', 'title', 'description', 'price', 'salePrice', 'dateFrom', 'dateTo', 'count', 'available',
+    'is_active', 'limited', 'freeDelivery', 'rating', 'reviews', 'category', 'tags', 'specifications',
+    'images', 'updated_at',
+]
+
+
+def category_paths():
+    """Пути всех категорий "Родитель/Потомок", одним запросом"""
+    categories = {pk: (title, parent_id) for pk, title, parent_id in
+                  Category.objects.values_list('id', 'title', 'parent_id')}
+    paths = {}
+    for pk in categories:
+        titles, current = [], pk
+        while current in categories and len(titles) <= len(categories):
+            title, current = categories[current]
+            titles.append(title)
+        paths[pk] = CATEGORY_SEPARATOR.join(reversed(titles))
+    return paths
+
+
+def _image_url(image, request):
+    if not image.src:
+        return None
+    url = image.src.url
+    return request.build_absolute_uri(url) if request else url
+
+
+def _moment(value):
+    return value.isoformat() if value else None
+
+
+def export_products(since=None, chunk_size=1000, request=None):
+    """
+    Товары каталога в виде словарей, по одному, с постоянным расходом памяти.
+
+    Товары читаются через iterator(chunk_size): изображения, теги и характеристики
+    подгружаются prefetch_related на каждый пакет, действующие скидки - одним запросом на пакет.
+    since - выгрузить только товары, измененные начиная с этого момента. В инкрементальную
+    выгрузку попадают и деактивированные товары (is_active=false): так партнер снимает их с продажи.
+    """
+    paths = category_paths()
+    queryset = Product.objects.prefetch_related('images', 'tags', 'specifications').order_by('id')
+    if since is None:
+        queryset = queryset.filter(is_active=True)
+    else:
+        queryset = queryset.filter(updated_at__gte=since)
+
+    products = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(products, chunk_size))
+        if not chunk:
+            break
+        attach_active_sales(chunk)
+        for product in chunk:
+            sale = product.active_sale
+            yield {
+                'id': product.id,
+                'sku': product.sku,
+                'title': product.title,
+                'description': product.description,
+                'price': str(product.price),
+                'salePrice': str(sale.salePrice) if sale else None,
+                # Даты выгружаются вместе с ценой: без них импорт создал бы бессрочную скидку
+                'dateFrom': _moment(sale.dateFrom) if sale else None,
+                'dateTo': _moment(sale.dateTo) if sale else None,
+                'count': product.count,
+                'available': product.available,
+                'is_active': product.is_active,
+                'limited': product.limited,
+                'freeDelivery': product.freeDelivery,
+                'rating': product.rating,
+                'reviews': product.reviews_count,
+                'category': paths.get(product.category_id),
+                'tags': [tag.name for tag in product.tags.all()],
+                'specifications': [{'name': spec.name, 'value': spec.value}
+                                   for spec in product.specifications.all()],
+                'images': [url for url in (_image_url(image, request) for image in product.images.all()) if url],
+                'updated_at': product.updated_at.isoformat(),
+            }
+
+
+def _csv_value(column, value):
+    if value is None:
+        return ''
+    if column == 'specifications':
+        return LIST_SEPARATOR.join(f'{spec["name"]}{SPEC_SEPARATOR}{spec["value"]}' for spec in value)
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+def render_lines(rows, fmt):
+    """Строки файла выгрузки (JSONL или CSV с заголовком) для потоковой записи"""
+    if fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(EXPORT_COLUMNS)
+    for row in rows:
+        yield line([_csv_value(column, row[column]) for column in EXPORT_COLUMNS])
@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from django.db.models import Count, Min, Q
+
+from .models import Specification
+
+
+def group_facet_filters(facets):
+    """Объединить фильтры по нормализованному имени характеристики: {name_key: {value_key, ...}}"""
+    grouped = defaultdict(set)
+    for name, values in facets.items():
+        for value in values:
+            grouped[Specification.normalize(name)].add(Specification.normalize(value))
+    return grouped
+
+
+def filter_by_facets(queryset, facets):
+    """
+    Отфильтровать товары по характеристикам {имя: [значения]}.
+
+    Значения одной характеристики объединяются по ИЛИ, разные характеристики - по И.
+    Пересечение считается одним сгруппированным подзапросом по фасетному индексу
+    (name_key, value_key, product), без отдельного JOIN на каждый фильтр.
+    """
+    grouped = group_facet_filters(facets)
+    if not grouped:
+        return queryset
+
+    condition = Q()
+    for name_key, value_keys in grouped.items():
+        condition |= Q(name_key=name_key, value_key__in=value_keys)
+
+    matching = Specification.objects.filter(condition).values('product_id').annotate(
+        matched=Count('name_key', distinct=True)
+    ).filter(matched=len(grouped)).values('product_id')
+    return queryset.filter(id__in=matching)
+
+
+def facet_counts(queryset):
+    """
+    Количество товаров по каждому значению каждой характеристики в выборке queryset.
+    Возвращает [{'name': ..., 'values': [{'value': ..., 'count': ...}]}].
+    """
+    rows = Specification.objects.filter(product_id__in=queryset.values('id')).values(
+        'name_key', 'value_key'
+    ).annotate(
+        count=Count('product_id', distinct=True),
+        name=Min('name'),
+        value=Min('value'),
+    ).order_by('name_key', 'value_key')
+
+    facets = []
+    for row in rows:
+        if not facets or facets[-1]['key'] != row['name_key']:
+            facets.append({'key': row['name_key'], 'name': row['name'], 'values': []})
+        facets[-1]['values'].append({'value': row['value'], 'count': row['count']})
+
+    for facet in facets:
+        del facet['key']
+    return facets
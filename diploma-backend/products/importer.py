@@ -0,0 +1,366 @@
+import csv
+import datetime
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .cache import bump_namespace
+from .models import Category, Product, Sale, Specification, Tag
+from .rankings import rebuild_rankings
+from .signals import bulk_operation
+
+
+# Разделители в CSV: путь категории "Электроника/Ноутбуки", теги "a|b",
+# характеристики "Цвет=Красный|Память=16 ГБ"
+CATEGORY_SEPARATOR = '/'
+LIST_SEPARATOR = '|'
+SPEC_SEPARATOR = '='
+
+TRUE_VALUES = {'1', 'true', 'yes', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'нет'}
+
+
+class ImportRowError(ValueError):
+    """Строка файла импорта не может быть загружена"""
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(value)
+
+
+def parse_decimal(value):
+    try:
+        return Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(value)
+
+
+def parse_moment(value):
+    """Дата или дата со временем; наивные значения считаются в часовом поясе проекта"""
+    text = str(value).strip()
+    moment = parse_datetime(text)
+    if moment is None:
+        date = parse_date(text)
+        if date is None:
+            raise ValueError(value)
+        moment = datetime.datetime.combine(date, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+# Поля товара, которые можно передать в файле, и функции разбора значений
+PRODUCT_FIELDS = {
+    'title': str,
+    'description': str,
+    'fullDescription': str,
+    'price': parse_decimal,
+    'count': int,
+    'rating': float,
+    'limited': parse_bool,
+    'freeDelivery': parse_bool,
+    'available': parse_bool,
+    'is_active': parse_bool,
+}
+
+SALE_FIELDS = {
+    'salePrice': parse_decimal,
+    'dateFrom': parse_moment,
+    'dateTo': parse_moment,
+}
+
+
+def read_rows(stream, fmt):
+    """
+    Читать файл построчно, не загружая его целиком.
+    Возвращает пары (номер строки, строка): dict для CSV, текст для JSONL.
+    """
+    if fmt == 'csv':
+        # Первая строка CSV - заголовок
+        yield from enumerate(csv.DictReader(stream), start=2)
+    else:
+        for line, raw in enumerate(stream, start=1):
+            if raw.strip():
+                yield line, raw
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _split(value):
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(LIST_SEPARATOR) if part.strip()]
+    return [str(part).strip() for part in value if str(part).strip()]
+
+
+def _parse_specifications(value):
+    if isinstance(value, dict):
+        pairs = value.items()
+    elif isinstance(value, list) and all(isinstance(item, dict) for item in value):
+        pairs = [(item.get('name'), item.get('value')) for item in value]
+    else:
+        pairs = []
+        for part in _split(value):
+            name, separator, spec_value = part.partition(SPEC_SEPARATOR)
+            if not separator:
+                raise ImportRowError(f'specifications: ожидается "имя{SPEC_SEPARATOR}значение", получено "{part}"')
+            pairs.append((name, spec_value))
+
+    specifications = []
+    for name, spec_value in pairs:
+        name, spec_value = str(name or '').strip(), str(spec_value or '').strip()
+        if not name:
+            raise ImportRowError('specifications: пустое имя характеристики')
+        specifications.append((name, spec_value))
+    return specifications
+
+
+def parse_row(row):
+    """
+    Привести строку файла к виду {'sku', 'fields', 'category', 'tags', 'specifications', 'sale'}.
+    Пустые и отсутствующие значения не меняют данные существующего товара (None).
+    """
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as error:
+            raise ImportRowError(f'некорректный JSON: {error.msg}')
+    if not isinstance(row, dict):
+        raise ImportRowError('ожидается объект')
+
+    sku = '' if _is_empty(row.get('sku')) else str(row['sku']).strip()
+    if not sku:
+        raise ImportRowError('не указан sku')
+
+    fields = {}
+    for name, parser in PRODUCT_FIELDS.items():
+        if not _is_empty(row.get(name)):
+            try:
+                fields[name] = parser(row[name])
+            except (ValueError, TypeError):
+                raise ImportRowError(f'{name}: некорректное значение "{row[name]}"')
+
+    category = None
+    if not _is_empty(row.get('category')):
+        value = row['category']
+        parts = value.split(CATEGORY_SEPARATOR) if isinstance(value, str) else value
+        category = tuple(str(part).strip() for part in parts if str(part).strip()) or None
+
+    sale = None
+    if not _is_empty(row.get('salePrice')):
+        sale = {}
+        for name, parser in SALE_FIELDS.items():
+            if not _is_empty(row.get(name)):
+                try:
+                    sale[name] = parser(row[name])
+                except (ValueError, TypeError):
+                    raise ImportRowError(f'{name}: некорректное значение "{row[name]}"')
+
+    return {
+        'sku': sku,
+        'fields': fields,
+        'category': category,
+        'tags': None if _is_empty(row.get('tags')) else _split(row['tags']),
+        'specifications': None if _is_empty(row.get('specifications'))
+        else _parse_specifications(row['specifications']),
+        'sale': sale,
+    }
+
+
+class CatalogImporter:
+    """
+    Загрузка каталога пакетами: товары создаются и обновляются по sku
+    одним bulk_create(update_conflicts=True) на пакет.
+
+    Теги и характеристики из строки заменяют прежние значения товара,
+    скидка - прежние импортированные скидки (скидки из админки сохраняются).
+    Обработчики сигналов на время загрузки отключены; кэши каталога сбрасываются
+    и списки лучших товаров пересобираются один раз в конце (finish).
+    """
+
+    def __init__(self, batch_size=1000, on_error=None, on_batch=None):
+        self.batch_size = max(batch_size, 1)
+        self.on_error = on_error
+        self.on_batch = on_batch
+        self.categories = {}  # путь категории -> id
+        self.tags = {}  # название тега -> id
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'errors': 0}
+        self.started = None
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started else 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.stats['rows'] / self.elapsed if self.elapsed else 0.0
+
+    def error(self, line, message):
+        self.stats['errors'] += 1
+        if self.on_error:
+            self.on_error(line, message)
+
+    def run(self, rows):
+        """Загрузить строки из read_rows"""
+        self.started = time.monotonic()
+        batch = []
+        with bulk_operation():
+            for line, row in rows:
+                self.stats['rows'] += 1
+                try:
+                    batch.append((line, parse_row(row)))
+                except ImportRowError as error:
+                    self.error(line, str(error))
+                if len(batch) >= self.batch_size:
+                    self.flush(batch)
+                    batch = []
+            if batch:
+                self.flush(batch)
+        self.finish()
+        return self.stats
+
+    def flush(self, batch):
+        # Повтор sku внутри пакета: побеждает последняя строка
+        rows = {}
+        for line, row in batch:
+            rows[row['sku']] = (line, row)
+
+        with transaction.atomic():
+            products = self.save_products(rows)
+            self.save_tags(products, rows)
+            self.save_specifications(products, rows)
+            self.save_sales(products, rows)
+
+        if self.on_batch:
+            self.on_batch(self)
+
+    def save_products(self, rows):
+        """
+        Upsert товаров пакета: INSERT ... ON CONFLICT (sku) DO UPDATE.
+        Строки группируются по набору переданных полей, чтобы не затирать
+        у существующих товаров поля, которых нет в файле.
+        """
+        # Существующие товары загружаются целиком: INSERT должен пройти проверки NOT NULL
+        # до разрешения конфликта, даже если обновляется одно поле
+        existing = Product.objects.filter(sku__in=list(rows)).in_bulk(field_name='sku')
+        groups = {}
+        for sku, (line, row) in list(rows.items()):
+            product = existing.get(sku)
+            if product is None:
+                missing = [name for name in ('title', 'price') if name not in row['fields']]
+                if row['category'] is None:
+                    missing.append('category')
+                if missing:
+                    self.error(line, f'для нового товара не указаны поля: {", ".join(missing)}')
+                    del rows[sku]
+                    continue
+
+                product = Product(sku=sku, description='')
+
+            for name, value in row['fields'].items():
+                setattr(product, name, value)
+            update_fields = list(row['fields'])
+            if row['category'] is not None:
+                product.category_id = self.resolve_category(row['category'])
+                update_fields.append('category')
+            groups.setdefault(tuple(sorted(update_fields)), []).append(product)
+
+        products = {}
+        for update_fields, group in groups.items():
+            if update_fields:
+                # Конфликт разрешается по sku, поэтому id существующих товаров в INSERT не передается;
+                # PostgreSQL и SQLite возвращают id и для обновленных строк
+                for product in group:
+                    product.pk = None
+                Product.objects.bulk_create(group, update_conflicts=True, unique_fields=['sku'],
+                                            update_fields=[*update_fields, 'updated_at'])
+                if 'count' in update_fields and 'available' not in update_fields:
+                    # Пополненный остаток возвращает товары, скрытые из-за нулевого остатка
+                    Product.objects.filter(id__in=[product.id for product in group]).restore_sold_out()
+            else:
+                # Переданы только теги, характеристики или скидка
+                Product.objects.filter(id__in=[product.id for product in group]).touch()
+            products.update((product.sku, product) for product in group)
+
+        updated = sum(1 for sku in products if sku in existing)
+        self.stats['created'] += len(products) - updated
+        self.stats['updated'] += updated
+        return products
+
+    def resolve_category(self, path):
+        parent_id = None
+        for depth in range(1, len(path) + 1):
+            key = path[:depth]
+            if key not in self.categories:
+                category = Category.objects.filter(title=key[-1], parent_id=parent_id).order_by('id').first()
+                if category is None:
+                    category = Category.objects.create(title=key[-1], parent_id=parent_id)
+                self.categories[key] = category.id
+            parent_id = self.categories[key]
+        return parent_id
+
+    def resolve_tags(self, names):
+        missing = {name for name in names if name not in self.tags}
+        if missing:
+            for tag_id, name in Tag.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+                self.tags[name] = tag_id
+            new_tags = Tag.objects.bulk_create([Tag(name=name) for name in missing if name not in self.tags])
+            for tag in new_tags:
+                self.tags[tag.name] = tag.id
+        return [self.tags[name] for name in names]
+
+    def save_tags(self, products, rows):
+        tagged = {sku: row['tags'] for sku, (_, row) in rows.items() if row['tags'] is not None}
+        if not tagged:
+            return
+        through = Product.tags.through
+        through.objects.filter(product_id__in=[products[sku].id for sku in tagged]).delete()
+        through.objects.bulk_create([
+            through(product_id=products[sku].id, tag_id=tag_id)
+            for sku, names in tagged.items()
+            for tag_id in set(self.resolve_tags(names))
+        ])
+
+    def save_specifications(self, products, rows):
+        specified = {sku: row['specifications'] for sku, (_, row) in rows.items()
+                     if row['specifications'] is not None}
+        if not specified:
+            return
+        Specification.objects.filter(product_id__in=[products[sku].id for sku in specified]).delete()
+        specifications = []
+        for sku, pairs in specified.items():
+            for name, value in pairs:
+                specification = Specification(product_id=products[sku].id, name=name, value=value)
+                # bulk_create не вызывает pre_save, ключи фасетов заполняются здесь
+                specification.fill_keys()
+                specifications.append(specification)
+        Specification.objects.bulk_create(specifications, batch_size=self.batch_size)
+
+    def save_sales(self, products, rows):
+        sales = {sku: row['sale'] for sku, (_, row) in rows.items() if row['sale'] is not None}
+        if not sales:
+            return
+        product_ids = [products[sku].id for sku in sales]
+        # Заменяются только скидки прежних импортов; созданные в админке остаются
+        Sale.objects.filter(product_id__in=product_ids, imported=True).delete()
+        Sale.objects.bulk_create([
+            Sale(product_id=products[sku].id, price=products[sku].price, title=products[sku].title,
+                 imported=True, **sale)
+            for sku, sale in sales.items()
+        ])
+
+    def finish(self):
+        bump_namespace('products', 'sales', 'tags', 'categories')
+        rebuild_rankings()
@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Category, Product, Tag
+from products.tags import TAG_MATCH_ALL, TAG_MATCH_ANY, filter_by_tags
+
+
+class Rollback(Exception):
+    """Откатить тестовые данные после замеров"""
+
+
+class Command(BaseCommand):
+    help = ('Сравнить время фильтрации каталога по тегам: цепочка JOIN на каждый тег '
+            'и один сгруппированный подзапрос. Данные создаются во временной транзакции')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Количество товаров')
+        parser.add_argument('--tags', type=int, default=8, help='Количество тегов')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов на каждый замер')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                tag_ids = self.create_data(options['products'], options['tags'])
+                self.run(tag_ids, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_data(self, products_count, tags_count):
+        category = Category.objects.create(title='Benchmark')
+        tags = Tag.objects.bulk_create([Tag(name=f'benchmark-{i}') for i in range(tags_count)])
+        products = Product.objects.bulk_create([
+            Product(category=category, title=f'Benchmark {i}', price=1) for i in range(products_count)
+        ])
+
+        # Товар i получает теги, номера которых делят i: чем больше тегов, тем меньше товаров
+        through = Product.tags.through
+        links = [
+            through(product_id=product.id, tag_id=tag.id)
+            for i, product in enumerate(products)
+            for n, tag in enumerate(tags, start=1)
+            if i % n == 0
+        ]
+        through.objects.bulk_create(links, batch_size=1000)
+        return [tag.id for tag in tags]
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.values_list('id', flat=True)[:20])
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    def run(self, tag_ids, repeat):
+        base = Product.objects.filter(is_active=True, available=True).order_by('-created_at', '-id')
+        self.stdout.write(f'{"тегов":>6} {"JOIN, мс":>10} {"all, мс":>10} {"any, мс":>10} {"найдено":>8}')
+
+        for count in range(1, len(tag_ids) + 1):
+            selected = tag_ids[:count]
+            chained = base
+            for tag_id in selected:
+                chained = chained.filter(tags__id=tag_id)
+            grouped = filter_by_tags(base, selected, TAG_MATCH_ALL)
+
+            self.stdout.write(
+                f'{count:>6} '
+                f'{self.measure(chained, repeat):>10.2f} '
+                f'{self.measure(grouped, repeat):>10.2f} '
+                f'{self.measure(filter_by_tags(base, selected, TAG_MATCH_ANY), repeat):>10.2f} '
+                f'{grouped.count():>8}'
+            )
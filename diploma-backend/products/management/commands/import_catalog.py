@@ -0,0 +1,56 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Загрузить товары из CSV или JSONL: файл читается построчно, товары '
+            'создаются и обновляются по sku пакетами через bulk_create(update_conflicts=True)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или "-" для чтения из stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Формат файла; по умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одном пакете')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or self.detect_format(path)
+        verbosity = options['verbosity']
+
+        def on_error(line, message):
+            self.stderr.write(f'Строка {line}: {message}')
+
+        def on_batch(importer):
+            if verbosity >= 2:
+                self.stdout.write(
+                    f'Обработано строк: {importer.stats["rows"]}, {importer.rows_per_second:.0f} строк/с'
+                )
+
+        importer = CatalogImporter(options['batch_size'], on_error=on_error, on_batch=on_batch)
+        if path == '-':
+            stats = importer.run(read_rows(sys.stdin, fmt))
+        else:
+            try:
+                stream = open(path, encoding='utf-8-sig', newline='')
+            except OSError as error:
+                raise CommandError(f'Не удалось открыть файл: {error}')
+            with stream:
+                stats = importer.run(read_rows(stream, fmt))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк: {stats["rows"]}, создано: {stats["created"]}, обновлено: {stats["updated"]}, '
+            f'ошибок: {stats["errors"]}, время: {importer.elapsed:.1f} с, '
+            f'скорость: {importer.rows_per_second:.0f} строк/с'
+        ))
+
+    def detect_format(self, path):
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            return 'csv'
+        if extension in ('.jsonl', '.ndjson'):
+            return 'jsonl'
+        raise CommandError('Не удалось определить формат файла, укажите --format')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.rankings import rebuild_rankings
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать денормализованные поля товаров (количество отзывов, рейтинг) '
+            'и списки лучших товаров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', dest='products',
+                            help='ID товара (можно указать несколько раз); по умолчанию - все товары')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Товаров в одном UPDATE, чтобы не блокировать всю таблицу надолго')
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.all()
+        if options['products']:
+            queryset = queryset.filter(pk__in=options['products'])
+
+        # Пересчет диапазонами id: каждый UPDATE затрагивает не больше batch_size товаров
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        batch_size = max(options['batch_size'], 1)
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            queryset.filter(id__gte=batch[0], id__lte=batch[-1]).refresh_stats()
+
+        rebuild_rankings()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено товаров: {len(ids)}'))
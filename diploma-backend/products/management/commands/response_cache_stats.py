@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from products.cache import CACHED_RESPONSES, get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показать счетчики попаданий и промахов кэша ответов каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats(CACHED_RESPONSES)
+        self.stdout.write(f'{"эндпоинт":<12} {"попаданий":>10} {"промахов":>10} {"доля":>6}')
+        for name, counters in stats.items():
+            total = counters['hit'] + counters['miss']
+            ratio = counters['hit'] / total if total else 0
+            self.stdout.write(f'{name:<12} {counters["hit"]:>10} {counters["miss"]:>10} {ratio:>6.0%}')
+
+        if options['reset']:
+            reset_cache_stats(CACHED_RESPONSES)
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 22:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_product_stats(apps, schema_editor):
+    """Заполнить денормализованные поля для существующих товаров"""
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        total=Count('id')
+    ).values('total')
+
+    Product.objects.update(reviews_count=Coalesce(Subquery(reviews), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_category_products_ca_parent__f3c24e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['reviews_count'], name='products_pr_reviews_fd77f8_idx'),
+        ),
+        migrations.RunPython(fill_product_stats, migrations.RunPython.noop),
+    ]
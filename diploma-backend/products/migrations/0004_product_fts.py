@@ -0,0 +1,101 @@
+# Generated by Django 6.0 on 2026-10-17 22:40
+
+from django.db import migrations
+
+
+FTS_TABLE = 'products_product_fts'
+
+# Переиндексация одного товара: название, описание и все характеристики одной строкой
+REINDEX_SQL = f"""
+    DELETE FROM {FTS_TABLE} WHERE rowid = {{id}};
+    INSERT INTO {FTS_TABLE}(rowid, title, description, specifications)
+    SELECT p.id, p.title, p.description,
+           COALESCE((SELECT group_concat(s.name || ' ' || s.value, ' ')
+                     FROM products_specification s WHERE s.product_id = p.id), '')
+    FROM products_product p WHERE p.id = {{id}};
+"""
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, description, specifications,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER products_product_fts_ai AFTER INSERT ON products_product BEGIN
+        {REINDEX_SQL.format(id='NEW.id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_product_fts_au AFTER UPDATE OF title, description ON products_product BEGIN
+        {REINDEX_SQL.format(id='NEW.id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_product_fts_ad AFTER DELETE ON products_product BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_specification_fts_ai AFTER INSERT ON products_specification BEGIN
+        {REINDEX_SQL.format(id='NEW.product_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_specification_fts_au AFTER UPDATE ON products_specification BEGIN
+        {REINDEX_SQL.format(id='OLD.product_id')}
+        {REINDEX_SQL.format(id='NEW.product_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_specification_fts_ad AFTER DELETE ON products_specification BEGIN
+        {REINDEX_SQL.format(id='OLD.product_id')}
+    END
+    """,
+    f"""
+    INSERT INTO {FTS_TABLE}(rowid, title, description, specifications)
+    SELECT p.id, p.title, p.description,
+           COALESCE((SELECT group_concat(s.name || ' ' || s.value, ' ')
+                     FROM products_specification s WHERE s.product_id = p.id), '')
+    FROM products_product p
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS products_product_fts_ai',
+    'DROP TRIGGER IF EXISTS products_product_fts_au',
+    'DROP TRIGGER IF EXISTS products_product_fts_ad',
+    'DROP TRIGGER IF EXISTS products_specification_fts_ai',
+    'DROP TRIGGER IF EXISTS products_specification_fts_au',
+    'DROP TRIGGER IF EXISTS products_specification_fts_ad',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+# На других СУБД индекс не нужен: PostgreSQL ищет через to_tsvector/tsquery (products/search.py)
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FORWARD)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_reviews_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-17 22:11
+
+from django.db import migrations, models
+
+from ._fts import create_triggers, drop_triggers
+
+
+def normalize(text):
+    return ' '.join((text or '').split()).casefold()
+
+
+def fill_facet_keys(apps, schema_editor):
+    """Заполнить нормализованные ключи существующих характеристик"""
+    Specification = apps.get_model('products', 'Specification')
+    batch = []
+    for spec in Specification.objects.only('id', 'name', 'value').iterator(chunk_size=1000):
+        spec.name_key = normalize(spec.name)
+        spec.value_key = normalize(spec.value)
+        batch.append(spec)
+        if len(batch) >= 1000:
+            Specification.objects.bulk_update(batch, ['name_key', 'value_key'])
+            batch = []
+    if batch:
+        Specification.objects.bulk_update(batch, ['name_key', 'value_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_fts'),
+    ]
+
+    # Добавление полей перестраивает таблицу характеристик в SQLite,
+    # поэтому триггеры полнотекстового индекса снимаются на время миграции
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='specification',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='specification',
+            name='value_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='specification',
+            index=models.Index(fields=['name_key', 'value_key', 'product'], name='products_sp_name_ke_4b8045_idx'),
+        ),
+        migrations.RunPython(fill_facet_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
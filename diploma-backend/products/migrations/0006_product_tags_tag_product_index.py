@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-17 23:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_specification_facet_keys'),
+    ]
+
+    # Промежуточная таблица тегов создается Django автоматически, поэтому
+    # составной индекс для фильтра по тегам (tag_id IN ... GROUP BY product_id) задается через SQL
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX products_product_tags_tag_product_idx '
+            'ON products_product_tags (tag_id, product_id)',
+            'DROP INDEX products_product_tags_tag_product_idx',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-17 23:40
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from ._fts import create_triggers, drop_triggers
+
+
+def fill_rating(apps, schema_editor):
+    """Пересчитать количество, сумму оценок и рейтинг товаров, у которых есть отзывы"""
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        reviews_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), Value(0)),
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rate')).values('total')), Value(0)),
+        rating=Coalesce(Subquery(reviews.annotate(average=Avg('rate')).values('average')), F('rating')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_tags_tag_product_index'),
+    ]
+
+    # Добавление поля перестраивает таблицу товаров в SQLite,
+    # поэтому триггеры полнотекстового индекса снимаются на время миграции
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating, migrations.RunPython.noop),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
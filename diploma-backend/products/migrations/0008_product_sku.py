@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+from ._fts import create_triggers, drop_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_rating_sum'),
+    ]
+
+    # Уникальное поле добавляется перестройкой таблицы товаров в SQLite,
+    # поэтому триггеры полнотекстового индекса снимаются на время миграции
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Артикул'),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-18 00:45
+
+from django.db import migrations, models
+from django.db.models import F
+
+from ._fts import create_triggers, drop_triggers
+
+
+def fill_updated_at(apps, schema_editor):
+    """Существующие товары считаются измененными в момент создания"""
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_sku'),
+    ]
+
+    # Добавление поля перестраивает таблицу товаров в SQLite,
+    # поэтому триггеры полнотекстового индекса снимаются на время миграции
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='products_pr_updated_150263_idx'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 03:20
+
+from django.db import migrations
+
+from ._fts import create_mysql_index, drop_mysql_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_updated_at'),
+    ]
+
+    # Индексы FULLTEXT создаются только на MySQL; на SQLite и PostgreSQL миграция ничего не делает
+    operations = [
+        migrations.RunPython(create_mysql_index, drop_mysql_index),
+    ]
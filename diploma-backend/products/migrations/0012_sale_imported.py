@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_mysql_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='imported',
+            field=models.BooleanField(default=False, verbose_name='Загружена импортом'),
+        ),
+    ]
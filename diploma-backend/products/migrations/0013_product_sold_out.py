@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+from ._fts import create_triggers, drop_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_sale_imported'),
+    ]
+
+    # Новое поле перестраивает таблицу товаров в SQLite,
+    # поэтому триггеры полнотекстового индекса снимаются на время миграции
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='sold_out',
+            field=models.BooleanField(default=False, verbose_name='Распродан'),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
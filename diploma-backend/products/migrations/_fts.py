@@ -0,0 +1,129 @@
+"""
+SQL полнотекстового индекса товаров: FTS5 для SQLite и FULLTEXT для MySQL.
+
+Триггеры FTS5 нужно пересоздавать в миграциях, которые перестраивают таблицы
+products_product и products_specification: SQLite при пересоздании таблицы удаляет ее триггеры,
+а триггеры товара ссылаются на таблицу характеристик и ломают переименование временной таблицы.
+Миграция 0004, создавшая индекс, содержит собственную копию того же SQL и не меняется;
+последующие миграции используют этот модуль.
+Модуль начинается с подчеркивания, поэтому загрузчик миграций его пропускает.
+"""
+
+FTS_TABLE = 'products_product_fts'
+
+# Переиндексация одного товара: название, описание и все характеристики одной строкой
+REINDEX_SQL = f"""
+    DELETE FROM {FTS_TABLE} WHERE rowid = {{id}};
+    INSERT INTO {FTS_TABLE}(rowid, title, description, specifications)
+    SELECT p.id, p.title, p.description,
+           COALESCE((SELECT group_concat(s.name || ' ' || s.value, ' ')
+                     FROM products_specification s WHERE s.product_id = p.id), '')
+    FROM products_product p WHERE p.id = {{id}};
+"""
+
+CREATE_TABLE = f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, description, specifications,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+CREATE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER products_product_fts_ai AFTER INSERT ON products_product BEGIN
+        {REINDEX_SQL.format(id='NEW.id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_product_fts_au AFTER UPDATE OF title, description ON products_product BEGIN
+        {REINDEX_SQL.format(id='NEW.id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_product_fts_ad AFTER DELETE ON products_product BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_specification_fts_ai AFTER INSERT ON products_specification BEGIN
+        {REINDEX_SQL.format(id='NEW.product_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_specification_fts_au AFTER UPDATE ON products_specification BEGIN
+        {REINDEX_SQL.format(id='OLD.product_id')}
+        {REINDEX_SQL.format(id='NEW.product_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_specification_fts_ad AFTER DELETE ON products_specification BEGIN
+        {REINDEX_SQL.format(id='OLD.product_id')}
+    END
+    """,
+]
+
+DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS products_product_fts_ai',
+    'DROP TRIGGER IF EXISTS products_product_fts_au',
+    'DROP TRIGGER IF EXISTS products_product_fts_ad',
+    'DROP TRIGGER IF EXISTS products_specification_fts_ai',
+    'DROP TRIGGER IF EXISTS products_specification_fts_au',
+    'DROP TRIGGER IF EXISTS products_specification_fts_ad',
+]
+
+# Полная переиндексация всех товаров
+REBUILD = [
+    f'DELETE FROM {FTS_TABLE}',
+    f"""
+    INSERT INTO {FTS_TABLE}(rowid, title, description, specifications)
+    SELECT p.id, p.title, p.description,
+           COALESCE((SELECT group_concat(s.name || ' ' || s.value, ' ')
+                     FROM products_specification s WHERE s.product_id = p.id), '')
+    FROM products_product p
+    """,
+]
+
+
+# MySQL: индексы FULLTEXT на товаре и характеристиках, поиск через MATCH ... AGAINST (products/search.py)
+MYSQL_CREATE = [
+    'CREATE FULLTEXT INDEX products_product_ft ON products_product (title, description)',
+    'CREATE FULLTEXT INDEX products_specification_ft ON products_specification (name, value)',
+]
+
+MYSQL_DROP = [
+    'DROP INDEX products_product_ft ON products_product',
+    'DROP INDEX products_specification_ft ON products_specification',
+]
+
+
+def _run(schema_editor, statements, vendor='sqlite'):
+    # На других СУБД индекс не нужен: PostgreSQL ищет через to_tsvector/tsquery (products/search.py)
+    if schema_editor.connection.vendor == vendor:
+        for statement in statements:
+            schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, [CREATE_TABLE, *CREATE_TRIGGERS, *REBUILD])
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, [*DROP_TRIGGERS, f'DROP TABLE IF EXISTS {FTS_TABLE}'])
+
+
+def drop_triggers(apps, schema_editor):
+    _run(schema_editor, DROP_TRIGGERS)
+
+
+def create_triggers(apps, schema_editor):
+    """Вернуть триггеры и переиндексировать товары после перестройки таблиц"""
+    _run(schema_editor, [*DROP_TRIGGERS, *CREATE_TRIGGERS, *REBUILD])
+
+
+def create_mysql_index(apps, schema_editor):
+    _run(schema_editor, MYSQL_CREATE, vendor='mysql')
+
+
+def drop_mysql_index(apps, schema_editor):
+    _run(schema_editor, MYSQL_DROP, vendor='mysql')
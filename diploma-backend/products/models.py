@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
 
 
 class Category(models.Model):
@@ -31,7 +34,59 @@ class Tag(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def refresh_rating(self):
+        """
+        Пересчитать количество отзывов, сумму оценок и рейтинг одним UPDATE.
+        У товаров без отзывов рейтинг не меняется (он мог быть задан вручную).
+        """
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        return self.update(
+            reviews_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), Value(0)),
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rate')).values('total')), Value(0)),
+            rating=Coalesce(Subquery(reviews.annotate(average=Avg('rate')).values('average')), F('rating')),
+        )
+
+    def touch(self):
+        """Отметить товары измененными без вызова save() (update() не обновляет auto_now)"""
+        return self.update(updated_at=timezone.now())
+
+    def add_rating(self, rate):
+        """Учесть новую оценку: счетчик, сумма и средний рейтинг меняются одним атомарным UPDATE"""
+        return self.update(
+            updated_at=timezone.now(),
+            reviews_count=F('reviews_count') + 1,
+            rating_sum=F('rating_sum') + rate,
+            rating=Cast(F('rating_sum') + rate, FloatField()) / (F('reviews_count') + 1),
+        )
+
+    def remove_rating(self, rate):
+        """Исключить оценку удаленного отзыва; после последнего отзыва рейтинг сохраняется"""
+        return self.filter(reviews_count__gt=0).update(
+            updated_at=timezone.now(),
+            reviews_count=F('reviews_count') - 1,
+            rating_sum=F('rating_sum') - rate,
+            rating=Case(
+                When(reviews_count__gt=1,
+                     then=Cast(F('rating_sum') - rate, FloatField()) / (F('reviews_count') - 1)),
+                default=F('rating'),
+            ),
+        )
+
+    def restore_sold_out(self):
+        """Снова сделать доступными товары, которые скрыл закончившийся остаток, если остаток пополнен"""
+        return self.filter(sold_out=True, count__gt=0).update(
+            available=True, sold_out=False, updated_at=timezone.now()
+        )
+
+    def refresh_stats(self):
+        """Пересчитать все денормализованные поля"""
+        self.refresh_rating()
+
+
 class Product(models.Model):
+    # Внешний артикул, по нему import_catalog находит существующие товары
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name='Артикул')
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name='Категория')
     title = models.CharField(max_length=200, verbose_name='Название')
     description = models.TextField(verbose_name='Краткое описание')
@@ -42,9 +97,22 @@ class Product(models.Model):
     freeDelivery = models.BooleanField(default=False, verbose_name='Бесплатная доставка')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    # Меняется и при изменении характеристик, тегов, изображений, скидок и рейтинга (products/signals.py);
+    # по нему export_catalog выгружает только измененные товары
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
     rating = models.FloatField(default=0, verbose_name='Рейтинг')
     tags = models.ManyToManyField(Tag, blank=True, verbose_name='Теги')
     available = models.BooleanField(default=True, verbose_name='Доступен для покупки')
+    # available снят резервированием, когда закончился остаток (orders/stock.py), а не вручную:
+    # только такую недоступность возврат резерва и пополнение остатка снимают автоматически
+    sold_out = models.BooleanField(default=False, verbose_name='Распродан')
+    # Денормализованные поля, поддерживаются сигналами (products/signals.py)
+    # и пересчитываются командой rebuild_product_stats
+    reviews_count = models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')
+    # rating = rating_sum / reviews_count, обновляется инкрементально при записи отзывов
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Товар'
@@ -58,11 +126,22 @@ class Product(models.Model):
             models.Index(fields=['-rating']),  # Для сортировки по рейтингу (лучшие первыми)
             models.Index(fields=['category', 'price']),  # Комбинированный индекс для фильтрации по категории и цене
             models.Index(fields=['available', 'category']),  # Комбинированный индекс для фильтрации по доступности и категории
+            models.Index(fields=['reviews_count']),  # Для сортировки по количеству отзывов без GROUP BY
+            models.Index(fields=['updated_at']),  # Для инкрементальной выгрузки каталога
         ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Пополнение остатка (админка) возвращает товар, скрытый из-за нулевого остатка
+        if self.sold_out and self.count > 0:
+            self.available = True
+            self.sold_out = False
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'available', 'sold_out'}
+        super().save(*args, **kwargs)
+
     def get_subcategories(self):
         """Возвращает подкатегории для данной категории"""
         return Category.objects.filter(parent=self).only('id', 'title', 'parent')
@@ -109,6 +188,9 @@ class Specification(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='specifications')
     name = models.CharField(max_length=100, verbose_name='Название')
     value = models.CharField(max_length=100, verbose_name='Значение')
+    # Нормализованные (casefold) копии name/value для фасетного поиска, заполняются сигналом pre_save
+    name_key = models.CharField(max_length=100, default='', editable=False)
+    value_key = models.CharField(max_length=100, default='', editable=False)
 
     class Meta:
         verbose_name = 'Характеристика'
@@ -116,13 +198,38 @@ class Specification(models.Model):
         indexes = [
             models.Index(fields=['product']),
             models.Index(fields=['name']),
+            models.Index(fields=['name_key', 'value_key', 'product']),  # Фасетный индекс: характеристика -> значение -> товары
         ]
 
+    @staticmethod
+    def normalize(text):
+        """Ключ фасета: без учета регистра и лишних пробелов"""
+        return ' '.join((text or '').split()).casefold()
+
+    def fill_keys(self):
+        self.name_key = self.normalize(self.name)
+        self.value_key = self.normalize(self.value)
+
     def __str__(self):
         return f"{self.name}: {self.value}"
 
 
+class SaleQuerySet(models.QuerySet):
+    def active(self, at=None):
+        """Скидки, действующие на момент at (по умолчанию - сейчас) и имеющие цену со скидкой"""
+        at = at or timezone.now()
+        return self.filter(
+            Q(dateFrom__isnull=True) | Q(dateFrom__lte=at),
+            Q(dateTo__isnull=True) | Q(dateTo__gte=at),
+            salePrice__isnull=False,
+        )
+
+
 class Sale(models.Model):
+    # Порядок выбора скидки, если на товар действует несколько:
+    # самая низкая цена, затем самая поздняя по началу, затем по id
+    ACTIVE_ORDERING = ('salePrice', '-dateFrom', 'id')
+
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales', verbose_name='Товар')
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена', null=True, blank=True)
     salePrice = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена со скидкой', null=True, blank=True)
@@ -130,6 +237,11 @@ class Sale(models.Model):
     dateTo = models.DateTimeField(verbose_name='Дата окончания скидки', null=True, blank=True)
     title = models.CharField(max_length=200, verbose_name='Название', blank=True)
     images = models.JSONField(verbose_name='Изображения', default=list)
+    # Скидка создана import_catalog: повторный импорт заменяет только такие скидки,
+    # скидки из админки сохраняются
+    imported = models.BooleanField(default=False, verbose_name='Загружена импортом')
+
+    objects = SaleQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Скидка'
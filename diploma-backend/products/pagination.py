@@ -0,0 +1,103 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+# Поля, по которым поддерживается keyset-пагинация, и функции разбора значений из курсора
+CURSOR_FIELDS = {
+    'created_at': parse_datetime,
+    'price': Decimal,
+    'title': str,
+    'rating': float,
+    'reviews_count': int,
+    'date': parse_datetime,
+    'createdAt': parse_datetime,
+}
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или не соответствует текущей сортировке"""
+
+
+def _dump_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(field, value, pk, direction='next'):
+    """Закодировать позицию (значение поля сортировки + id) в непрозрачную строку"""
+    payload = {'f': field, 'v': _dump_value(value), 'id': pk, 'd': direction}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """
+    Раскодировать курсор.
+    Возвращает (значение, id, направление) или выбрасывает InvalidCursor.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if payload['f'] != field or field not in CURSOR_FIELDS:
+            raise InvalidCursor(cursor)
+        value = CURSOR_FIELDS[field](payload['v'])
+        if value is None:
+            raise InvalidCursor(cursor)
+        direction = payload.get('d', 'next')
+        if direction not in ('next', 'prev'):
+            raise InvalidCursor(cursor)
+        return value, int(payload['id']), direction
+    except (KeyError, TypeError, ValueError, InvalidOperation, binascii.Error, UnicodeError):
+        raise InvalidCursor(cursor)
+
+
+def keyset_page(queryset, field, descending, limit, cursor=None):
+    """
+    Получить страницу queryset по курсору без OFFSET и COUNT(*).
+
+    queryset не должен быть упорядочен: сортировка (field, id) задается здесь,
+    id используется как уникальный tie-breaker.
+    Возвращает (items, next_cursor, prev_cursor).
+    """
+    value, pk, direction = None, None, 'next'
+    if cursor:
+        value, pk, direction = decode_cursor(cursor, field)
+
+    # При движении назад сортировка разворачивается, а результат потом переворачивается обратно
+    backwards = direction == 'prev'
+    reverse_order = descending != backwards
+
+    if value is not None:
+        lookup = 'lt' if reverse_order else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'id__{lookup}': pk})
+        )
+
+    prefix = '-' if reverse_order else ''
+    rows = list(queryset.order_by(f'{prefix}{field}', f'{prefix}id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    first, last = rows[0], rows[-1]
+    # Следующая страница есть, если при движении вперед нашлись лишние строки
+    # или если мы пришли на эту страницу назад
+    has_next = has_more if not backwards else True
+    has_prev = (has_more if backwards else value is not None)
+
+    next_cursor = encode_cursor(field, getattr(last, field), last.id, 'next') if has_next else None
+    prev_cursor = encode_cursor(field, getattr(first, field), first.id, 'prev') if has_prev else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,109 @@
+from django.conf import settings
+
+from .cache import get_cache
+from .models import Product
+
+
+# Списки лучших товаров для главной страницы.
+# fields - поля сортировки (id последним, как уникальный tie-breaker),
+# filters - условия попадания в список помимо активности и доступности
+RANKINGS = {
+    'popular': {'filters': {}, 'fields': ('rating', 'id'), 'descending': True, 'limit': 8},
+    'banners': {'filters': {}, 'fields': ('rating', 'id'), 'descending': True, 'limit': 10},
+    'limited': {'filters': {'limited': True}, 'fields': ('id',), 'descending': False, 'limit': 16},
+}
+
+# Списки обновляются по сигналам; таймаут лишь страхует от гонок между процессами
+RANKING_TIMEOUT = getattr(settings, 'RANKING_CACHE_TIMEOUT', 3600)
+
+
+def _key(name):
+    return f'ranking:{name}'
+
+
+def _ordering(ranking):
+    prefix = '-' if ranking['descending'] else ''
+    return [f'{prefix}{field}' for field in ranking['fields']]
+
+
+def compute_ranking(name):
+    """Пересчитать список из базы одним запросом и сохранить его"""
+    ranking = RANKINGS[name]
+    entries = [
+        list(row) for row in Product.objects.filter(
+            is_active=True, available=True, **ranking['filters']
+        ).order_by(*_ordering(ranking)).values_list(*ranking['fields'])[:ranking['limit']]
+    ]
+    get_cache().set(_key(name), entries, RANKING_TIMEOUT)
+    return entries
+
+
+def rebuild_rankings():
+    for name in RANKINGS:
+        compute_ranking(name)
+
+
+def get_ranking_ids(name):
+    """ID товаров списка в порядке ранжирования"""
+    entries = get_cache().get(_key(name))
+    if entries is None:
+        entries = compute_ranking(name)
+    return [entry[-1] for entry in entries]
+
+
+def get_ranked_products(name):
+    """Товары списка: сохраненные ID загружаются одним запросом id__in"""
+    ids = get_ranking_ids(name)
+    products = Product.objects.filter(
+        id__in=ids, is_active=True, available=True
+    ).select_related('category').prefetch_related('images', 'tags').in_bulk()
+    return [products[pk] for pk in ids if pk in products]
+
+
+def _qualifies(product, ranking):
+    return product.is_active and product.available and all(
+        getattr(product, field) == value for field, value in ranking['filters'].items()
+    )
+
+
+def _update_ranking(name, product, deleted):
+    ranking = RANKINGS[name]
+    cache = get_cache()
+    stored = cache.get(_key(name))
+    if stored is None:
+        # Список еще не построен, он будет вычислен при первом чтении
+        return
+
+    limit = ranking['limit']
+    full = len(stored) >= limit
+    entries = [entry for entry in stored if entry[-1] != product.pk]
+    was_listed = len(entries) != len(stored)
+
+    if not deleted and _qualifies(product, ranking):
+        entry = [getattr(product, field) for field in ranking['fields']]
+        entries.append(entry)
+        entries.sort(reverse=ranking['descending'])
+        entries = entries[:limit]
+        # Товар опустился на последнее место: за пределами списка мог оказаться товар выше него
+        if was_listed and full and entries[-1] == entry:
+            compute_ranking(name)
+            return
+    elif not was_listed:
+        return
+    elif full:
+        # Освободилось место, следующий товар известен только базе
+        compute_ranking(name)
+        return
+
+    if entries != stored:
+        cache.set(_key(name), entries, RANKING_TIMEOUT)
+
+
+def update_rankings(products, deleted=False):
+    """
+    Учесть изменение товаров (рейтинг, доступность, limited) во всех списках.
+    Список пересчитывается из базы, только если из него выбыл товар, а список был заполнен.
+    """
+    for product in products:
+        for name in RANKINGS:
+            _update_ranking(name, product, deleted)
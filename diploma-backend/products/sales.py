@@ -0,0 +1,31 @@
+from .models import Sale
+
+
+def attach_active_sales(products, at=None):
+    """
+    Загрузить действующие скидки для набора товаров одним запросом.
+
+    Каждому товару проставляется атрибут active_sale (Sale или None).
+    Если на товар действует несколько скидок, выбирается первая по Sale.ACTIVE_ORDERING.
+    """
+    products = [product for product in products if product is not None]
+    product_ids = {product.pk for product in products}
+
+    best = {}
+    if product_ids:
+        sales = Sale.objects.active(at).filter(product_id__in=product_ids).order_by(
+            'product_id', *Sale.ACTIVE_ORDERING
+        )
+        for sale in sales:
+            best.setdefault(sale.product_id, sale)
+
+    for product in products:
+        product.active_sale = best.get(product.pk)
+    return products
+
+
+def get_active_sale(product):
+    """Действующая скидка товара (загружается, если не была подготовлена заранее)"""
+    if not hasattr(product, 'active_sale'):
+        attach_active_sales([product])
+    return product.active_sale
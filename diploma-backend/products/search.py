@@ -0,0 +1,104 @@
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, OuterRef, Subquery, Value
+
+
+# FTS5-таблица для SQLite; создается и поддерживается триггерами в миграции 0004
+# (на MySQL - индексы FULLTEXT из миграции 0011)
+FTS_TABLE = 'products_product_fts'
+# Веса колонок для bm25: совпадение в названии важнее описания и характеристик
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text or '')
+
+
+def build_fts_query(text):
+    """Запрос FTS5: все слова должны встретиться, каждое - как префикс"""
+    return ' '.join(f'"{token}"*' for token in tokenize(text))
+
+
+def build_boolean_query(text):
+    """Запрос MySQL IN BOOLEAN MODE: все слова обязательны (+), каждое - как префикс (*)"""
+    return ' '.join(f'+{token}*' for token in tokenize(text))
+
+
+def search_products(queryset, text):
+    """
+    Отфильтровать товары полнотекстовым поиском по названию, описанию и характеристикам.
+
+    Добавляет к товарам поле search_rank (больше - релевантнее).
+    На SQLite используется FTS5, на PostgreSQL и MySQL - встроенный полнотекстовый поиск,
+    на остальных СУБД - icontains по названию.
+    """
+    if not tokenize(text):
+        return queryset
+
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(queryset, text)
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(queryset, text)
+    if connection.vendor == 'mysql':
+        return _search_mysql(queryset, text)
+    return queryset.filter(title__icontains=text).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
+
+
+def _search_sqlite(queryset, text):
+    table = queryset.model._meta.db_table
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[build_fts_query(text)],
+        select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+    )
+
+
+def _search_postgresql(queryset, text):
+    from django.contrib.postgres.aggregates import StringAgg
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    from .models import Specification
+
+    specifications = Specification.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        text=StringAgg(F('name') + Value(' ') + F('value'), delimiter=' ')
+    ).values('text')
+    vector = (
+        SearchVector('title', weight='A', config='simple')
+        + SearchVector('description', weight='B', config='simple')
+        + SearchVector(Subquery(specifications), weight='C', config='simple')
+    )
+    query = SearchQuery(
+        ' & '.join(f'{token}:*' for token in tokenize(text)), search_type='raw', config='simple'
+    )
+    return queryset.annotate(search_vector=vector).filter(search_vector=query).annotate(
+        search_rank=SearchRank(F('search_vector'), query)
+    )
+
+
+def _search_mysql(queryset, text):
+    """
+    MATCH ... AGAINST по индексам FULLTEXT. Индекс не может охватить две таблицы,
+    поэтому товар подходит, если все слова нашлись в названии и описании
+    либо все слова нашлись в его характеристиках. Релевантность - по названию и описанию.
+    Слова короче innodb_ft_min_token_size (по умолчанию 3 символа) MySQL не индексирует.
+    """
+    table = queryset.model._meta.db_table
+    query = build_boolean_query(text)
+    product_match = f'MATCH({table}.title, {table}.description) AGAINST (%s IN BOOLEAN MODE)'
+    specification_match = (
+        f'{table}.id IN (SELECT product_id FROM products_specification '
+        f'WHERE MATCH(name, value) AGAINST (%s IN BOOLEAN MODE))'
+    )
+    return queryset.extra(
+        where=[f'({product_match} OR {specification_match})'],
+        params=[query, query],
+        select={'search_rank': product_match},
+        select_params=[query],
+    )
@@ -1,9 +1,16 @@
 from rest_framework import serializers
 from .models import Category, Product, ProductImage, Review, Tag, Specification, Sale
+from .sales import attach_active_sales, get_active_sale
+from django.conf import settings
 from django.core.files.storage import default_storage
 import os
 
 
+# Сколько последних отзывов встраивается в карточку товара;
+# остальные доступны постранично через /api/product/<id>/reviews
+REVIEWS_EMBED_LIMIT = getattr(settings, 'PRODUCT_REVIEWS_EMBED_LIMIT', 10)
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -19,6 +26,10 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'image', 'subcategories']
 
     def get_subcategories(self, obj):
+        # Если дерево уже загружено (products.categories), дочерние категории берутся из него
+        children = self.context.get('children')
+        if children is not None:
+            return CategorySerializer(children[obj.id], many=True, context={'children': children}).data
         subcategories = Category.objects.filter(parent=obj).only('id', 'title', 'parent')
         return CategorySerializer(subcategories, many=True).data
 
@@ -63,6 +74,15 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ['author', 'email', 'text', 'rate', 'date']
 
 
+class ProductListSerializer(serializers.ListSerializer):
+    """Список товаров: действующие скидки загружаются одним запросом на всю страницу"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        attach_active_sales(items)
+        return super().to_representation(items)
+
+
 # Сериализатор для списка товаров (каталог)
 class ProductShortSerializer(serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
@@ -80,18 +100,19 @@ class ProductShortSerializer(serializers.ModelSerializer):
             'freeDelivery', 'images', 'tags', 'reviews', 'rating', 'limited',
             'available', 'salePrice'
         ]
+        list_serializer_class = ProductListSerializer
 
     def get_reviews(self, obj):
-        # Используем аннотацию из queryset для получения количества отзывов, чтобы избежать дополнительного запроса
-        return getattr(obj, 'reviews_count', obj.reviews.count())
+        # Количество отзывов хранится в самом товаре, дополнительный запрос не нужен
+        return obj.reviews_count
 
     def get_price(self, obj):
         return float(obj.price)
 
     def get_salePrice(self, obj):
-        # Ищем скидку для этого продукта
-        sale_obj = obj.sales.first()
-        if sale_obj and sale_obj.salePrice:
+        # Действующая скидка; для списков подготовлена заранее в ProductListSerializer
+        sale_obj = get_active_sale(obj)
+        if sale_obj:
             return float(sale_obj.salePrice)
         return None
 
@@ -106,7 +127,8 @@ class ProductShortSerializer(serializers.ModelSerializer):
 class ProductFullSerializer(serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
+    reviews = serializers.SerializerMethodField()
+    reviewsCount = serializers.IntegerField(source='reviews_count', read_only=True)
     specifications = serializers.SerializerMethodField()
     rating = serializers.FloatField()
     salePrice = serializers.SerializerMethodField()
@@ -117,17 +139,24 @@ class ProductFullSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'category', 'title', 'description', 'fullDescription',
             'price', 'salePrice', 'count', 'date', 'freeDelivery', 'images', 'tags', 'reviews',
-            'specifications', 'rating', 'limited', 'available'
+            'reviewsCount', 'specifications', 'rating', 'limited', 'available'
         ]
+        list_serializer_class = ProductListSerializer
+
+    def get_reviews(self, obj):
+        # Последние отзывы одним запросом с LIMIT по индексу (product, date)
+        latest = obj.reviews.order_by('-date', '-id')[:REVIEWS_EMBED_LIMIT]
+        return ReviewSerializer(latest, many=True).data
 
     def get_specifications(self, obj):
-        specs = obj.specifications.only('name', 'value')
+        # all() использует prefetch_related из queryset представления
+        specs = obj.specifications.all()
         return [{'name': spec.name, 'value': spec.value} for spec in specs]
 
     def get_salePrice(self, obj):
-        # Ищем скидку для этого продукта
-        sale_obj = obj.sales.first()
-        if sale_obj and sale_obj.salePrice:
+        # Действующая скидка; для списков подготовлена заранее в ProductListSerializer
+        sale_obj = get_active_sale(obj)
+        if sale_obj:
             return float(sale_obj.salePrice)
         return None
 
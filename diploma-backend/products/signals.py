@@ -0,0 +1,126 @@
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_namespace
+from .models import Category, Product, ProductImage, Review, Sale, Specification, Tag
+from .rankings import update_rankings
+
+
+_state = threading.local()
+
+
+@contextmanager
+def bulk_operation():
+    """
+    Отключить обработчики ниже на время массовой загрузки в текущем потоке.
+    Вызывающий код сам пересчитывает денормализованные поля и сбрасывает кэши.
+    """
+    previous = getattr(_state, 'muted', False)
+    _state.muted = True
+    try:
+        yield
+    finally:
+        _state.muted = previous
+
+
+def _unless_muted(handler):
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not getattr(_state, 'muted', False):
+            return handler(*args, **kwargs)
+    return wrapper
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Specification)
+@receiver([post_save, post_delete], sender=ProductImage)
+@_unless_muted
+def invalidate_products_cache(sender, **kwargs):
+    """Сбросить кэшированные данные каталога при изменении товаров"""
+    bump_namespace('products')
+
+
+@receiver([post_save, post_delete], sender=Specification)
+@receiver([post_save, post_delete], sender=ProductImage)
+@_unless_muted
+def touch_product(sender, instance, **kwargs):
+    """Характеристики и изображения входят в выгрузку каталога, товар считается измененным"""
+    Product.objects.filter(pk=instance.product_id).touch()
+
+
+@receiver(post_save, sender=Product)
+@_unless_muted
+def update_product_rankings(sender, instance, **kwargs):
+    """Учесть изменение рейтинга, доступности или limited в списках лучших товаров"""
+    update_rankings([instance])
+
+
+@receiver(post_delete, sender=Product)
+@_unless_muted
+def remove_from_rankings(sender, instance, **kwargs):
+    update_rankings([instance], deleted=True)
+
+
+@receiver(pre_save, sender=Specification)
+def fill_specification_keys(sender, instance, **kwargs):
+    """Заполнить нормализованные ключи фасетного индекса (в том числе при loaddata)"""
+    instance.fill_keys()
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+@_unless_muted
+def invalidate_products_cache_on_tags(sender, action, instance, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_namespace('products')
+        if not reverse:
+            Product.objects.filter(pk=instance.pk).touch()
+        elif pk_set:
+            Product.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver([post_save, post_delete], sender=Category)
+@_unless_muted
+def invalidate_categories_cache(sender, **kwargs):
+    """Сбросить закэшированное дерево категорий"""
+    bump_namespace('categories')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@_unless_muted
+def invalidate_tags_cache(sender, **kwargs):
+    bump_namespace('tags')
+
+
+@receiver(post_save, sender=Review)
+@_unless_muted
+def add_review_rating(sender, instance, created, **kwargs):
+    """Учесть оценку отзыва в рейтинге товара"""
+    products = Product.objects.filter(pk=instance.product_id)
+    if created:
+        products.add_rating(instance.rate)
+    else:
+        # Оценка могла измениться, прежнее значение неизвестно
+        products.refresh_rating()
+    update_rankings(products)
+    bump_namespace('reviews')
+
+
+@receiver(post_delete, sender=Review)
+@_unless_muted
+def remove_review_rating(sender, instance, **kwargs):
+    products = Product.objects.filter(pk=instance.product_id)
+    products.remove_rating(instance.rate)
+    update_rankings(products)
+    bump_namespace('reviews')
+
+
+@receiver([post_save, post_delete], sender=Sale)
+@_unless_muted
+def touch_sale_product(sender, instance, **kwargs):
+    """Скидка товара изменилась: товар попадет в инкрементальную выгрузку"""
+    Product.objects.filter(pk=instance.product_id).touch()
+    bump_namespace('sales')
@@ -0,0 +1,39 @@
+from django.db.models import Count
+
+from .models import Product
+
+
+TAG_MATCH_ALL = 'all'
+TAG_MATCH_ANY = 'any'
+
+
+def parse_tag_ids(values):
+    """ID тегов из параметров запроса; некорректные значения пропускаются"""
+    tag_ids = set()
+    for value in values:
+        try:
+            tag_ids.add(int(value))
+        except (ValueError, TypeError):
+            pass
+    return tag_ids
+
+
+def filter_by_tags(queryset, tag_ids, match=TAG_MATCH_ALL):
+    """
+    Отфильтровать товары по тегам одним подзапросом к промежуточной таблице.
+
+    match='all' - товар должен иметь все теги (GROUP BY product_id HAVING COUNT = N),
+    match='any' - хотя бы один. Подзапрос идет по индексу (tag_id, product_id)
+    и не размножает строки товаров, в отличие от цепочки filter(tags__id=...).
+    """
+    tag_ids = set(tag_ids)
+    if not tag_ids:
+        return queryset
+
+    matching = Product.tags.through.objects.filter(tag_id__in=tag_ids)
+    if match != TAG_MATCH_ANY and len(tag_ids) > 1:
+        # Пара (product_id, tag_id) в промежуточной таблице уникальна
+        matching = matching.values('product_id').annotate(
+            matched=Count('tag_id')
+        ).filter(matched=len(tag_ids))
+    return queryset.filter(id__in=matching.values('product_id'))
@@ -1,9 +1,20 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from products.cache import get_cache, get_cache_stats
+from products.rankings import get_ranking_ids
+
 from django.apps import apps
 
 # Получаем модели через apps
@@ -27,6 +38,8 @@ class ShopModelTest(TestCase):
     """Тесты для моделей магазина"""
 
     def setUp(self):
+        # Кэш общий для всех тестов, а откат транзакции теста не вызывает сигналы
+        get_cache().clear()
         # Создаем тестовые данные
         self.category = Category.objects.create(title='Test Category')
         self.tag = Tag.objects.create(name='Test Tag')
@@ -540,6 +553,751 @@ class ShopEdgeCasesTest(APITestCase):
         ])
 
 
+class ProductCursorPaginationTest(APITestCase):
+    """Тесты keyset-пагинации каталога"""
+
+    def setUp(self):
+        self.category = Category.objects.create(title='Test Category')
+        # Одинаковые цены у пар товаров проверяют tie-breaker по id
+        for i in range(7):
+            Product.objects.create(
+                category=self.category,
+                title=f'Product {i}',
+                description=f'Description {i}',
+                price=Decimal('10.00') * (i // 2 + 1),
+                count=1,
+                available=True
+            )
+        self.url = reverse('product-list')
+
+    def _walk(self, params):
+        """Пройти каталог по nextCursor и вернуть id в порядке выдачи"""
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(self.url, {**params, 'cursor': cursor, 'limit': 3})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['items'])
+            cursor = response.data['nextCursor']
+        return ids
+
+    def test_cursor_walk_matches_offset_order(self):
+        """Обход по курсорам совпадает с порядком обычной пагинации"""
+        for sort_type in ('inc', 'dec'):
+            params = {'sort': 'price', 'sortType': sort_type}
+            expected = [
+                item['id']
+                for item in self.client.get(self.url, {**params, 'limit': 20}).data['items']
+            ]
+            self.assertEqual(self._walk(params), expected)
+            self.assertEqual(len(expected), 7)
+
+    def test_prev_cursor_returns_previous_page(self):
+        """prevCursor возвращает предыдущую страницу в исходном порядке"""
+        params = {'sort': 'name', 'sortType': 'inc', 'limit': 3}
+        first = self.client.get(self.url, {**params, 'cursor': ''}).data
+        self.assertIsNone(first['prevCursor'])
+        second = self.client.get(self.url, {**params, 'cursor': first['nextCursor']}).data
+        back = self.client.get(self.url, {**params, 'cursor': second['prevCursor']}).data
+
+        self.assertEqual(
+            [item['id'] for item in back['items']],
+            [item['id'] for item in first['items']]
+        )
+        self.assertIsNotNone(back['nextCursor'])
+
+    def test_invalid_cursor(self):
+        """Поврежденный курсор или курсор от другой сортировки отклоняются"""
+        response = self.client.get(self.url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        first = self.client.get(self.url, {'sort': 'price', 'cursor': '', 'limit': 3}).data
+        response = self.client.get(self.url, {'sort': 'rating', 'cursor': first['nextCursor']})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CatalogTotalCountTest(APITestCase):
+    """Тесты количества товаров в ответе каталога"""
+
+    def setUp(self):
+        self.category = Category.objects.create(title='Test Category')
+        self.other_category = Category.objects.create(title='Other Category')
+        for i in range(5):
+            Product.objects.create(
+                category=self.category if i < 3 else self.other_category,
+                title=f'Product {i}',
+                description=f'Description {i}',
+                price=Decimal('10.00'),
+                count=1,
+                available=True
+            )
+        self.url = reverse('product-list')
+
+    def test_total_items_respects_filters(self):
+        """totalItems и lastPage считаются по отфильтрованной выборке"""
+        response = self.client.get(self.url, {'category': self.category.id, 'limit': 2})
+
+        self.assertEqual(response.data['totalItems'], 3)
+        self.assertEqual(response.data['lastPage'], 2)
+
+    def test_total_items_is_cached_and_invalidated(self):
+        """Количество кэшируется по набору фильтров и сбрасывается при сохранении товара"""
+        params = {'category': self.other_category.id}
+        self.client.get(self.url, params)
+
+        # Повторный запрос с теми же фильтрами не выполняет COUNT
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.data['totalItems'], 2)
+        self.assertFalse(any(
+            'COUNT(*)' in query['sql'] and 'FROM "products_product"' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+        Product.objects.create(
+            category=self.other_category,
+            title='New Product',
+            description='New',
+            price=Decimal('10.00'),
+            available=True
+        )
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.data['totalItems'], 3)
+
+
+class ProductStatsTest(TestCase):
+    """Тесты денормализованных полей товара"""
+
+    def setUp(self):
+        self.category = Category.objects.create(title='Test Category')
+        self.product = Product.objects.create(
+            category=self.category,
+            title='Test Product',
+            description='Test description',
+            price=Decimal('100.00')
+        )
+
+    def _review(self, rate=5):
+        return Review.objects.create(
+            product=self.product, author='Author', email='a@example.com', text='Text', rate=rate
+        )
+
+    def test_reviews_count_follows_review_writes(self):
+        """Количество отзывов обновляется при создании и удалении отзывов"""
+        first = self._review()
+        self._review()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reviews_count, 2)
+
+        first.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reviews_count, 1)
+
+    def test_rating_follows_review_writes(self):
+        """Рейтинг - среднее оценок, обновляется без пересчета всех отзывов"""
+        self._review(5)
+        with CaptureQueriesContext(connection) as queries:
+            low = self._review(2)
+        self.assertFalse([q for q in queries.captured_queries if 'AVG(' in q['sql']])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.reviews_count, self.product.rating_sum), (2, 7))
+        self.assertAlmostEqual(self.product.rating, 3.5)
+
+        low.delete()
+        self.product.refresh_from_db()
+        self.assertAlmostEqual(self.product.rating, 5.0)
+
+        low = self.product.reviews.get()
+        low.rate = 1
+        low.save()
+        self.product.refresh_from_db()
+        self.assertAlmostEqual(self.product.rating, 1.0)
+
+    def test_review_updates_popular_ranking(self):
+        get_cache().clear()
+        other = Product.objects.create(category=self.category, title='Other', price=Decimal('1.00'), rating=3)
+        self.assertEqual(get_ranking_ids('popular'), [other.id, self.product.id])
+        self._review(4)
+        self.assertEqual(get_ranking_ids('popular'), [self.product.id, other.id])
+
+    def test_rebuild_command(self):
+        """Команда rebuild_product_stats восстанавливает рассинхронизированные поля"""
+        self._review(4)
+        Product.objects.create(category=self.category, title='No reviews', price=Decimal('1.00'), rating=4.5)
+        Product.objects.update(reviews_count=42, rating_sum=0, rating=0)
+
+        call_command('rebuild_product_stats', batch_size=1, stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.reviews_count, self.product.rating_sum), (1, 4))
+        self.assertEqual(self.product.rating, 4.0)
+        self.assertEqual(Product.objects.get(title='No reviews').reviews_count, 0)
+
+
+class ProductListQueryCountTest(APITestCase):
+    """Количество запросов списков товаров не зависит от размера страницы"""
+
+    def setUp(self):
+        self.category = Category.objects.create(title='Test Category')
+        self.tag = Tag.objects.create(name='Test Tag')
+        self.now = timezone.now()
+
+    def _create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                category=self.category,
+                title=f'Product {i}',
+                description=f'Description {i}',
+                price=Decimal('100.00'),
+                rating=4.0,
+                limited=True,
+                available=True
+            )
+            product.tags.add(self.tag)
+            ProductImage.objects.create(product=product, src='products/test.jpg', alt='Image')
+            Sale.objects.create(product=product, salePrice=Decimal('80.00'),
+                                dateFrom=self.now - timedelta(days=1), dateTo=self.now + timedelta(days=1))
+            Sale.objects.create(product=product, salePrice=Decimal('90.00'),
+                                dateFrom=self.now - timedelta(days=1), dateTo=self.now + timedelta(days=1))
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries.captured_queries)
+
+    def test_list_endpoints_use_constant_queries(self):
+        urls = [reverse(name) for name in ('product-list', 'product-popular', 'product-limited', 'banner-list')]
+
+        # Кэш очищается перед каждым замером, чтобы сравнивать холодные запросы
+        self._create_products(2)
+        get_cache().clear()
+        small = [self._count_queries(url) for url in urls]
+        self._create_products(6)
+        get_cache().clear()
+        large = [self._count_queries(url) for url in urls]
+
+        self.assertEqual(small, large)
+
+    def test_overlapping_sales_pick_lowest_price(self):
+        """При нескольких действующих скидках выбирается самая низкая цена"""
+        self._create_products(1)
+        response = self.client.get(reverse('product-list'))
+
+        self.assertEqual(response.data['items'][0]['salePrice'], 80.0)
+
+
+class CategoryTreeCacheTest(APITestCase):
+    """Тесты кэшированного дерева категорий"""
+
+    def setUp(self):
+        self.root = Category.objects.create(title='Root')
+        self.child = Category.objects.create(title='Child', parent=self.root)
+        Category.objects.create(title='Grandchild', parent=self.child)
+        self.url = reverse('category-list')
+
+    def test_tree_built_with_single_query_and_cached(self):
+        """Дерево строится одним запросом, повторный запрос обслуживается из кэша"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(len(queries.captured_queries), 1)
+
+        self.assertEqual(len(response.data), 1)
+        child = response.data[0]['subcategories'][0]
+        self.assertEqual(child['title'], 'Child')
+        self.assertEqual(child['subcategories'][0]['title'], 'Grandchild')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_etag_and_invalidation(self):
+        """Совпадающий ETag дает 304, изменение категории меняет ETag"""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.child.title = 'Renamed'
+        self.child.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['subcategories'][0]['title'], 'Renamed')
+
+
+class CatalogSearchTest(APITestCase):
+    """Тесты полнотекстового поиска по каталогу"""
+
+    def setUp(self):
+        self.category = Category.objects.create(title='Test Category')
+        self.laptop = self._product('Ноутбук Apple', 'Легкий и тонкий')
+        self.phone = self._product('Смартфон', 'Совместим с ноутбуком Apple')
+        self.cable = self._product('Кабель', 'Обычный кабель')
+        Specification.objects.create(product=self.cable, name='Цвет', value='Красный')
+        self.url = reverse('product-list')
+
+    def _product(self, title, description):
+        return Product.objects.create(
+            category=self.category, title=title, description=description,
+            price=Decimal('10.00'), available=True
+        )
+
+    def _search(self, text, **params):
+        response = self.client.get(self.url, {'filter[name]': text, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['items']], response.data
+
+    def test_prefix_search_over_title_description_and_specifications(self):
+        ids, data = self._search('ноут')
+        self.assertEqual(set(ids), {self.laptop.id, self.phone.id})
+        self.assertEqual(data['totalItems'], 2)
+
+        ids, _ = self._search('красн')
+        self.assertEqual(ids, [self.cable.id])
+
+    def test_relevance_sort_prefers_title_matches(self):
+        ids, _ = self._search('apple ноутбук', sort='relevance')
+        self.assertEqual(ids[0], self.laptop.id)
+
+    def test_index_follows_product_writes(self):
+        self.cable.title = 'Провод'
+        self.cable.save()
+        self.assertEqual(self._search('провод')[0], [self.cable.id])
+        self.assertEqual(self._search('кабел')[0], [self.cable.id])  # осталось в описании
+
+        self.laptop.delete()
+        self.assertEqual(self._search('ноутбук')[0], [self.phone.id])
+
+
+class CatalogFacetTest(APITestCase):
+    """Тесты фасетной фильтрации по характеристикам"""
+
+    def setUp(self):
+        self.category = Category.objects.create(title='Test Category')
+        self.red_16 = self._product('Ноутбук 1', {'Цвет': 'Красный', 'Память': '16 ГБ'})
+        self.red_8 = self._product('Ноутбук 2', {'Цвет': 'красный', 'Память': '8 ГБ'})
+        self.blue_16 = self._product('Ноутбук 3', {'Цвет': 'Синий', 'Память': '16  гб'})
+        self.url = reverse('product-list')
+
+    def _product(self, title, specs):
+        product = Product.objects.create(
+            category=self.category, title=title, price=Decimal('10.00'), available=True
+        )
+        for name, value in specs.items():
+            Specification.objects.create(product=product, name=name, value=value)
+        return product
+
+    def _ids(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['id'] for item in response.data['items']), response.data
+
+    def test_keys_are_normalized(self):
+        spec = self.blue_16.specifications.get(name='Память')
+        self.assertEqual((spec.name_key, spec.value_key), ('память', '16 гб'))
+
+    def test_multi_attribute_filter(self):
+        ids, data = self._ids({'filter[цвет]': 'КРАСНЫЙ', 'filter[Память]': '16 ГБ'})
+        self.assertEqual(ids, [self.red_16.id])
+        self.assertEqual(data['totalItems'], 1)
+
+        # Значения одной характеристики объединяются по ИЛИ, без дублей товаров
+        ids, data = self._ids({'filter[Цвет]': ['красный', 'синий'], 'filter[Память]': '16 гб'})
+        self.assertEqual(ids, sorted([self.red_16.id, self.blue_16.id]))
+        self.assertEqual(data['totalItems'], 2)
+
+    def test_facet_counts(self):
+        _, data = self._ids({'filter[Память]': '16 ГБ', 'facets': '1'})
+        facets = {facet['name']: {v['value'].casefold(): v['count'] for v in facet['values']}
+                  for facet in data['facets']}
+        self.assertEqual(facets['Цвет'], {'красный': 1, 'синий': 1})
+        self.assertEqual(set(facets['Память'].values()), {2})
+
+        _, data = self._ids({})
+        self.assertNotIn('facets', data)
+
+
+class CatalogTagFilterTest(APITestCase):
+    """Тесты фильтра каталога по тегам"""
+
+    def setUp(self):
+        category = Category.objects.create(title='Test Category')
+        self.red = Tag.objects.create(name='red')
+        self.big = Tag.objects.create(name='big')
+        self.both = Product.objects.create(category=category, title='Both', price=Decimal('1.00'))
+        self.only_red = Product.objects.create(category=category, title='Red', price=Decimal('1.00'))
+        self.both.tags.add(self.red, self.big)
+        self.only_red.tags.add(self.red)
+        self.url = reverse('product-list')
+
+    def _ids(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['id'] for item in response.data['items']), response.data['totalItems']
+
+    def test_all_and_any(self):
+        self.assertEqual(self._ids({'tags[]': [self.red.id, self.big.id]}), ([self.both.id], 1))
+        self.assertEqual(self._ids({'tags': [self.red.id, self.big.id]}), ([self.both.id], 1))
+        self.assertEqual(
+            self._ids({'tags[]': [self.red.id, self.big.id], 'tagsMatch': 'any'}),
+            (sorted([self.both.id, self.only_red.id]), 2)
+        )
+        self.assertEqual(self._ids({'tags[]': [self.red.id, 'x']}), (sorted([self.both.id, self.only_red.id]), 2))
+
+    def test_tags_resolved_with_grouped_subquery(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self._ids({'tags[]': [self.red.id, self.big.id]})
+        # Теги проверяются подзапросом, а не JOIN промежуточной таблицы к товарам
+        list_queries = [q['sql'] for q in ctx.captured_queries if 'HAVING' in q['sql']]
+        self.assertTrue(list_queries)
+        for sql in list_queries:
+            self.assertNotIn('JOIN "products_product_tags"', sql)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_tag_filter', products=30, tags=3, repeat=1, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+        self.assertFalse(Tag.objects.filter(name__startswith='benchmark-').exists())
+
+
+class ResponseCacheTest(APITestCase):
+    """Тесты кэша ответов для анонимных пользователей"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.category = Category.objects.create(title='Test Category')
+        self.product = Product.objects.create(
+            category=self.category, title='Product', price=Decimal('10.00'), rating=5
+        )
+        now = timezone.now()
+        Sale.objects.create(product=self.product, salePrice=Decimal('8.00'),
+                            dateFrom=now - timedelta(days=1), dateTo=now + timedelta(days=1))
+
+    def _get(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries.captured_queries)
+
+    def test_hit_and_dependency_invalidation(self):
+        self.assertGreater(self._get('product-popular')[1], 0)
+        self.assertGreater(self._get('sale-list')[1], 0)
+        self.assertEqual(self._get('product-popular')[1], 0)
+
+        # Отзыв меняет только ответы, зависящие от отзывов
+        Review.objects.create(product=self.product, author='A', email='a@example.com', text='ok', rate=5)
+        self.assertEqual(self._get('sale-list')[1], 0)
+        response, queries = self._get('product-popular')
+        self.assertGreater(queries, 0)
+        self.assertEqual(response.data[0]['reviews'], 1)
+
+        Tag.objects.create(name='New')
+        self.assertEqual(self._get('sale-list')[1], 0)
+        self.assertGreater(self._get('tag-list')[1], 0)
+
+    def test_authenticated_requests_bypass_cache(self):
+        user = User.objects.create_user(username='cacheuser', password='pass12345')
+        self.client.force_authenticate(user)
+        self._get('product-popular')
+        self.assertGreater(self._get('product-popular')[1], 0)
+
+    def test_stats_command(self):
+        self._get('banner-list')
+        self._get('banner-list')
+        out = StringIO()
+        call_command('response_cache_stats', reset=True, stdout=out)
+        line = next(line for line in out.getvalue().splitlines() if line.startswith('banners'))
+        self.assertEqual(line.split()[1:3], ['1', '1'])
+        self.assertEqual(get_cache_stats(['banners'])['banners'], {'hit': 0, 'miss': 0})
+
+
+class RankingStoreTest(TestCase):
+    """Тесты хранилища списков лучших товаров"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.category = Category.objects.create(title='Test Category')
+        self.products = [
+            Product.objects.create(category=self.category, title=f'Product {i}',
+                                   price=Decimal('1.00'), rating=i)
+            for i in range(12)
+        ]
+
+    def _ids(self, products):
+        return [product.id for product in products]
+
+    def test_rankings_follow_rating_and_limit(self):
+        expected = self._ids(sorted(self.products, key=lambda p: -p.rating))
+        self.assertEqual(get_ranking_ids('popular'), expected[:8])
+        self.assertEqual(get_ranking_ids('banners'), expected[:10])
+        self.assertEqual(get_ranking_ids('limited'), [])
+
+    def test_incremental_updates(self):
+        get_ranking_ids('popular')
+        low = self.products[0]
+
+        # Товар поднимается в список без пересчета из базы
+        low.rating = 100
+        with CaptureQueriesContext(connection) as queries:
+            low.save()
+            self.assertEqual(get_ranking_ids('popular')[0], low.id)
+        self.assertFalse([q for q in queries.captured_queries if 'LIMIT 8' in q['sql']])
+
+        # Выбывший товар заменяется следующим по рейтингу
+        low.available = False
+        low.save()
+        self.assertEqual(get_ranking_ids('popular'), self._ids(self.products[11:3:-1]))
+
+        self.products[11].limited = True
+        self.products[11].save()
+        self.assertEqual(get_ranking_ids('limited'), [self.products[11].id])
+        self.products[11].delete()
+        self.assertEqual(get_ranking_ids('limited'), [])
+
+    def test_views_hydrate_in_order(self):
+        response = self.client.get(reverse('product-popular'))
+        self.assertEqual([item['id'] for item in response.data], get_ranking_ids('popular'))
+
+
+class ProductReviewsPaginationTest(APITestCase):
+    """Тесты постраничного списка отзывов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reviewer', email='r@example.com', password='pass12345')
+        category = Category.objects.create(title='Test Category')
+        self.product = Product.objects.create(category=category, title='Product', price=Decimal('1.00'))
+        now = timezone.now()
+        for i in range(25):
+            review = Review.objects.create(product=self.product, author=f'A{i}', email='a@example.com',
+                                           text=f'Review {i}', rate=4)
+            # Часть отзывов с одинаковой датой, чтобы проверить tie-breaker по id
+            Review.objects.filter(pk=review.pk).update(date=now - timedelta(minutes=i // 2))
+        self.url = reverse('product-reviews', kwargs={'id': self.product.id})
+
+    def test_cursor_walk(self):
+        expected = list(self.product.reviews.order_by('-date', '-id').values_list('text', flat=True))
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 10, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [item['text'] for item in response.data['items']]
+            cursor = response.data['nextCursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, expected)
+
+        response = self.client.get(self.url, {'cursor': 'broken'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_detail_embeds_latest_reviews(self):
+        response = self.client.get(reverse('product-detail', kwargs={'id': self.product.id}))
+        self.assertEqual(response.data['reviewsCount'], 25)
+        self.assertEqual(len(response.data['reviews']), 10)
+        latest = list(self.product.reviews.order_by('-date', '-id').values_list('text', flat=True)[:10])
+        self.assertEqual([review['text'] for review in response.data['reviews']], latest)
+
+    def test_post_returns_created_review(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(self.url, {'text': 'New', 'rate': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['review']['text'], 'New')
+        self.assertEqual(response.data['reviewsCount'], 26)
+        self.assertAlmostEqual(response.data['rating'], (25 * 4 + 5) / 26)
+
+
+class ImportCatalogTest(TestCase):
+    """Тесты команды import_catalog"""
+
+    CSV = (
+        'sku,title,description,price,category,tags,specifications,salePrice,dateFrom,dateTo\n'
+        'A-1,Ноутбук,Легкий,1000.00,Электроника/Ноутбуки,new|sale,Цвет=Красный|Память=16 ГБ,900.00,2000-01-01,2999-01-01\n'
+        'A-2,Телефон,,500.00,Электроника/Телефоны,new,,,,\n'
+        'A-3,,,oops,,,,,,\n'
+        ',Без артикула,,1.00,Электроника,,,,,\n'
+    )
+
+    def _import(self, content, suffix, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, encoding='utf-8', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', file.name, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import(self):
+        out, err = self._import(self.CSV, '.csv', batch_size=2)
+        self.assertIn('создано: 2', out)
+        self.assertIn('строк/с', out)
+        self.assertEqual(len(err.strip().splitlines()), 2)
+
+        laptop = Product.objects.get(sku='A-1')
+        self.assertEqual(laptop.category.title, 'Ноутбуки')
+        self.assertEqual(laptop.category.parent.title, 'Электроника')
+        self.assertEqual(Product.objects.get(sku='A-2').category.parent_id, laptop.category.parent_id)
+        self.assertEqual(sorted(laptop.tags.values_list('name', flat=True)), ['new', 'sale'])
+        self.assertEqual(laptop.sales.active().get().salePrice, Decimal('900.00'))
+        spec = laptop.specifications.get(name='Память')
+        self.assertEqual(spec.value_key, '16 гб')
+        self.assertEqual(Tag.objects.filter(name='new').count(), 1)
+
+        # Импортированные товары сразу видны в поиске и фасетах
+        response = self.client.get(reverse('product-list'), {'filter[name]': 'ноут', 'filter[Цвет]': 'красный'})
+        self.assertEqual([item['id'] for item in response.data['items']], [laptop.id])
+
+    def test_restock_returns_sold_out_products(self):
+        self._import(self.CSV, '.csv')
+        Product.objects.filter(sku='A-1').update(count=0, available=False, sold_out=True)
+        Product.objects.filter(sku='A-2').update(count=0, available=False)
+
+        self._import('sku,count\nA-1,5\nA-2,5\n', '.csv')
+
+        # Скрытый нулевым остатком товар возвращается, отключенный вручную - нет
+        self.assertEqual(
+            dict(Product.objects.values_list('sku', 'available')), {'A-1': True, 'A-2': False}
+        )
+
+    def test_jsonl_upsert_keeps_missing_fields(self):
+        self._import(self.CSV, '.csv')
+        laptop = Product.objects.get(sku='A-1')
+        rows = [
+            {'sku': 'A-1', 'price': '1100.00', 'specifications': {'Цвет': 'Синий'}},
+            {'sku': 'B-1', 'title': 'Планшет', 'price': 300, 'category': ['Электроника', 'Планшеты'],
+             'available': 'false'},
+        ]
+        out, _ = self._import('\n'.join(json.dumps(row, ensure_ascii=False) for row in rows), '.jsonl')
+        self.assertIn('создано: 1, обновлено: 1', out)
+
+        laptop.refresh_from_db()
+        self.assertEqual((laptop.title, laptop.price), ('Ноутбук', Decimal('1100.00')))
+        self.assertEqual(list(laptop.specifications.values_list('value', flat=True)), ['Синий'])
+        self.assertEqual(laptop.tags.count(), 2)
+        self.assertFalse(Product.objects.get(sku='B-1').available)
+
+    def test_reimport_replaces_only_imported_sales(self):
+        self._import(self.CSV, '.csv')
+        laptop = Product.objects.get(sku='A-1')
+        future = timezone.now() + timedelta(days=30)
+        manual = Sale.objects.create(product=laptop, salePrice=Decimal('700.00'), dateFrom=future)
+
+        rows = [{'sku': 'A-1', 'salePrice': '850.00', 'dateFrom': '2000-01-01', 'dateTo': '2999-01-01'}]
+        self._import('\n'.join(json.dumps(row) for row in rows), '.jsonl')
+
+        self.assertEqual(
+            sorted(laptop.sales.values_list('salePrice', 'imported')),
+            [(Decimal('700.00'), False), (Decimal('850.00'), True)]
+        )
+        self.assertTrue(Sale.objects.filter(pk=manual.pk).exists())
+
+    def test_invalid_rows_are_not_counted(self):
+        self._import(self.CSV, '.csv')
+        rows = [
+            {'sku': 'A-1', 'price': '1100.00'},
+            {'sku': 'C-1', 'price': '10.00'},  # Новый товар без названия и категории
+            {'sku': 'C-2', 'title': 'Чехол', 'price': '10.00', 'category': 'Аксессуары'},
+        ]
+        out, err = self._import('\n'.join(json.dumps(row) for row in rows), '.jsonl')
+
+        self.assertIn('создано: 1, обновлено: 1', out)
+        self.assertEqual(len(err.strip().splitlines()), 1)
+
+
+class ExportCatalogTest(APITestCase):
+    """Тесты потоковой выгрузки каталога"""
+
+    def setUp(self):
+        root = Category.objects.create(title='Электроника')
+        category = Category.objects.create(title='Ноутбуки', parent=root)
+        self.tag = Tag.objects.create(name='new')
+        self.products = []
+        for i in range(5):
+            product = Product.objects.create(category=category, title=f'Product {i}', sku=f'S-{i}',
+                                             description='Desc', price=Decimal('10.00'))
+            product.tags.add(self.tag)
+            Specification.objects.create(product=product, name='Цвет', value='Красный')
+            self.products.append(product)
+        now = timezone.now().replace(microsecond=0)
+        self.sale_dates = (now - timedelta(days=1), now + timedelta(days=1))
+        Sale.objects.create(product=self.products[0], salePrice=Decimal('8.00'),
+                            dateFrom=self.sale_dates[0], dateTo=self.sale_dates[1])
+        self.admin = User.objects.create_user(username='exporter', password='pass12345', is_staff=True)
+
+    def _command(self, **options):
+        out, err = StringIO(), StringIO()
+        call_command('export_catalog', stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_jsonl_export_with_batched_prefetch(self):
+        with CaptureQueriesContext(connection) as queries:
+            out, err = self._command(chunk_size=2)
+        rows = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual([row['sku'] for row in rows], [f'S-{i}' for i in range(5)])
+        self.assertEqual(rows[0]['category'], 'Электроника/Ноутбуки')
+        self.assertEqual(rows[0]['salePrice'], '8.00')
+        self.assertEqual(rows[0]['dateTo'], self.sale_dates[1].isoformat())
+        self.assertIsNone(rows[1]['dateFrom'])
+        self.assertEqual(rows[0]['tags'], ['new'])
+        self.assertEqual(rows[0]['specifications'], [{'name': 'Цвет', 'value': 'Красный'}])
+        self.assertIn('Выгружено товаров: 5', err)
+        # Категории, товары (один курсор) и на каждый из 3 пакетов: изображения, теги, характеристики, скидки
+        self.assertEqual(len(queries.captured_queries), 2 + 3 * 4)
+
+    def test_incremental_export(self):
+        since = timezone.now()
+        Specification.objects.create(product=self.products[3], name='Вес', value='1 кг')
+        out, _ = self._command(since=since.isoformat())
+        self.assertEqual([json.loads(line)['sku'] for line in out.splitlines()], ['S-3'])
+
+    def test_incremental_export_delists_deactivated_products(self):
+        since = timezone.now()
+        product = self.products[2]
+        product.is_active = False
+        product.save()
+
+        out, _ = self._command(since=since.isoformat())
+        rows = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual([(row['sku'], row['is_active']) for row in rows], [('S-2', False)])
+
+        # Полная выгрузка по-прежнему содержит только активные товары
+        out, _ = self._command()
+        self.assertNotIn('S-2', [json.loads(line)['sku'] for line in out.splitlines()])
+
+    def test_csv_export_round_trips_through_import(self):
+        out, _ = self._command(format='csv')
+        Product.objects.all().delete()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as file:
+            file.write(out)
+        self.addCleanup(os.remove, file.name)
+        call_command('import_catalog', file.name, stdout=StringIO(), stderr=StringIO())
+
+        product = Product.objects.get(sku='S-0')
+        self.assertEqual(product.category.title, 'Ноутбуки')
+        # Скидка загружается с теми же датами и остается ограниченной по времени
+        sale = product.sales.active().get()
+        self.assertEqual(sale.salePrice, Decimal('8.00'))
+        self.assertEqual((sale.dateFrom, sale.dateTo), self.sale_dates)
+        self.assertFalse(product.sales.active(self.sale_dates[1] + timedelta(seconds=1)).exists())
+        self.assertEqual(list(product.tags.values_list('name', flat=True)), ['new'])
+        self.assertEqual(Product.objects.count(), 5)
+
+    def test_streaming_endpoint(self):
+        url = reverse('product-export')
+        self.assertIn(self.client.get(url).status_code,
+                      [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(url, {'type': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith('id,sku,title'))
+        self.assertIn('X-Export-Started', response)
+
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class ShopModelRelationsTest(TestCase):
     """Тесты для связей между моделями"""
 
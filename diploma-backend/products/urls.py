@@ -6,6 +6,8 @@ urlpatterns = [
     # Каталог и товары
     path('catalog/', views.ProductListView.as_view(), name='product-list'),
     path('catalog', views.ProductListView.as_view(), name='product-list_no_slash'),
+    path('catalog/export/', views.ProductExportView.as_view(), name='product-export'),
+    path('catalog/export', views.ProductExportView.as_view(), name='product-export_no_slash'),
     path('product/<int:id>/', views.ProductDetailView.as_view(), name='product-detail'),
     path('product/<int:id>', views.ProductDetailView.as_view(), name='product-detail_no_slash'),
     path('products/popular/', views.ProductPopularView.as_view(), name='product-popular'),
@@ -14,6 +16,8 @@ urlpatterns = [
     path('products/limited', views.ProductLimitedView.as_view(), name='product-limited_no_slash'),
     path('product/<int:id>/review/', views.ProductReviewView.as_view(), name='product-review'),
     path('product/<int:id>/review', views.ProductReviewView.as_view(), name='product-review_no_slash'),
+    path('product/<int:id>/reviews/', views.ProductReviewView.as_view(), name='product-reviews'),
+    path('product/<int:id>/reviews', views.ProductReviewView.as_view(), name='product-reviews_no_slash'),
 
     # Заказы теперь обрабатываются в orders/urls.py
 
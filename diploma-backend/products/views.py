@@ -1,13 +1,25 @@
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny, IsAdminUser
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404, render, redirect
-from django.db.models import Count
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
 from django.views.generic import TemplateView
 from .models import Product, Category, Tag, Review, Sale
+from .cache import cache_response, get_catalog_count, get_catalog_facets
+from .categories import get_category_tree
+from .exporter import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, export_products, render_lines
+from .facets import facet_counts, filter_by_facets
+from .importer import parse_moment
+from .pagination import InvalidCursor, keyset_page
+from .rankings import get_ranked_products
+from .search import search_products, tokenize
+from .tags import TAG_MATCH_ALL, filter_by_tags, parse_tag_ids
 from .serializers import (
     ProductShortSerializer, ProductFullSerializer,
     CategorySerializer, ReviewSerializer,
@@ -23,6 +35,29 @@ import datetime
 
 User = get_user_model()
 
+# Фильтры каталога, не относящиеся к характеристикам товара
+STANDARD_FILTERS = {
+    'filter[name]', 'filter[minPrice]', 'filter[maxPrice]',
+    'filter[freeDelivery]', 'filter[available]'
+}
+
+# Пространства имен кэша, от которых зависят ответы со списками товаров:
+# сами товары, скидки (salePrice), отзывы (reviews) и названия тегов
+PRODUCT_LIST_DEPENDENCIES = ('products', 'sales', 'reviews', 'tags')
+
+# Размер страницы отзывов по умолчанию и максимальный
+REVIEWS_PAGE_SIZE = 10
+REVIEWS_MAX_PAGE_SIZE = 50
+
+# Соответствие параметра sort полю сортировки каталога
+SORT_FIELDS = {
+    'date': 'created_at',
+    'price': 'price',
+    'name': 'title',
+    'rating': 'rating',
+    'reviews': 'reviews_count',
+}
+
 
 class ProductListView(generics.ListAPIView):
     """Список продуктов с фильтрацией, сортировкой и пагинацией"""
@@ -31,9 +66,13 @@ class ProductListView(generics.ListAPIView):
 
     def get_queryset(self):
         queryset = Product.objects.filter(is_active=True, available=True).prefetch_related(
-            'images', 'tags', 'specifications'
-        ).select_related('category').annotate(reviews_count=Count('reviews'))
+            'images', 'tags'
+        ).select_related('category')
+
+        return self.apply_filters(queryset).order_by(*self.get_ordering())
 
+    def apply_filters(self, queryset):
+        """Применить фильтры из параметров запроса"""
         # Фильтрация
         name = self.request.query_params.get('filter[name]', None)
         min_price = self.request.query_params.get('filter[minPrice]', None)
@@ -41,10 +80,12 @@ class ProductListView(generics.ListAPIView):
         free_delivery = self.request.query_params.get('filter[freeDelivery]', None)
         available = self.request.query_params.get('filter[available]', None)
         category = self.request.query_params.get('category', None)
-        tags = self.request.query_params.getlist('tags', None)
+        # Фронтенд передает теги как tags[], поддерживается и вариант без скобок
+        tags = self.request.query_params.getlist('tags') + self.request.query_params.getlist('tags[]')
+        tags_match = self.request.query_params.get('tagsMatch', TAG_MATCH_ALL)
 
         if name:
-            queryset = queryset.filter(title__icontains=name)
+            queryset = search_products(queryset, name)
         if min_price:
             try:
                 min_price = float(min_price)
@@ -68,77 +109,88 @@ class ProductListView(generics.ListAPIView):
             except (ValueError, TypeError):
                 pass
         if tags:
-            for tag_id in tags:
-                try:
-                    tag_id = int(tag_id)
-                    queryset = queryset.filter(tags__id=tag_id)
-                except (ValueError, TypeError):
-                    pass
+            queryset = filter_by_tags(queryset, parse_tag_ids(tags), tags_match)
 
         # Дополнительная фильтрация по характеристикам
+        facets = self.get_facet_filters()
+        if facets:
+            queryset = filter_by_facets(queryset, facets)
+
+        return queryset
+
+    def get_facet_filters(self):
+        """Фильтры по характеристикам: все filter[<имя>], кроме стандартных"""
         query_params = self.request.query_params
-        for param, value in query_params.items():
-            if param.startswith('filter[') and param not in [
-                'filter[name]', 'filter[minPrice]', 'filter[maxPrice]',
-                'filter[freeDelivery]', 'filter[available]'
-            ]:
-                spec_name = param[7:-1]
-                queryset = queryset.filter(specifications__name__iexact=spec_name,
-                                           specifications__value__icontains=value)
-
-        # Сортировка
+        return {
+            param[7:-1]: query_params.getlist(param)
+            for param in query_params.keys()
+            if param.startswith('filter[') and param.endswith(']') and param not in STANDARD_FILTERS
+        }
+
+    def get_facets(self):
+        """Счетчики значений характеристик для всей отфильтрованной выборки"""
+        return get_catalog_facets(
+            self.request.query_params,
+            lambda: facet_counts(self.apply_filters(Product.objects.filter(is_active=True, available=True)))
+        )
+
+    def wants_facets(self):
+        return self.request.query_params.get('facets') in ('1', 'true')
+
+    def is_relevance_sort(self):
+        """Сортировка по релевантности возможна только при поисковом запросе"""
+        return (self.request.query_params.get('sort') == 'relevance'
+                and bool(tokenize(self.request.query_params.get('filter[name]'))))
+
+    def get_sort(self):
+        """Поле сортировки и направление (True - по убыванию)"""
+        if self.is_relevance_sort():
+            return 'search_rank', True
         sort = self.request.query_params.get('sort', 'date')
         sort_type = self.request.query_params.get('sortType', 'dec')
+        order_field = SORT_FIELDS.get(sort, 'created_at')
+        return order_field, sort_type == 'dec'
 
-        order_field = {
-            'date': 'created_at',
-            'price': 'price',
-            'name': 'title',
-            'rating': 'rating',
-            'reviews': 'reviews__count'
-        }.get(sort, 'created_at')
+    def get_ordering(self):
+        order_field, descending = self.get_sort()
+        prefix = '-' if descending else ''
+        # id как tie-breaker делает порядок детерминированным между страницами
+        return f'{prefix}{order_field}', f'{prefix}id'
 
-        if sort == 'reviews':
-            queryset = queryset.annotate(reviews_count=Count('reviews'))
-            order_field = 'reviews_count'
+    def get_limit(self):
+        try:
+            return max(int(self.request.query_params.get('limit', 20)), 1)
+        except (ValueError, TypeError):
+            return 20
 
-        if sort_type == 'dec':
-            order_field = f'-{order_field}'
-        else:
-            order_field = order_field
+    def list(self, request, *args, **kwargs):
+        # Ранг релевантности не хранится в таблице, поэтому для него курсоры не поддерживаются
+        if 'cursor' in request.query_params and not self.is_relevance_sort():
+            return self.cursor_list(request)
 
-        queryset = queryset.order_by(order_field)
+        queryset = self.get_queryset()
 
-        # Пагинация
-        page = self.request.query_params.get('currentPage', 1)
-        limit = self.request.query_params.get('limit', 20)
+        page = request.query_params.get('currentPage', 1)
+        limit = self.get_limit()
         try:
             page = int(page)
-            limit = int(limit)
         except (ValueError, TypeError):
             page = 1
-            limit = 20
-
-        paginator = Paginator(queryset, limit)
-        page_obj = paginator.get_page(page)
 
-        return page_obj.object_list
-
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True, context={'request': request})
-
-        page = int(request.query_params.get('currentPage', 1))
-        limit = int(request.query_params.get('limit', 20))
-
-        total_count = Product.objects.filter(is_active=True, available=True).count()
+        total_count = self.get_total_count()
         last_page = (total_count + limit - 1) // limit
 
+        # Как Paginator.get_page: номер вне диапазона дает ближайшую существующую страницу,
+        # но без повторного COUNT(*) - используется закэшированное количество
+        page_number = min(max(page, 1), max(last_page, 1))
+        offset = (page_number - 1) * limit
+        serializer = self.get_serializer(queryset[offset:offset + limit], many=True, context={'request': request})
+
         # Вычисляем значения для отображения в пагинации
         start_item = (page - 1) * limit + 1
         end_item = min(page * limit, total_count) if total_count > 0 else 0
 
-        return Response({
+        data = {
             'items': serializer.data,
             'currentPage': page,
             'lastPage': last_page,
@@ -146,14 +198,51 @@ class ProductListView(generics.ListAPIView):
             'itemsPerPage': limit,
             'startItem': start_item,
             'endItem': end_item
-        })
+        }
+        if self.wants_facets():
+            data['facets'] = self.get_facets()
+        return Response(data)
+
+    def get_total_count(self):
+        """Количество товаров с учетом фильтров, кэшируется по набору фильтров"""
+        return get_catalog_count(
+            self.request.query_params,
+            lambda: self.apply_filters(Product.objects.filter(is_active=True, available=True)).count()
+        )
+
+    def cursor_list(self, request):
+        """
+        Keyset-пагинация: страница выбирается условием по (поле сортировки, id),
+        поэтому стоимость не зависит от глубины страницы и не требует COUNT(*)
+        """
+        order_field, descending = self.get_sort()
+        limit = self.get_limit()
+        queryset = self.get_queryset().order_by()
+
+        try:
+            items, next_cursor, prev_cursor = keyset_page(
+                queryset, order_field, descending, limit, request.query_params.get('cursor')
+            )
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(items, many=True, context={'request': request})
+        data = {
+            'items': serializer.data,
+            'nextCursor': next_cursor,
+            'prevCursor': prev_cursor,
+            'itemsPerPage': limit,
+        }
+        if self.wants_facets():
+            data['facets'] = self.get_facets()
+        return Response(data)
 
 
 class ProductDetailView(generics.RetrieveAPIView):
     """Детали продукта"""
     queryset = Product.objects.filter(is_active=True).prefetch_related(
         'images', 'tags', 'specifications'
-    ).select_related('category').annotate(reviews_count=Count('reviews'))
+    ).select_related('category')
     serializer_class = ProductFullSerializer
     permission_classes = [AllowAny]
     lookup_field = 'id'
@@ -166,26 +255,65 @@ class ProductPopularView(generics.ListAPIView):
     """Список популярных продуктов (по рейтингу)"""
     serializer_class = ProductShortSerializer
     permission_classes = [AllowAny]
-    queryset = Product.objects.filter(is_active=True, available=True).select_related('category').prefetch_related('images', 'tags').annotate(reviews_count=Count('reviews')).order_by('-rating')[:8]
+    ranking = 'popular'
+
+    def get_queryset(self):
+        # ID списка хранятся в products/rankings.py, товары загружаются одним запросом
+        return get_ranked_products(self.ranking)
 
     def get_serializer_context(self):
         return {'request': self.request}
 
+    @cache_response('popular', PRODUCT_LIST_DEPENDENCIES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class ProductLimitedView(generics.ListAPIView):
     """Список продуктов ограниченного тиража"""
     serializer_class = ProductShortSerializer
     permission_classes = [AllowAny]
-    queryset = Product.objects.filter(is_active=True, available=True, limited=True).select_related('category').prefetch_related('images', 'tags').annotate(reviews_count=Count('reviews'))[:16]
+    ranking = 'limited'
+
+    def get_queryset(self):
+        # ID списка хранятся в products/rankings.py, товары загружаются одним запросом
+        return get_ranked_products(self.ranking)
 
     def get_serializer_context(self):
         return {'request': self.request}
 
+    @cache_response('limited', PRODUCT_LIST_DEPENDENCIES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class ProductReviewView(APIView):
-    """Создание отзыва к продукту"""
+    """Отзывы о продукте: постраничный список и создание"""
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def get(self, request, id):
+        """Отзывы от новых к старым с keyset-пагинацией по (date, id)"""
+        get_object_or_404(Product.objects.only('id'), id=id)
+        try:
+            limit = min(max(int(request.query_params.get('limit', REVIEWS_PAGE_SIZE)), 1), REVIEWS_MAX_PAGE_SIZE)
+        except (ValueError, TypeError):
+            limit = REVIEWS_PAGE_SIZE
+
+        queryset = Review.objects.filter(product_id=id).only('id', 'author', 'email', 'text', 'rate', 'date')
+        try:
+            items, next_cursor, prev_cursor = keyset_page(
+                queryset, 'date', True, limit, request.query_params.get('cursor')
+            )
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'items': ReviewSerializer(items, many=True).data,
+            'nextCursor': next_cursor,
+            'prevCursor': prev_cursor,
+            'itemsPerPage': limit,
+        })
+
     def post(self, request, id):
         product = get_object_or_404(Product, id=id)
         
@@ -200,20 +328,56 @@ class ProductReviewView(APIView):
         
         serializer = ReviewSerializer(data=data)
         if serializer.is_valid():
-            # Сохраняем отзыв
-            review = serializer.save(product=product)
-            # Возвращаем все отзывы для этого продукта, как указано в swagger
-            all_reviews = Review.objects.filter(product=product).only('author', 'email', 'text', 'rate', 'date', 'product_id')
-            reviews_serializer = ReviewSerializer(all_reviews, many=True)
-            return Response(reviews_serializer.data)
+            # Сохраняем отзыв; рейтинг товара обновляется в той же транзакции (products/signals.py)
+            with transaction.atomic():
+                review = serializer.save(product=product)
+            # Возвращаем только созданный отзыв и новые счетчики, без списка всех отзывов
+            product.refresh_from_db(fields=['reviews_count', 'rating'])
+            return Response({
+                'review': ReviewSerializer(review).data,
+                'reviewsCount': product.reviews_count,
+                'rating': product.rating,
+            }, status=status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ProductExportView(APIView):
+    """
+    Потоковая выгрузка каталога для партнеров (JSONL или CSV).
+    Ответ формируется по мере чтения из базы, память не зависит от размера каталога.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        # Параметр format занят DRF под выбор рендерера, поэтому формат файла передается в type
+        fmt = request.query_params.get('type', 'jsonl')
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": "Unsupported format"}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = parse_moment(since)
+            except ValueError:
+                return Response({"error": "Invalid since"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Момент начала выгрузки - значение since для следующей инкрементальной выгрузки
+        started = timezone.now()
+        response = StreamingHttpResponse(
+            render_lines(export_products(since or None, request=request), fmt),
+            content_type=EXPORT_CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="catalog.{fmt}"'
+        response['X-Export-Started'] = started.isoformat()
+        return response
+
+
 class SaleListView(APIView):
     """Список товаров со скидками"""
     permission_classes = [AllowAny]
 
+    @cache_response('sales', ('sales', 'products'))
     def get(self, request):
         current_date = datetime.datetime.now()
         queryset = Sale.objects.filter(
@@ -251,6 +415,13 @@ class CategoryListView(generics.ListAPIView):
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def list(self, request, *args, **kwargs):
+        # Дерево строится одним запросом и отдается из кэша до изменения категорий
+        tree, etag = get_category_tree(request)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(tree, headers={'ETag': etag})
+
 
 class TagListView(generics.ListAPIView):
     """Список тегов"""
@@ -268,16 +439,28 @@ class TagListView(generics.ListAPIView):
                 return Tag.objects.all().only('id', 'name')
         return Tag.objects.all().only('id', 'name')
 
+    @cache_response('tags', ('tags', 'products'))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class BannerListView(generics.ListAPIView):
     """Список товаров для баннера (топ 10 по рейтингу)"""
     serializer_class = ProductShortSerializer
     permission_classes = [AllowAny]
-    queryset = Product.objects.filter(is_active=True, available=True).select_related('category').prefetch_related('images', 'tags').annotate(reviews_count=Count('reviews')).order_by('-rating')[:10]
+    ranking = 'banners'
+
+    def get_queryset(self):
+        # ID списка хранятся в products/rankings.py, товары загружаются одним запросом
+        return get_ranked_products(self.ranking)
 
     def get_serializer_context(self):
         return {'request': self.request}
 
+    @cache_response('banners', PRODUCT_LIST_DEPENDENCIES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 
 
@@ -1,7 +1,10 @@
 var mix = {
     methods: {
         submitBasket () {
-            this.postData('/api/orders', Object.values(this.basket))
+            // Один ключ на страницу: повторное нажатие или повтор запроса вернет тот же заказ
+            this.postData('/api/orders', Object.values(this.basket), {
+                'Idempotency-Key': this.checkoutKey
+            })
                 .then(({data: { orderId }}) => {
                     location.assign(`/orders/${orderId}/`)
                 }).catch(() => {
@@ -11,6 +14,8 @@ var mix = {
     },
     mounted() {},
     data() {
-        return {}
+        return {
+            checkoutKey: `${Date.now()}-${Math.random().toString(36).slice(2)}`
+        }
     }
 }
\ No newline at end of file
@@ -1,12 +1,16 @@
 var mix = {
 	methods: {
-		getHistoryOrder() {
-			this.getData("/api/orders")
+		getHistoryOrder(cursor = null) {
+			// Параметр limit включает постраничный ответ {items, nextCursor}
+			this.getData("/api/orders", cursor ? { cursor, limit: 20 } : { limit: 20 })
 				.then(data => {
-					console.log(data)
-					this.orders = data
+					// История заказов постраничная: следующая страница дописывается в конец
+					this.orders = cursor ? [...this.orders, ...data.items] : data.items
+					this.nextCursor = data.nextCursor
 				}).catch(() => {
-				this.orders = []
+				if (!cursor) {
+					this.orders = []
+				}
 				console.warn('Ошибка при получении списка заказов')
 			})
 		}
@@ -17,6 +21,7 @@ var mix = {
 	data() {
 		return {
 			orders: [],
+			nextCursor: null,
 		}
 	}
-}
\ No newline at end of file
+}
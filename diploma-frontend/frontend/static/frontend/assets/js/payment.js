@@ -17,7 +17,15 @@ var mix = {
 				year: this.year,
 				month: this.month,
 				code: this.code
-			}).then(() => {
+			}).then(({ status }) => {
+				// 202 - платеж в очереди, результат записывает воркер
+				return status === 202 ? this.waitPayment(orderId) : { payment: 'completed' }
+			}).then(({ payment, error }) => {
+				if (payment !== 'completed') {
+					alert(error || 'Ошибка при оплате')
+					location.assign(`/orders/detail/${orderId}/`)
+					return
+				}
 				alert('Успешная оплата')
 				this.number1 = ''
 				this.name = ''
@@ -28,6 +36,30 @@ var mix = {
 			}).catch(() => {
 			 	console.warn('Ошибка при оплате')
 			})
+		},
+		waitPayment(orderId) {
+			// Сервер присылает статус сам (SSE), опрос - запасной вариант без EventSource
+			if (typeof EventSource === 'undefined') return this.pollPayment(orderId)
+			return new Promise((resolve) => {
+				const source = new EventSource(`/api/payment-status/${orderId}/watch/`)
+				source.onmessage = ({ data }) => {
+					const progress = JSON.parse(data)
+					if (progress.payment === 'pending') return
+					source.close()
+					resolve(progress)
+				}
+				source.onerror = () => {
+					// EventSource переподключается сам; если соединение закрыто окончательно - опрашиваем
+					if (source.readyState === EventSource.CLOSED) resolve(this.pollPayment(orderId))
+				}
+			})
+		},
+		pollPayment(orderId) {
+			return this.getData(`/api/payment-status/${orderId}/`).then((data) => {
+				if (data.payment !== 'pending') return data
+				return new Promise((resolve) => setTimeout(resolve, 1000))
+					.then(() => this.pollPayment(orderId))
+			})
 		}
 	},
 	data() {
@@ -33,7 +33,9 @@ var mix = {
                 text: this.review.text,
                 rate: this.review.rate
             }).then(({data}) => {
-                this.product.reviews = data
+                this.product.reviews = [data.review, ...(this.product.reviews || [])]
+                this.product.reviewsCount = data.reviewsCount
+                this.product.rating = data.rating
                 alert('Отзыв опубликован')
                 this.review.author = ''
                 this.review.email = ''